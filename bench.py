@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+# spiderfarm/bench.py
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import scrapy
+from scrapy import signals
+from scrapy.crawler import CrawlerProcess
+from scrapy.utils.project import get_project_settings
+from tabulate import tabulate
+
+from spiderfarm.spiders.linkspider import LinkSpider
+from spiderfarm.spiders.schemaspider import SchemaSpider
+from spiderfarm.spiders.xmlspider import XMLSpider
+from spiderfarm.spiders.feedspider import FeedSpider
+from spiderfarm.synthetic import SyntheticSite, serve
+
+SPIDER_MAP = {
+    'link': LinkSpider,
+    'schema': SchemaSpider,
+    'xml': XMLSpider,
+    'feed': FeedSpider,
+}
+
+METRICS = ['pages', 'items', 'elapsed_s', 'pages_per_s', 'cpu_ms_per_page', 'peak_rss_mb', 'first_item_s']
+
+# throughput settings for a local server: no politeness delays, fixed concurrency
+BENCH_SETTINGS = {
+    'LOG_LEVEL': 'WARNING',
+    'DOWNLOAD_DELAY': 0,
+    'CONCURRENT_REQUESTS': 16,
+    'CONCURRENT_REQUESTS_PER_DOMAIN': 16,
+    'ADAPTIVE_CONCURRENCY_ENABLED': False,
+    'AUTOTHROTTLE_ENABLED': False,
+    'RETRY_ENABLED': False,
+    'HTTPCACHE_ENABLED': False,
+    'DEPTH_LIMIT': 0,
+    'FETCH_MODE': 'hybrid',
+    'AUTO_SAVE': True,
+    'AUTO_VIEW': False,
+    'TELNETCONSOLE_ENABLED': False,
+    # the synthetic site listens on a random port and allowed_domains can't carry one;
+    # LinkSpider and SchemaSpider still scope links through their URL filter
+    'DOWNLOADER_MIDDLEWARES': {'scrapy.downloadermiddlewares.offsite.OffsiteMiddleware': None},
+}
+
+
+def seed_url(spider_key, base_url, gzip_feed):
+    if spider_key == 'xml':
+        return f"{base_url}/sitemap.xml"
+    if spider_key == 'feed':
+        return f"{base_url}/feed.xml.gz" if gzip_feed else f"{base_url}/feed.xml"
+    return f"{base_url}/p/0"
+
+
+def run_spider(task):
+    """
+    Run one spider in this (spawned) process and measure it.
+    CPU time and peak RSS come from getrusage for this process only; the synthetic server
+    runs in the parent, so it doesn't count against the spider.
+    """
+    spider_key, start_url, overrides, output_dir = task
+    settings = get_project_settings()
+    for name, value in BENCH_SETTINGS.items():
+        if isinstance(value, dict):
+            settings.set(name, {**settings.getdict(name), **value})
+        else:
+            settings.set(name, value)
+    for name, value in overrides.items():
+        settings.set(name, value)
+    settings.set('OUTPUT_DIR', output_dir)
+    settings.set('OUTPUT_FILENAME', f"bench_{spider_key}")
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(SPIDER_MAP[spider_key])
+    marks = {}
+
+    def spider_opened(spider):
+        marks['opened'] = time.perf_counter()
+
+    def item_scraped(item, spider):
+        marks.setdefault('first_item', time.perf_counter())
+
+    crawler.signals.connect(spider_opened, signal=signals.spider_opened)
+    crawler.signals.connect(item_scraped, signal=signals.item_scraped)
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.perf_counter()
+    process.crawl(crawler, start_urls=[start_url], crawl_enabled=True, include=[], exclude=[])
+    process.start()
+    elapsed = time.perf_counter() - started
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    stats = crawler.stats.get_stats()
+    pages = stats.get('response_received_count', 0)
+    items = stats.get('item_scraped_count', 0)
+    cpu = (usage.ru_utime - usage_before.ru_utime) + (usage.ru_stime - usage_before.ru_stime)
+    # the feed is a single response; per-item cost is the meaningful unit there
+    per_unit = items if spider_key == 'feed' else pages
+    return {
+        'pages': pages,
+        'items': items,
+        'elapsed_s': round(elapsed, 3),
+        'pages_per_s': round(pages / elapsed, 2) if elapsed else 0,
+        'cpu_ms_per_page': round(cpu * 1000 / per_unit, 4) if per_unit else None,
+        'peak_rss_mb': round(usage.ru_maxrss / 1024, 1), # ru_maxrss is in KB on Linux
+        'first_item_s': round(marks['first_item'] - marks['opened'], 3) if 'first_item' in marks and 'opened' in marks else None,
+        'finish_reason': stats.get('finish_reason'),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, title):
+    rows = [[name] + [metrics.get(m) for m in METRICS] for name, metrics in results.items()]
+    print(f"\n{title}")
+    print(tabulate(rows, headers=['spider'] + METRICS, tablefmt='simple_grid'))
+
+
+def compare(previous_path, results):
+    """Print the relative change of each metric against a previous results file."""
+    with open(previous_path, encoding='utf-8') as f:
+        previous = json.load(f)['results']
+    rows = []
+    for name, metrics in results.items():
+        old = previous.get(name)
+        if not old:
+            continue
+        row = [name]
+        for m in METRICS:
+            a, b = old.get(m), metrics.get(m)
+            row.append(f"{(b - a) / a * 100:+.1f}%" if a and b is not None else '-')
+        rows.append(row)
+    print(f"\nChange vs {previous_path}")
+    print(tabulate(rows, headers=['spider'] + METRICS, tablefmt='simple_grid'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline spiderfarm benchmarks against a synthetic local site")
+    parser.add_argument('--spiders', default='link,schema,xml,feed',
+                        help="Comma-separated spiders to run (default: link,schema,xml,feed)")
+    parser.add_argument('--pages', type=int, default=1000, help="Number of product pages (default: 1000)")
+    parser.add_argument('--fanout', type=int, default=20, help="Links from each page into the site (default: 20)")
+    parser.add_argument('--nav', type=int, default=40, help="Nav/footer links repeated on every page (default: 40)")
+    parser.add_argument('--page-kb', type=int, default=20, help="Filler text per page in KB (default: 20)")
+    parser.add_argument('--shard-size', type=int, default=1000, help="URLs per sitemap shard (default: 1000)")
+    parser.add_argument('--plain-sitemaps', action='store_true', help="Serve sitemap shards uncompressed (default: gzipped)")
+    parser.add_argument('--feed-items', type=int, default=50_000,
+                        help="Items in the Merchant feed (default: 50000, ~4M items is about 3 GB)")
+    parser.add_argument('--gzip-feed', action='store_true', help="Fetch the gzipped feed instead of the plain one")
+    parser.add_argument('-s', '--set', action='append', default=[], metavar='NAME=VALUE',
+                        help="Override a Scrapy setting for the runs (repeatable), e.g. -s SEEN_STORE=bloom")
+    parser.add_argument('--out', default='bench-results', help="Directory for the JSON results (default: bench-results)")
+    parser.add_argument('--compare', default=None, help="Previous results JSON to compare against")
+    args = parser.parse_args()
+
+    spider_keys = [s.strip() for s in args.spiders.split(',') if s.strip()]
+    unknown = [s for s in spider_keys if s not in SPIDER_MAP]
+    if unknown:
+        raise ValueError(f"Unknown spiders: {', '.join(unknown)}. Use any of: {', '.join(SPIDER_MAP)}")
+    overrides = {}
+    for item in args.set:
+        name, sep, value = item.partition('=')
+        if not sep:
+            raise ValueError(f"Invalid setting override: {item}. Use NAME=VALUE")
+        overrides[name.strip()] = value.strip()
+
+    site = SyntheticSite(
+        pages=args.pages,
+        fanout=args.fanout,
+        nav=args.nav,
+        page_kb=args.page_kb,
+        shard_size=args.shard_size,
+        gzip_sitemaps=not args.plain_sitemaps,
+        feed_items=args.feed_items,
+    )
+    server = serve(site)
+    print(f"Synthetic site at {site.base_url} ({site.pages} pages, feed of {site.feed_items} items)")
+    output_dir = tempfile.mkdtemp(prefix='spiderfarm_bench_')
+    results = {}
+    # one fresh process per spider: clean reactor, and RSS/CPU figures that belong to that spider alone
+    context = multiprocessing.get_context('spawn')
+    try:
+        for key in spider_keys:
+            print(f"Running {SPIDER_MAP[key].__name__}...")
+            with context.Pool(processes=1, maxtasksperchild=1) as pool:
+                results[key] = pool.apply(run_spider, ((key, seed_url(key, site.base_url, args.gzip_feed), overrides, output_dir),))
+    finally:
+        server.shutdown()
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'scrapy': scrapy.__version__,
+        'site': site.config(),
+        'settings': overrides,
+        'results': results,
+    }
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_path = out_dir / f"bench_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json"
+    out_path.write_text(json.dumps(report, indent=2), encoding='utf-8')
+    print_results(results, f"Results saved to {out_path}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,14 @@
 # -*- coding: utf-8 -*-
 # spiderfarm/helpers.py
-import csv
 import sys
 import re
-import pydoc
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urlparse
 from pathlib import Path
 import os
-import pydoc
+import shutil
 from datetime import datetime
-from tabulate import tabulate
-from scrapy_playwright.page import PageMethod
+from spiderfarm.viewer import CsvRowSource, TableViewer
+from spiderfarm.canonical import DEFAULT_CANONICALIZER
 
 NON_HTML_EXTENSIONS = (
         '.jpg', '.jpeg', '.png', '.gif', '.svg', '.webp', '.pdf', '.doc', 
@@ -41,26 +39,35 @@ info_message = ("\nWelcome to the Link Spider by JDT using scrapy!\n"
 # URL validation
 def validate_and_normalize_url(url):
     """
-    Validate and normalize URLs to reduce duplicates.
+    Validate and canonicalize a URL with the default rules (see spiderfarm/canonical.py).
+    Returns None for anything that isn't an http(s) URL; crawls use their crawler's UrlCanonicalizer.
     """
-    if not url:
-        return None
-    parsed = urlparse(url)
-    if parsed.scheme not in ('http', 'https') or not parsed.netloc:
-        return None
-    return f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
+    return DEFAULT_CANONICALIZER.canonicalize(url)
 
 # playwright
-def playwright_meta(url):
+def playwright_meta():
+    """
+    Request meta for a playwright render.
+    The page is kept open for the callback and released by PageLifecycleSpiderMiddleware
+    (or the spider errback), which closes it or returns it to the page pool.
+    """
     return {
         "playwright": True,
         "playwright_include_page": True,
-        "playwright_page_methods": [
-            PageMethod("goto", url, wait_until="domcontentloaded", timeout=60000)
-        ],
+        "playwright_page_goto_kwargs": {"wait_until": "domcontentloaded", "timeout": 60000},
         "playwright_context": "default",
     }
 
+def fetch_meta(spider):
+    """
+    Request meta for the configured FETCH_MODE.
+    'playwright' renders every page; 'hybrid' starts with a plain HTTP fetch and lets
+    HybridFetchMiddleware escalate to playwright when the raw HTML looks incomplete.
+    """
+    if spider.settings.get('FETCH_MODE', 'playwright') == 'hybrid':
+        return {}
+    return playwright_meta()
+
 # xpath conversion
 def get_container_xpath(obj):
     """
@@ -94,7 +101,7 @@ def sanitize_filename(name):
     """
     return re.sub(r'[<>:"/\\|?*]', '', name)
 
-def generate_url_filename(seed_url=None, spider_name=None):
+def generate_url_filename(seed_url=None, spider_name=None, extension='.csv'):
     """
     Generate a default filename referencing the spider used to crawl and the time/date stamp of the crawl.
     """
@@ -103,8 +110,19 @@ def generate_url_filename(seed_url=None, spider_name=None):
     if seed_url:
         parsed = urlparse(seed_url)
         domain = parsed.netloc.replace('www.', '').replace('.', '_')
-        return f"{spider}_{domain}_{timestamp}.csv"
-    return f"{spider}_{timestamp}.csv"
+        return f"{spider}_{domain}_{timestamp}{extension}"
+    return f"{spider}_{timestamp}{extension}"
+
+def resolve_output_filename(output_filename=None, seed_url=None, spider_name=None, extension='.csv'):
+    """
+    Sanitize a user supplied filename and force the extension, falling back to the default filename.
+    """
+    if output_filename:
+        base, _ = os.path.splitext(output_filename.strip())
+        sanitized_name = sanitize_filename(base)
+        if sanitized_name:
+            return f"{sanitized_name}{extension}"
+    return generate_url_filename(seed_url, spider_name, extension)
 
 def filename_input(seed_url=None, spider_name=None):
     """
@@ -123,68 +141,68 @@ def filename_input(seed_url=None, spider_name=None):
         return default_file_name
 
 # data reviews
-def save_csv(table_data, headers, auto_save=False, output_filename=None, seed_url=None, spider_name=None):
+def save_csv(spool_path, row_count, auto_save=False, output_filename=None, seed_url=None, spider_name=None):
     """
-    Save the table data to a CSV file.
+    Move the spooled CSV data into its final location.
     - If output_filename is provided: sanitize it and force .csv
     - If auto_save is True: use default filename
     - Else: prompt the user
     """
-    if output_filename:
-        base, _ = os.path.splitext(output_filename.strip())
-        sanitized_name = sanitize_filename(base)
-        file_name = f"{sanitized_name}.csv" if sanitized_name else generate_url_filename(seed_url, spider_name)
-    elif auto_save:
-        file_name = generate_url_filename(seed_url, spider_name)
+    if output_filename or auto_save:
+        file_name = resolve_output_filename(output_filename, seed_url, spider_name)
     else:
         file_name = filename_input(seed_url, spider_name)
     file_path = Path.home() / file_name
     try:
-        with open(file_path, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(headers)
-            writer.writerows(table_data)
-        print(f"\nData saved to: {file_path} ({len(table_data)} rows)\n")
+        shutil.move(spool_path, file_path)
+        print(f"\nData saved to: {file_path} ({row_count} rows)\n")
     except Exception as e:
-        print(f"\nFailed to save file: {e}\n")
+        print(f"\nFailed to save file: {e}\nPartial results remain at: {spool_path}\n")
 
-def display_table(table_data, headers, auto_view=False):
+def display_table(file_path, row_count=None, auto_view=False):
     """
-    Displays a table using the tabulate library.
+    Displays a spooled CSV file with the lazy table viewer.
+    Rows are read from disk a page at a time, so large results show up immediately.
     Args:
-        table_data (list): The data to display in the table.
-        headers (list): The headers for the table.
+        file_path (str): The CSV file to display (header row first).
+        row_count (int): Number of data rows, when known.
     """
-    if auto_view is True:
-        print(tabulate(table_data, headers, tablefmt="simple_grid"))
-    else:
-        input("Report ready for viewing. Press ENTER to display results and 'Q' to exit output when done...")
-        pydoc.pager(tabulate(table_data, headers=headers, tablefmt="simple_grid"))
+    source = CsvRowSource(file_path)
+    try:
+        viewer = TableViewer(source, row_count=row_count)
+        if auto_view is True:
+            viewer.stream()
+        else:
+            input("Report ready for viewing. Press ENTER to display results and 'Q' to exit output when done...")
+            viewer.interact()
+    finally:
+        source.close()
 
 # main data handling
 def data_handling_options(
-        table_data, 
-        headers, 
-        auto_view=False, 
-        auto_save=False, 
-        output_filename=None, 
+        file_path,
+        headers,
+        row_count,
+        auto_view=False,
+        auto_save=False,
+        output_filename=None,
         seed_url=None,
         spider_name=None
         ):
-    if not table_data or not headers:
+    """
+    Final output handling for the rows streamed to disk by the pipeline.
+    In auto save mode the file is already in place; otherwise file_path is a CSV spool
+    that is either moved to its final location or displayed and removed.
+    """
+    if not row_count or not headers:
         print("No table data or headers provided.")
         return
     if auto_save:
-        save_csv(
-            table_data, 
-            headers, 
-            auto_save=True, 
-            output_filename=output_filename,
-            seed_url=seed_url,
-            spider_name=spider_name)
+        print(f"\nData saved to: {file_path} ({row_count} rows)\n")
         return
     if auto_view:
-        display_table(table_data, headers, auto_view=True)
+        display_table(file_path, row_count, auto_view=True)
+        os.remove(file_path)
         return
     print("\nHow would you like to view the report?\n"
             "1. CSV\n"
@@ -193,15 +211,17 @@ def data_handling_options(
     if report_view == '1':
         # save to csv
         save_csv(
-            table_data,
-            headers,
+            file_path,
+            row_count,
             auto_save=False,
             output_filename=output_filename,
             seed_url=seed_url,
             spider_name=spider_name)
     elif report_view == '2':
         # display table
-        display_table(table_data, headers, auto_view=False)
+        display_table(file_path, row_count, auto_view=False)
+        os.remove(file_path)
     else:
         print("Invalid input, please select one of the indicated options.")
+        print(f"Results remain at: {file_path}")
         sys.exit(1)
\ No newline at end of file
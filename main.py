@@ -1,27 +1,24 @@
 # -*- coding: utf-8 -*-
 # spiderfarm/main.py
 import argparse
+import os
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
 from spiderfarm.spiders.linkspider import LinkSpider
 from spiderfarm.spiders.schemaspider import SchemaSpider
 from spiderfarm.spiders.xmlspider import XMLSpider
 from spiderfarm.spiders.feedspider import FeedSpider
+from spiderfarm import distributed, sharding, sinks, sitemapseeds
 import helpers
 
 def init_menu(args, spider_class, include, exclude):
     settings = get_project_settings()
-    # pass default link tag+attr values for link crawling process
-    tag = args.tag
-    attr = args.attr
     # content tag target class or ID, format must be 'div.<class>' for classes or 'div#<ID>' for IDs, <div> or <span> tags
     ctag = args.ctag
     depth = args.depth
     log_level = args.log.upper()
     include = args.include
     exclude = args.exclude
-    auto = args.auto
-    output = args.output
     crawl_enabled = args.crawl
     print(helpers.info_message)
     url_input = input("Enter the starting URL: ").strip()
@@ -78,13 +75,37 @@ def init_menu(args, spider_class, include, exclude):
           f"Crawl Depth: {depth}\n"
           f"Log Level: {log_level}\n")
     input("Press Enter to start the crawl with the above settings...")
-    process_crawl(settings, spider_class, url_input, tag, attr, ctag, include, exclude, auto=auto, output=output, crawl_enabled=crawl_enabled)
+    process_crawl(settings, spider_class, url_input, args, spider_kwargs(args, include, exclude, ctag=ctag))
 
-def process_crawl(settings, spider_class, start_urls, tag, attr, ctag, include, exclude, auto=None, output=None, crawl_enabled=False):
+def spider_kwargs(args, include, exclude, ctag=None):
     """
-    Process the crawl with the given settings and spider parameters.
+    Spider arguments from the CLI options (ctag overrides --ctag, e.g. from the interactive menu).
     """
-    print("Executing crawl...")
+    return {
+        'tag': args.tag,
+        'attr': args.attr,
+        'ctag': ctag or args.ctag,
+        'include': include,
+        'exclude': exclude,
+        'crawl_enabled': args.crawl,
+    }
+
+def apply_crawl_settings(settings, args):
+    """
+    Apply the CLI output/fetch/storage options (the parsed argparse namespace) to the crawler settings.
+    """
+    auto = args.auto
+    output = args.output
+    output_format = args.format
+    fetch = args.fetch
+    seen_store = args.seen_store
+    cache = args.cache
+    resume = args.resume
+    metrics = args.metrics
+    link_graph = args.link_graph
+    near_duplicates = args.near_duplicates
+    seed_sitemaps = args.seed_sitemaps
+    lastmod_since = args.lastmod_since
     # update settings
     if auto == 'save':
         settings.set('AUTO_SAVE',True)
@@ -97,17 +118,42 @@ def process_crawl(settings, spider_class, start_urls, tag, attr, ctag, include,
         settings.set('AUTO_VIEW',False)
     if output:
         settings.set('OUTPUT_FILENAME', output)
+    if output_format:
+        settings.set('OUTPUT_FORMAT', output_format)
+    if fetch:
+        settings.set('FETCH_MODE', fetch)
+    if seen_store:
+        settings.set('SEEN_STORE', seen_store)
+    if cache:
+        settings.set('HTTPCACHE_ENABLED', True)
+    if resume:
+        # job directory holds the request queue, seen-stores, spider state and partial output;
+        # the SQLite disk queue commits every push/pop so a crash loses at most in-flight requests
+        os.makedirs(resume, exist_ok=True)
+        settings.set('JOBDIR', resume)
+        settings.set('SCHEDULER_DISK_QUEUE', 'scrapy.squeues.PickleLifoSQLiteQueue')
+        settings.set('SEEN_STORE', 'sqlite')
+        settings.set('SEEN_STORE_DIR', resume)
+    if metrics:
+        settings.set('METRICS_ENABLED', True)
+        settings.set('METRICS_FILE', metrics)
+    if link_graph:
+        settings.set('LINK_GRAPH_DIR', link_graph)
+    if near_duplicates:
+        settings.set('NEAR_DUPLICATE_ACTION', near_duplicates)
+    if seed_sitemaps:
+        settings.set('SITEMAP_SEEDS_ENABLED', True)
+    if lastmod_since:
+        settings.set('SITEMAP_LASTMOD_SINCE', lastmod_since)
+
+def process_crawl(settings, spider_class, start_urls, args, crawl_kwargs):
+    """
+    Process the crawl with the given settings, CLI options and spider arguments (see spider_kwargs).
+    """
+    print("Executing crawl...")
+    apply_crawl_settings(settings, args)
     process = CrawlerProcess(settings)
-    process.crawl(
-        spider_class,
-        start_urls=start_urls,
-        tag=tag,
-        attr=attr,
-        ctag=ctag,
-        include=include,
-        exclude=exclude,
-        crawl_enabled=crawl_enabled
-    )
+    process.crawl(spider_class, start_urls=start_urls, **crawl_kwargs)
     process.start()
 
 def main():
@@ -137,6 +183,45 @@ def main():
     parser.add_argument('--output', 
                         default=None, 
                         help='Optional filename (without extension) for CSV output')
+    parser.add_argument('--format',
+                        choices=list(sinks.SINKS),
+                        default=None,
+                        help="Output format for '--auto save': csv, jsonl, sqlite (indexed on url/source/gtin) or parquet (needs pyarrow) (default: csv)")
+    parser.add_argument('--fetch',
+                        choices=['playwright', 'hybrid'],
+                        default=None,
+                        help="Fetch mode: 'playwright' renders every page, 'hybrid' uses plain HTTP and escalates to playwright only when needed (default: playwright)")
+    parser.add_argument('--seen-store',
+                        choices=['fingerprint', 'bloom', 'sqlite'],
+                        default=None,
+                        help="URL dedup store: 'fingerprint' (in-memory hashes), 'bloom' (fixed-size Bloom filter) or 'sqlite' (on disk) (default: fingerprint)")
+    parser.add_argument('--cache', action='store_true',
+                        help="Enable the persistent HTTP cache; recrawls send conditional requests and serve unchanged pages (304) from the cache")
+    parser.add_argument('--sites',
+                        default=None,
+                        help="Multi-site mode: file with one seed URL/domain per line, or a comma-separated list; each domain is crawled in its own worker process and the outputs are merged")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of worker processes for --sites or --distributed (default: CPU count)")
+    parser.add_argument('--distributed',
+                        default=None, metavar='BACKEND',
+                        help="Distributed mode: crawl --url with --workers nodes sharing one queue and seen-set in BACKEND (redis://host:port/db, or sqlite:///path/to/frontier.db on one machine); run the same command on other machines to add nodes, the last node to finish merges the output")
+    parser.add_argument('--metrics',
+                        default=None, metavar='FILE',
+                        help="Record per-stage timings (download, render, callbacks, extraction, output) in the crawl stats and write them to FILE periodically (.prom for Prometheus text, otherwise JSON)")
+    parser.add_argument('--link-graph',
+                        default=None, metavar='DIR',
+                        help="LinkSpider: keep the internal link graph and write edges.csv, nodes.csv (click depth, inlinks, outlinks), orphans.csv and deep_pages.csv to DIR")
+    parser.add_argument('--near-duplicates',
+                        default=None, choices=['mark', 'deprioritize', 'skip'],
+                        help="Fingerprint page text (SimHash) and add simhash/duplicate_of columns; 'deprioritize' or 'skip' also lowers or drops links to URL patterns that keep producing near-duplicates")
+    parser.add_argument('--seed-sitemaps', action='store_true',
+                        help="LinkSpider/SchemaSpider: also queue every in-scope URL from the site's sitemaps (robots.txt, else common sitemap paths) as a seed")
+    parser.add_argument('--lastmod-since',
+                        default=None, metavar='YYYY-MM-DD',
+                        help="With --seed-sitemaps: skip sitemap entries last modified before this date")
+    parser.add_argument('--resume',
+                        default=None, metavar='DIR',
+                        help="Make the crawl resumable: queue, seen URLs and partial output are checkpointed to DIR; rerun with the same DIR to continue after a stop or crash")
     args = parser.parse_args()
     SPIDER_MAP = {
         'link': LinkSpider,
@@ -144,6 +229,25 @@ def main():
         'xml': XMLSpider,
         'feed': FeedSpider,
     }
+    if args.lastmod_since:
+        try:
+            sitemapseeds.parse_since(args.lastmod_since)
+        except ValueError:
+            print(f"Invalid --lastmod-since date: {args.lastmod_since} - please use YYYY-MM-DD.")
+            return
+    if args.distributed:
+        if args.distributed.startswith(('redis://', 'rediss://', 'unix://')) and distributed.redis is None:
+            print("The redis backend needs the redis package - install it with 'pip install redis'.")
+            return
+        if args.resume or args.sites:
+            print("--distributed can't be combined with --resume or --sites - rerun with the same backend to continue a distributed crawl.")
+            return
+    if args.format == 'parquet' and args.resume:
+        print("--format parquet can't be combined with --resume: the parquet footer is only written when the crawl finishes, so an interrupted file can't be resumed. Use csv, jsonl or sqlite.")
+        return
+    if args.format == 'parquet' and sinks.pq is None:
+        print("The parquet output format needs pyarrow - install it with 'pip install pyarrow'.")
+        return
     spider_class = SPIDER_MAP[args.spider]
     print(f"Deploying {spider_class}...")
     include = [s.strip().lower() for s in args.include.split(',')] if args.include else []
@@ -162,26 +266,29 @@ def main():
         settings.set('LOG_ENABLED', False)
     else:
         raise ValueError(f"Invalid log level: {args.log}. Use NONE, DEBUG, INFO, WARNING, ERROR, or CRITICAL.")
-    if args.url is None:
+    if args.sites:
+        sites = sharding.parse_sites(args.sites)
+        if not sites:
+            print("No valid sites - please provide seed URLs or domains.")
+            return
+        apply_crawl_settings(settings, args)
+        sharding.crawl_sites(settings, spider_class, sites, spider_kwargs(args, include, exclude), workers=args.workers)
+    elif args.distributed:
+        start_urls = [u.strip() for u in (args.url or '').split(',') if helpers.validate_and_normalize_url(u.strip())]
+        if not start_urls:
+            print("Invalid URL - please provide --url with a valid URL starting with http:// or https://")
+            return
+        apply_crawl_settings(settings, args)
+        settings.set('DISTRIBUTED_BACKEND', args.distributed)
+        distributed.crawl_distributed(settings, spider_class, start_urls, spider_kwargs(args, include, exclude), workers=args.workers)
+    elif args.url is None:
         init_menu(args, spider_class, include, exclude)
     else:
         start_urls = [u.strip() for u in args.url.split(',') if helpers.validate_and_normalize_url(u.strip())]
         if not start_urls:
             print("Invalid URL - please enter a valid URL starting with http:// or https://")
             return
-        process_crawl(
-            settings, 
-            spider_class, 
-            start_urls, 
-            args.tag,
-            args.attr,
-            args.ctag,
-            include,
-            exclude,
-            args.auto,
-            args.output,
-            args.crawl,
-            )
+        process_crawl(settings, spider_class, start_urls, args, spider_kwargs(args, include, exclude))
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
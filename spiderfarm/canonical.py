@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+# spiderfarm/canonical.py
+import re
+from fnmatch import translate
+from functools import lru_cache
+from urllib.parse import unquote_plus, urljoin, urlsplit
+
+from lxml import etree
+
+# presentation-only query parameters (ordering and layout of the same content), ignored in dedup keys only
+IGNORE_PARAMS = (
+    'sort', 'sort_by', 'sortby', 'order', 'orderby', 'order_by', 'dir', 'direction',
+    'view', 'display', 'layout', 'list_mode',
+)
+# tracking and session parameters, dropped from the requested URL as well
+DENY_PARAMS = (
+    'utm_*', 'gclid', 'gbraid', 'wbraid', 'dclid', 'fbclid', 'msclkid', 'yclid', 'mc_cid', 'mc_eid',
+    '_ga', '_gl', 'igshid', 'srsltid', 'ref', 'ref_src', 'sessionid', 'jsessionid', 'phpsessid', 'sid',
+)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+CANONICAL_HREF = etree.XPath("//link[@rel='canonical']/@href")
+
+
+def compile_params(names):
+    """One case-insensitive regex for parameter names, with * and ? wildcards; None for an empty list."""
+    names = [name for name in names if name]
+    if not names:
+        return None
+    return re.compile('|'.join(translate(name) for name in names), re.IGNORECASE)
+
+
+class CanonicalRules:
+    """Canonicalization rules for one domain: the defaults with any URL_CANONICAL_DOMAIN_RULES entry applied."""
+    __slots__ = ('ignore', 'deny', 'strip_www', 'trailing_slash', 'lowercase_path')
+
+    def __init__(self, ignore=IGNORE_PARAMS, deny=DENY_PARAMS, strip_www=True, trailing_slash=True, lowercase_path=False):
+        self.ignore = compile_params(ignore)
+        self.deny = compile_params(deny)
+        self.strip_www = strip_www
+        self.trailing_slash = trailing_slash
+        self.lowercase_path = lowercase_path
+
+    def keep(self, name):
+        """False for denied (tracking/session) parameters, which are dropped from the requested URL."""
+        return self.deny is None or self.deny.fullmatch(unquote_plus(name)) is None
+
+    def keep_in_key(self, name):
+        """False for denied and presentation-only parameters, which don't make a page distinct."""
+        name = unquote_plus(name)
+        if self.deny is not None and self.deny.fullmatch(name):
+            return False
+        return self.ignore is None or self.ignore.fullmatch(name) is None
+
+
+class UrlCanonicalizer:
+    """
+    Rules-based URL canonicalization, memoized and shared by a crawler's spiders, link extractor and dupefilter.
+    canonicalize(url) is the URL that gets requested:
+    - http(s) only; scheme and host lowercased, default ports and fragments dropped, empty path -> /
+    - tracking and session parameters (URL_CANONICAL_DENY_PARAMS, wildcards allowed) dropped;
+      every other parameter is kept as is, since it may select different content (route, category, filter)
+    key(url) is what the frontier dedups on; on top of the canonical URL it
+    - drops presentation-only parameters (URL_CANONICAL_IGNORE_PARAMS: sort order, view, layout) and sorts the rest
+    - http/https, a leading www. (URL_CANONICAL_STRIP_WWW) and a trailing slash (URL_CANONICAL_TRAILING_SLASH)
+    - path case, when URL_CANONICAL_LOWERCASE_PATH is set (case-insensitive servers)
+    - rel=canonical aliases (URL_CANONICAL_TAG_ALIASES): once a page names another canonical URL,
+      that URL's key resolves to the page's, so the same content isn't fetched twice
+    URL_CANONICAL_DOMAIN_RULES overrides any of these per domain (and its subdomains), e.g.
+    {'shop.com': {'ignore': ['sort', 'view', 'per_page'], 'deny': ['affiliate'], 'lowercase_path': True}}
+    (a domain's deny list adds to URL_CANONICAL_DENY_PARAMS).
+    """
+    def __init__(self, ignore=IGNORE_PARAMS, deny=DENY_PARAMS, strip_www=True, trailing_slash=True,
+                 lowercase_path=False, domain_rules=None, tag_aliases=False, cache_size=100_000):
+        self.default_rules = dict(ignore=ignore, deny=deny, strip_www=strip_www,
+                                  trailing_slash=trailing_slash, lowercase_path=lowercase_path)
+        self.rules = CanonicalRules(**self.default_rules)
+        # a domain's deny list adds to the defaults, so tracking parameters stay dropped everywhere
+        self.domain_rules = {
+            domain.lower().lstrip('.'): CanonicalRules(**{
+                **self.default_rules, **overrides, 'deny': [*deny, *overrides.get('deny', ())],
+            })
+            for domain, overrides in (domain_rules or {}).items()
+        }
+        self.tag_aliases = tag_aliases
+        self.aliases = {}
+        self.canonicalize = lru_cache(maxsize=cache_size)(self._canonicalize)
+        self.base_key = lru_cache(maxsize=cache_size)(self._base_key)
+        self.rules_for = lru_cache(maxsize=1024)(self._rules_for)
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            ignore=settings.getlist('URL_CANONICAL_IGNORE_PARAMS', IGNORE_PARAMS),
+            deny=settings.getlist('URL_CANONICAL_DENY_PARAMS', DENY_PARAMS),
+            strip_www=settings.getbool('URL_CANONICAL_STRIP_WWW', True),
+            trailing_slash=settings.getbool('URL_CANONICAL_TRAILING_SLASH', True),
+            lowercase_path=settings.getbool('URL_CANONICAL_LOWERCASE_PATH', False),
+            domain_rules=settings.getdict('URL_CANONICAL_DOMAIN_RULES'),
+            tag_aliases=settings.getbool('URL_CANONICAL_TAG_ALIASES', False),
+            cache_size=settings.getint('URL_CANONICAL_CACHE_SIZE', 100_000),
+        )
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        # one instance per crawler, so aliases learned by a spider reach the dupefilter
+        canonicalizer = getattr(crawler, 'spiderfarm_canonicalizer', None)
+        if canonicalizer is None:
+            canonicalizer = cls.from_settings(crawler.settings)
+            crawler.spiderfarm_canonicalizer = canonicalizer
+        return canonicalizer
+
+    def _rules_for(self, host):
+        # the host, then each parent domain
+        while host:
+            rules = self.domain_rules.get(host)
+            if rules is not None:
+                return rules
+            host = host.partition('.')[2]
+        return self.rules
+
+    def _canonicalize(self, url, keep_query=False):
+        """Canonical URL, or None for anything that isn't an http(s) URL with a host."""
+        if not url:
+            return None
+        try:
+            parts = urlsplit(url.strip())
+            port = parts.port
+        except ValueError:
+            return None
+        scheme = parts.scheme.lower()
+        host = parts.hostname
+        if scheme not in DEFAULT_PORTS or not host:
+            return None
+        netloc = host if port is None or port == DEFAULT_PORTS[scheme] else f"{host}:{port}"
+        query = parts.query
+        if query and not keep_query:
+            rules = self.rules_for(host) if self.domain_rules else self.rules
+            query = '&'.join(param for param in query.split('&') if param and rules.keep(param.partition('=')[0]))
+        return f"{scheme}://{netloc}{parts.path or '/'}{'?' + query if query else ''}"
+
+    def _base_key(self, url):
+        url = self.canonicalize(url)
+        if url is None:
+            return None
+        rest = url.partition('://')[2]
+        host, _, path = rest.partition('/')
+        path, mark, query = path.partition('?')
+        rules = self.rules_for(host.partition(':')[0]) if self.domain_rules else self.rules
+        if rules.strip_www:
+            host = host.removeprefix('www.')
+        if rules.trailing_slash:
+            path = path.rstrip('/')
+        if rules.lowercase_path:
+            path = path.lower()
+        if query:
+            query = '&'.join(sorted(param for param in query.split('&') if rules.keep_in_key(param.partition('=')[0])))
+            mark = '?' if query else ''
+        return f"{host}/{path}{mark}{query}"
+
+    def key(self, url):
+        """Dedup key of a URL (canonical-tag aliases applied), or None when it isn't a valid http(s) URL."""
+        key = self.base_key(url)
+        if self.aliases:
+            return self.aliases.get(key, key)
+        return key
+
+    def origin(self, url):
+        parts = urlsplit(self.canonicalize(url) or '')
+        return f"{parts.scheme}://{parts.netloc}" if parts.netloc else None
+
+    def alias(self, url, href):
+        """
+        Record the page's rel=canonical target (href, relative to url) as an alias of the page.
+        Only targets on the same site are aliased; returns the canonical target, or None.
+        """
+        target = self.canonicalize(urljoin(url, href.strip())) if href else None
+        page_key, target_key = self.base_key(url), self.base_key(target)
+        if not target_key or target_key == page_key:
+            return None
+        if page_key.partition('/')[0] != target_key.partition('/')[0]:
+            return None
+        # the first page naming a target wins; later requests for the target resolve to that page
+        self.aliases.setdefault(target_key, self.key(url))
+        return target
+
+    def canonical_link(self, response):
+        hrefs = CANONICAL_HREF(response.selector.root)
+        return hrefs[0] if hrefs else None
+
+
+# default rules, for seeds and other URLs validated outside a crawl
+DEFAULT_CANONICALIZER = UrlCanonicalizer()
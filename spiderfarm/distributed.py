@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+# spiderfarm/distributed.py
+import logging
+import multiprocessing
+import os
+import pickle
+import heapq
+import socket
+import sqlite3
+import tempfile
+import time
+from itertools import count
+from pathlib import Path
+
+from scrapy import signals
+from scrapy.core.scheduler import BaseScheduler
+from scrapy.crawler import CrawlerProcess
+from scrapy.exceptions import DontCloseSpider
+from scrapy.utils.defer import deferred_from_coro
+from scrapy.utils.misc import build_from_crawler, load_object
+from scrapy.utils.request import request_from_dict
+
+from spiderfarm import sharding, sinks
+from spiderfarm.pagepool import PAGE_META, PlaywrightPagePool
+import helpers
+
+try:
+    import redis
+except ImportError:  # optional, only needed for redis:// backends
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class FrontierBackend:
+    """
+    Shared crawl state for distributed mode, namespaced by crawl id.
+    - push(data, priority) / pop(): the request queue, highest priority first, FIFO within a priority
+    - seen_add(name, fp): add an 8-byte fingerprint to the named seen-set, True if it was new
+    - join(node) / heartbeat(node) / leave(node, output, items): node registry; leave and running()
+      return the number of nodes still running, expiring nodes without a heartbeat for `node_timeout`
+      seconds (a node killed hard never leaves)
+    - claim_merge(): True for exactly one caller, which merges the node outputs
+    """
+    def push(self, data, priority=0):
+        raise NotImplementedError
+
+    def pop(self):
+        raise NotImplementedError
+
+    def queue_size(self):
+        raise NotImplementedError
+
+    def has_pending(self):
+        return self.queue_size() > 0
+
+    def seen_add(self, name, fp):
+        raise NotImplementedError
+
+    def seen_contains(self, name, fp):
+        raise NotImplementedError
+
+    def seen_size(self, name):
+        raise NotImplementedError
+
+    def join(self, node):
+        raise NotImplementedError
+
+    def heartbeat(self, node):
+        raise NotImplementedError
+
+    def leave(self, node, output=None, items=0):
+        raise NotImplementedError
+
+    def running(self):
+        raise NotImplementedError
+
+    def outputs(self):
+        raise NotImplementedError
+
+    def claim_merge(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SqliteBackend(FrontierBackend):
+    """
+    Single-machine backend in one SQLite file (sqlite:///path/to/frontier.db).
+    Worker processes share it through SQLite's file locking (WAL, autocommit, busy timeout),
+    so every push, pop and seen-set insert is immediately visible to the others.
+    """
+    def __init__(self, path, crawl_id='crawl', node_timeout=300):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.crawl_id = crawl_id
+        self.node_timeout = node_timeout
+        self.conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS queue (id INTEGER PRIMARY KEY, crawl TEXT, priority INTEGER, data BLOB)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS queue_order ON queue (crawl, priority DESC, id)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS seen (crawl TEXT, name TEXT, fp BLOB, PRIMARY KEY (crawl, name, fp)) WITHOUT ROWID')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS nodes (crawl TEXT, node TEXT, running INTEGER, heartbeat REAL, output TEXT, items INTEGER, PRIMARY KEY (crawl, node))')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS merges (crawl TEXT PRIMARY KEY)')
+
+    def push(self, data, priority=0):
+        self.conn.execute('INSERT INTO queue (crawl, priority, data) VALUES (?, ?, ?)', (self.crawl_id, priority, data))
+
+    def pop(self):
+        row = self.conn.execute(
+            'DELETE FROM queue WHERE id = (SELECT id FROM queue WHERE crawl = ? ORDER BY priority DESC, id LIMIT 1) RETURNING data',
+            (self.crawl_id,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def queue_size(self):
+        return self.conn.execute('SELECT COUNT(*) FROM queue WHERE crawl = ?', (self.crawl_id,)).fetchone()[0]
+
+    def has_pending(self):
+        return self.conn.execute('SELECT EXISTS (SELECT 1 FROM queue WHERE crawl = ?)', (self.crawl_id,)).fetchone()[0] == 1
+
+    def seen_add(self, name, fp):
+        cursor = self.conn.execute('INSERT OR IGNORE INTO seen (crawl, name, fp) VALUES (?, ?, ?)', (self.crawl_id, name, fp))
+        return cursor.rowcount == 1
+
+    def seen_contains(self, name, fp):
+        return self.conn.execute(
+            'SELECT 1 FROM seen WHERE crawl = ? AND name = ? AND fp = ?', (self.crawl_id, name, fp)
+        ).fetchone() is not None
+
+    def seen_size(self, name):
+        return self.conn.execute('SELECT COUNT(*) FROM seen WHERE crawl = ? AND name = ?', (self.crawl_id, name)).fetchone()[0]
+
+    def join(self, node):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO nodes (crawl, node, running, heartbeat, output, items) VALUES (?, ?, 1, ?, NULL, 0)',
+            (self.crawl_id, node, time.time()),
+        )
+
+    def heartbeat(self, node):
+        self.conn.execute('UPDATE nodes SET heartbeat = ? WHERE crawl = ? AND node = ?', (time.time(), self.crawl_id, node))
+
+    def count_running(self):
+        # nodes that stopped sending heartbeats died without leaving
+        self.conn.execute(
+            'UPDATE nodes SET running = 0 WHERE crawl = ? AND running = 1 AND heartbeat < ?',
+            (self.crawl_id, time.time() - self.node_timeout),
+        )
+        return self.conn.execute('SELECT COUNT(*) FROM nodes WHERE crawl = ? AND running = 1', (self.crawl_id,)).fetchone()[0]
+
+    def leave(self, node, output=None, items=0):
+        # update and count in one write transaction, so exactly one node sees 0 running
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.conn.execute(
+                'UPDATE nodes SET running = 0, output = ?, items = ? WHERE crawl = ? AND node = ?',
+                (output, items, self.crawl_id, node),
+            )
+            running = self.count_running()
+        finally:
+            self.conn.execute('COMMIT')
+        return running
+
+    def running(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            return self.count_running()
+        finally:
+            self.conn.execute('COMMIT')
+
+    def outputs(self):
+        rows = self.conn.execute(
+            'SELECT output FROM nodes WHERE crawl = ? AND output IS NOT NULL ORDER BY node', (self.crawl_id,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def claim_merge(self):
+        return self.conn.execute('INSERT OR IGNORE INTO merges (crawl) VALUES (?)', (self.crawl_id,)).rowcount == 1
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class RedisBackend(FrontierBackend):
+    """
+    Multi-machine backend on Redis (redis://host:port/db, needs `pip install redis`).
+    - queue: a sorted set scored by -priority; members carry an INCR counter prefix, so ZPOPMIN
+      pops the highest priority first and keeps FIFO order within a priority
+    - seen-sets: Redis sets of 8-byte fingerprints
+    - nodes: outputs in a hash, running nodes in a sorted set scored by their last heartbeat
+    """
+    def __init__(self, url, crawl_id='crawl', node_timeout=300):
+        if redis is None:
+            raise RuntimeError("The redis backend needs the redis package - install it with 'pip install redis'.")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = f"spiderfarm:{crawl_id}"
+        self.node_timeout = node_timeout
+
+    def push(self, data, priority=0):
+        counter = self.client.incr(f"{self.prefix}:counter")
+        self.client.zadd(f"{self.prefix}:queue", {counter.to_bytes(8, 'big') + data: -priority})
+
+    def pop(self):
+        popped = self.client.zpopmin(f"{self.prefix}:queue", 1)
+        return popped[0][0][8:] if popped else None
+
+    def queue_size(self):
+        return self.client.zcard(f"{self.prefix}:queue")
+
+    def seen_add(self, name, fp):
+        return self.client.sadd(f"{self.prefix}:seen:{name}", fp) == 1
+
+    def seen_contains(self, name, fp):
+        return bool(self.client.sismember(f"{self.prefix}:seen:{name}", fp))
+
+    def seen_size(self, name):
+        return self.client.scard(f"{self.prefix}:seen:{name}")
+
+    def join(self, node):
+        self.client.hset(f"{self.prefix}:nodes", node, '')
+        self.heartbeat(node)
+
+    def heartbeat(self, node):
+        self.client.zadd(f"{self.prefix}:running", {node: time.time()})
+
+    def leave(self, node, output=None, items=0):
+        self.client.hset(f"{self.prefix}:nodes", node, output or '')
+        pipe = self.client.pipeline()
+        pipe.zrem(f"{self.prefix}:running", node)
+        pipe.zremrangebyscore(f"{self.prefix}:running", '-inf', time.time() - self.node_timeout)
+        pipe.zcard(f"{self.prefix}:running")
+        return pipe.execute()[-1]
+
+    def running(self):
+        pipe = self.client.pipeline()
+        pipe.zremrangebyscore(f"{self.prefix}:running", '-inf', time.time() - self.node_timeout)
+        pipe.zcard(f"{self.prefix}:running")
+        return pipe.execute()[-1]
+
+    def outputs(self):
+        nodes = self.client.hgetall(f"{self.prefix}:nodes")
+        return [output.decode('utf-8') for _, output in sorted(nodes.items()) if output]
+
+    def claim_merge(self):
+        return bool(self.client.set(f"{self.prefix}:merged", 1, nx=True))
+
+    def close(self):
+        self.client.close()
+
+
+def open_backend(url, crawl_id='crawl', node_timeout=300):
+    """Backend for a DISTRIBUTED_BACKEND URL: redis://... or sqlite:///path (a bare path means SQLite)."""
+    if not url:
+        raise ValueError("Distributed mode needs DISTRIBUTED_BACKEND (redis://host:port/db or sqlite:///path/to/frontier.db)")
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url, crawl_id, node_timeout)
+    return SqliteBackend(url.removeprefix('sqlite://'), crawl_id, node_timeout)
+
+
+def backend_from_settings(settings, spider_name=None):
+    return open_backend(
+        settings.get('DISTRIBUTED_BACKEND'),
+        crawl_id(settings, spider_name),
+        node_timeout=settings.getfloat('DISTRIBUTED_NODE_TIMEOUT', 300),
+    )
+
+
+def crawl_id(settings, spider_name=None):
+    return settings.get('DISTRIBUTED_CRAWL_ID') or spider_name or 'crawl'
+
+
+class DistributedScheduler(BaseScheduler):
+    """
+    Scheduler (SCHEDULER) pulling requests from the shared FrontierBackend queue instead of
+    an in-process queue; requests are stored as pickled request dicts, so callbacks must be spider methods.
+    Duplicates are filtered by DUPEFILTER_CLASS, which follows SEEN_STORE = 'distributed' onto the
+    backend's seen-sets. When the shared queue runs dry the spider is kept open for
+    DISTRIBUTED_IDLE_TIMEOUT seconds, since other nodes may still be queueing links from pages in flight.
+    The node's heartbeat (DISTRIBUTED_NODE) is refreshed from the engine's polling of next_request.
+    Live playwright pages are taken out of a request's meta (and returned to the page pool) before it is
+    queued; a request that still can't be serialized stays in a local memory queue, as in Scrapy's scheduler.
+    """
+    def __init__(self, crawler, backend, dupefilter, idle_timeout=60, node=None):
+        self.crawler = crawler
+        self.backend = backend
+        self.df = dupefilter
+        self.idle_timeout = idle_timeout
+        self.node = node
+        # several heartbeats per DISTRIBUTED_NODE_TIMEOUT
+        self.heartbeat_interval = backend.node_timeout / 10
+        self.last_heartbeat = time.monotonic()
+        self.last_activity = time.monotonic()
+        self.local = []  # heap of (-priority, order, request) for unserializable requests
+        self.local_order = count()
+        self.spider = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        scheduler = cls(
+            crawler,
+            backend_from_settings(settings, crawler.spidercls.name),
+            build_from_crawler(load_object(settings['DUPEFILTER_CLASS']), crawler),
+            idle_timeout=settings.getfloat('DISTRIBUTED_IDLE_TIMEOUT', 60),
+            node=settings.get('DISTRIBUTED_NODE'),
+        )
+        crawler.signals.connect(scheduler.spider_idle, signal=signals.spider_idle)
+        return scheduler
+
+    @property
+    def stats(self):
+        return self.crawler.stats
+
+    def open(self, spider):
+        self.spider = spider
+        return self.df.open()
+
+    def close(self, reason):
+        self.backend.close()
+        return self.df.close(reason)
+
+    def has_pending_requests(self):
+        return bool(self.local) or self.backend.has_pending()
+
+    def __len__(self):
+        return len(self.local) + self.backend.queue_size()
+
+    def enqueue_request(self, request):
+        if not request.dont_filter and self.df.request_seen(request):
+            self.df.log(request, self.spider)
+            return False
+        request = self.detach_page(request)
+        self.last_activity = time.monotonic()
+        try:
+            data = pickle.dumps(request.to_dict(spider=self.spider), protocol=pickle.HIGHEST_PROTOCOL)
+        except (TypeError, ValueError, AttributeError, pickle.PicklingError) as e:
+            logger.error(f"DISTRIBUTED: {request} can't be serialized, kept in this node's memory queue - {e}")
+            self.stats.inc_value('scheduler/unserializable')
+            self.stats.inc_value('scheduler/enqueued/memory')
+            heapq.heappush(self.local, (-request.priority, next(self.local_order), request))
+            return True
+        self.backend.push(data, request.priority)
+        self.stats.inc_value('scheduler/enqueued/distributed')
+        return True
+
+    def detach_page(self, request):
+        # a retried request still carries the page of its failed attempt; hand it back to the pool
+        page_meta = {key: request.meta[key] for key in PAGE_META if key in request.meta}
+        if not page_meta:
+            return request
+        meta = {key: value for key, value in request.meta.items() if key not in PAGE_META}
+        if page_meta.get('playwright_page') is not None:
+            page_meta['playwright_context'] = meta.get('playwright_context', 'default')
+            deferred_from_coro(PlaywrightPagePool.from_crawler(self.crawler).release(page_meta))
+        return request.replace(meta=meta)
+
+    def next_request(self):
+        if self.node and time.monotonic() - self.last_heartbeat >= self.heartbeat_interval:
+            self.backend.heartbeat(self.node)
+            self.last_heartbeat = time.monotonic()
+        if self.local:
+            self.last_activity = time.monotonic()
+            self.stats.inc_value('scheduler/dequeued/memory')
+            return heapq.heappop(self.local)[2]
+        data = self.backend.pop()
+        if data is None:
+            return None
+        self.last_activity = time.monotonic()
+        self.stats.inc_value('scheduler/dequeued/distributed')
+        return request_from_dict(pickle.loads(data), spider=self.spider)
+
+    def spider_idle(self, spider):
+        if time.monotonic() - self.last_activity < self.idle_timeout:
+            raise DontCloseSpider
+
+
+def node_name(index):
+    return f"{socket.gethostname()}-{os.getpid()}-{index}"
+
+
+def node_settings(settings, output_dir, node):
+    """Settings for one node: the shared scheduler and seen-stores, and its own part of the output."""
+    settings = sharding.worker_settings(settings, helpers.sanitize_filename(node), output_dir)
+    settings.set('SCHEDULER', 'spiderfarm.distributed.DistributedScheduler')
+    settings.set('SEEN_STORE', 'distributed')
+    settings.set('DISTRIBUTED_NODE', node)
+    return settings
+
+
+def crawl_node(task):
+    """
+    Worker entry point: run one node of a distributed crawl in this process.
+    The node registers with the backend, crawls until the shared queue stays empty and records its output.
+    """
+    spider_class, start_urls, crawl_kwargs, settings, output_dir, index = task
+    node = node_name(index)
+    backend = backend_from_settings(settings, spider_class.name)
+    backend.join(node)
+    settings = node_settings(settings, output_dir, node)
+    summary = {'node': node, 'output': None, 'items': 0, 'reason': None}
+    try:
+        process = CrawlerProcess(settings)
+        crawler = process.create_crawler(spider_class)
+        process.crawl(crawler, start_urls=start_urls, **crawl_kwargs)
+        process.start()
+        summary['items'] = crawler.stats.get_value('item_scraped_count', 0)
+        summary['reason'] = crawler.stats.get_value('finish_reason')
+    except Exception as e:
+        summary['reason'] = f"error: {e}"
+    fmt = sharding.output_format(settings)
+    output = Path(output_dir) / helpers.resolve_output_filename(
+        helpers.sanitize_filename(node), extension=sinks.SINKS[fmt].extension)
+    if output.exists():
+        summary['output'] = str(output)
+    summary['running'] = backend.leave(node, summary['output'], summary['items'])
+    backend.close()
+    return summary
+
+
+def crawl_distributed(settings, spider_class, start_urls, crawl_kwargs, workers=None):
+    """
+    Run `workers` nodes of a distributed crawl on this machine (DISTRIBUTED_BACKEND, '--distributed').
+    More machines join by running the same command against the same backend; node outputs go to
+    DISTRIBUTED_OUTPUT_DIR, which must then be a shared directory. Once its own nodes are done a
+    launcher waits for the nodes elsewhere (nodes without a heartbeat for DISTRIBUTED_NODE_TIMEOUT
+    count as dead); the first to claim the merge merges every node's output into one file.
+    Rerunning against the same backend continues the crawl from the shared queue.
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    name = crawl_id(settings, spider_class.name)
+    settings = settings.copy()
+    settings.set('DISTRIBUTED_CRAWL_ID', name)
+    output_dir = settings.get('DISTRIBUTED_OUTPUT_DIR') or os.path.join(tempfile.gettempdir(), f"spiderfarm_{name}_nodes")
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(spider_class, start_urls, crawl_kwargs, settings, output_dir, index) for index in range(workers)]
+    print(f"Crawling with {workers} nodes on {settings.get('DISTRIBUTED_BACKEND')} (crawl id: {name})...")
+    # summaries arrive in completion order, not in the order the nodes left; any 0 means all nodes are done
+    running = None
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes=workers, maxtasksperchild=1) as pool:
+        for summary in pool.imap_unordered(crawl_node, tasks):
+            running = summary['running'] if running is None else min(running, summary['running'])
+            print(f"NODE DONE: {summary['node']} - {summary['items']} rows ({summary['reason']}), {summary['running']} nodes still running")
+    backend = backend_from_settings(settings)
+    try:
+        if running:
+            print(f"\nWaiting for {running} nodes elsewhere to finish...")
+        while running:
+            time.sleep(5)
+            running = backend.running()
+        if not backend.claim_merge():
+            print(f"\nCrawl {name} was already merged - use a new DISTRIBUTED_CRAWL_ID or backend for a fresh crawl.\n")
+            return
+        paths = [path for path in backend.outputs() if os.path.exists(path)]
+    finally:
+        backend.close()
+    sharding.deliver_merged(settings, spider_class, paths, f"{spider_class.name}_distributed")
+    for path in paths:
+        Path(path).unlink(missing_ok=True)
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# spiderfarm/extensions.py
+import json
+import logging
+import os
+import pickle
+from pathlib import Path
+from time import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+from spiderfarm.metrics import CrawlMetrics
+
+logger = logging.getLogger(__name__)
+
+# sent every CHECKPOINT_INTERVAL seconds while a resumable crawl (JOBDIR) runs;
+# components holding buffered state (seen-stores, output sinks) flush it to disk
+checkpoint_reached = object()
+
+
+def write_atomic(path, data):
+    """Write bytes through a temporary file and rename, so readers never see a partial file."""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class CheckpointExtension:
+    """
+    Periodic checkpoints for resumable crawls ('--resume <dir>', which sets JOBDIR).
+    The scheduler queue itself lives in a SQLite disk queue that commits on every push/pop;
+    on each checkpoint this extension:
+    - sends the checkpoint_reached signal (seen-stores commit, output sinks flush)
+    - writes spider.state atomically, so it survives a crash and not only a clean shutdown
+    - records progress in <dir>/checkpoint.json
+    """
+
+    def __init__(self, crawler, jobdir, interval):
+        self.crawler = crawler
+        self.jobdir = Path(jobdir)
+        self.interval = interval
+        self.task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        jobdir = crawler.settings.get('JOBDIR')
+        interval = crawler.settings.getfloat('CHECKPOINT_INTERVAL', 60)
+        if not jobdir or not interval:
+            raise NotConfigured
+        o = cls(crawler, jobdir, interval)
+        crawler.signals.connect(o.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(o.spider_closed, signal=signals.spider_closed)
+        return o
+
+    def spider_opened(self, spider):
+        checkpoint = self.jobdir / 'checkpoint.json'
+        if checkpoint.exists():
+            with open(checkpoint, encoding='utf-8') as f:
+                last = json.load(f)
+            spider.logger.info(f"RESUMING: {self.jobdir} (last checkpoint: {last.get('items_scraped', 0)} items, {last.get('responses', 0)} responses)")
+        self.task = task.LoopingCall(self.checkpoint, spider)
+        self.task.start(self.interval, now=False)
+
+    def checkpoint(self, spider):
+        self.crawler.signals.send_catch_log(signal=checkpoint_reached, spider=spider)
+        stats = self.crawler.stats
+        write_atomic(self.jobdir / 'spider.state', pickle.dumps(getattr(spider, 'state', {}), protocol=4))
+        write_atomic(self.jobdir / 'checkpoint.json', json.dumps({
+            'time': time(),
+            'items_scraped': stats.get_value('item_scraped_count', 0),
+            'responses': stats.get_value('response_received_count', 0),
+        }).encode('utf-8'))
+        stats.inc_value('checkpoint/count')
+        logger.debug(f"Checkpoint written to {self.jobdir}", extra={'spider': spider})
+
+    def spider_closed(self, spider, reason):
+        if self.task and self.task.running:
+            self.task.stop()
+        self.checkpoint(spider)
+
+
+class MetricsExporter:
+    """
+    Writes the crawl metrics (stage histograms, counters and numeric crawl stats) to METRICS_FILE
+    every METRICS_INTERVAL seconds and once more on close, so long crawls can be watched live.
+    A .prom/.txt file gets the Prometheus text format (node_exporter textfile collector), anything else JSON.
+    """
+
+    def __init__(self, crawler, path, interval):
+        self.crawler = crawler
+        self.metrics = CrawlMetrics.from_crawler(crawler)
+        self.path = Path(path)
+        self.interval = interval
+        self.prometheus = self.path.suffix in ('.prom', '.txt')
+        self.task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('METRICS_FILE')
+        if not crawler.settings.getbool('METRICS_ENABLED') or not path:
+            raise NotConfigured
+        o = cls(crawler, path, crawler.settings.getfloat('METRICS_INTERVAL', 15))
+        crawler.signals.connect(o.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(o.spider_closed, signal=signals.spider_closed)
+        return o
+
+    def spider_opened(self, spider):
+        spider.logger.info(f"METRICS: writing to {self.path} every {self.interval:g}s")
+        self.task = task.LoopingCall(self.export)
+        self.task.start(self.interval, now=False)
+
+    def export(self):
+        stats = self.crawler.stats.get_stats()
+        if self.prometheus:
+            data = self.metrics.to_prometheus(stats)
+        else:
+            data = self.metrics.to_json(stats)
+        write_atomic(self.path, data.encode('utf-8'))
+
+    def spider_closed(self, spider, reason):
+        if self.task and self.task.running:
+            self.task.stop()
+        self.metrics.finalize()
+        self.export()
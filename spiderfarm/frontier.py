@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# spiderfarm/frontier.py
+import logging
+import os
+import pickle
+import random
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from spiderfarm.extensions import checkpoint_reached, write_atomic
+from spiderfarm.nearduplicates import NUMERIC_SEGMENT
+
+logger = logging.getLogger(__name__)
+
+
+def path_prefixes(url, max_depth=3):
+    """
+    Path patterns of a URL from the most to the least specific, numeric or id-like segments as {n}
+    (https://shop.com/products/123/red -> shop.com/products/{n}/red, shop.com/products/{n}, shop.com/products, shop.com).
+    """
+    parts = urlsplit(url)
+    segments = ['{n}' if NUMERIC_SEGMENT.match(segment) else segment for segment in parts.path.split('/') if segment]
+    host = parts.hostname or ''
+    return [
+        '/'.join([host] + segments[:depth])
+        for depth in range(min(len(segments), max_depth), -1, -1)
+    ]
+
+
+class YieldFrontier:
+    """
+    Best-first link ordering for SchemaSpider (FRONTIER_ENABLED).
+    Every parsed page counts towards its path patterns (host, first segment, first two...,
+    up to FRONTIER_MAX_DEPTH) as a hit when it yielded target-type rows.
+    A new link is scored with the smoothed hit rate of its most specific pattern seen on at least
+    FRONTIER_MIN_SAMPLES pages (the crawl-wide rate otherwise) and queued with a priority of
+    0..FRONTIER_PRIORITY_LEVELS, so product and category pages are rendered before blog, help or
+    account pages. FRONTIER_EXPLORATION of the links go in at the top priority whatever their score,
+    so patterns that were never sampled, or scored low early on, still get a look.
+    Priorities are fixed when a link is queued; with JOBDIR the pattern counts are saved on every
+    checkpoint and reloaded on resume.
+    """
+    def __init__(self, levels=10, min_samples=5, exploration=0.1, max_depth=3, state_path=None, seed=None):
+        self.levels = levels
+        self.min_samples = min_samples
+        self.exploration = exploration
+        self.max_depth = max_depth
+        self.state_path = Path(state_path) if state_path else None
+        self.random = random.Random(seed)
+        self.patterns = {}  # pattern -> [pages, hits]
+        self.pages = 0
+        self.hits = 0
+        self.explored = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """The spider's frontier, or None when FRONTIER_ENABLED is off."""
+        settings = crawler.settings
+        if not settings.getbool('FRONTIER_ENABLED', True):
+            return None
+        jobdir = settings.get('JOBDIR')
+        frontier = cls(
+            levels=settings.getint('FRONTIER_PRIORITY_LEVELS', 10),
+            min_samples=settings.getint('FRONTIER_MIN_SAMPLES', 5),
+            exploration=settings.getfloat('FRONTIER_EXPLORATION', 0.1),
+            max_depth=settings.getint('FRONTIER_MAX_DEPTH', 3),
+            state_path=os.path.join(jobdir, 'frontier.pickle') if jobdir else None,
+        )
+        frontier.load()
+        crawler.signals.connect(frontier.save, signal=checkpoint_reached, weak=False)
+        return frontier
+
+    def observe(self, url, hit):
+        """Count a parsed page under each of its patterns; hit when it yielded target-type rows."""
+        hit = int(bool(hit))
+        self.pages += 1
+        self.hits += hit
+        for pattern in path_prefixes(url, self.max_depth):
+            counts = self.patterns.get(pattern)
+            if counts is None:
+                counts = self.patterns[pattern] = [0, 0]
+            counts[0] += 1
+            counts[1] += hit
+
+    def score(self, url):
+        """Smoothed hit rate of the URL's most specific well-sampled pattern."""
+        for pattern in path_prefixes(url, self.max_depth):
+            counts = self.patterns.get(pattern)
+            if counts is not None and counts[0] >= self.min_samples:
+                return (counts[1] + 1) / (counts[0] + 2)
+        return (self.hits + 1) / (self.pages + 2)
+
+    def priority(self, url):
+        if self.exploration and self.random.random() < self.exploration:
+            self.explored += 1
+            return self.levels
+        return round(self.score(url) * self.levels)
+
+    def top_patterns(self, count=5):
+        sampled = [(pattern, pages, hits) for pattern, (pages, hits) in self.patterns.items() if pages >= self.min_samples]
+        return sorted(sampled, key=lambda entry: (entry[2] / entry[1], entry[1]), reverse=True)[:count]
+
+    def summary(self):
+        return {
+            'pages': self.pages,
+            'hit_pages': self.hits,
+            'patterns': len(self.patterns),
+            'explored_links': self.explored,
+        }
+
+    # state for resumable crawls
+    def save(self, spider=None):
+        if self.state_path is None:
+            return
+        state = (self.patterns, self.pages, self.hits)
+        write_atomic(self.state_path, pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def load(self):
+        if self.state_path is None or not self.state_path.exists():
+            return
+        with open(self.state_path, 'rb') as f:
+            self.patterns, self.pages, self.hits = pickle.load(f)
+        logger.info(f"RESUMING FRONTIER: {len(self.patterns)} URL patterns from {self.pages} pages")
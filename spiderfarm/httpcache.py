@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# spiderfarm/httpcache.py
+import logging
+import sqlite3
+import zlib
+from pathlib import Path
+from time import time
+
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteCacheStorage:
+    """
+    HTTPCACHE_STORAGE backend keeping responses (validators, headers and compressed bodies)
+    in one SQLite file per spider. Playwright responses are stored with their rendered DOM,
+    so a 304 on recrawl serves the rendered page without opening the browser.
+    - HTTPCACHE_EXPIRATION_SECS: entries older than this are dropped and fetched from scratch (0 = never)
+    - HTTPCACHE_MAX_SIZE_MB: least recently used entries are evicted once the cache grows past this (0 = unbounded)
+    """
+    def __init__(self, settings):
+        self.cachedir = data_path(settings['HTTPCACHE_DIR'], createdir=True)
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.max_size = settings.getint('HTTPCACHE_MAX_SIZE_MB', 0) * 1024 * 1024
+        self.conn = None
+        self.total_size = 0
+
+    def open_spider(self, spider):
+        path = Path(self.cachedir, f"{spider.name}.sqlite")
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, url TEXT, status INTEGER, headers BLOB, body BLOB, '
+            'size INTEGER, stored REAL, accessed REAL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self.total_size = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        self._fingerprinter = spider.crawler.request_fingerprinter
+        logger.debug(f"Using SQLite cache storage in {path}", extra={'spider': spider})
+
+    def close_spider(self, spider):
+        self.conn.commit()
+        self.conn.close()
+
+    def request_key(self, request):
+        # rendered and plain HTTP copies of a URL are cached separately, so a hybrid-mode
+        # escalation never gets served the plain HTTP body it is trying to replace
+        key = self._fingerprinter.fingerprint(request).hex()
+        return f"{key}:rendered" if request.meta.get('playwright') else key
+
+    def retrieve_response(self, spider, request):
+        key = self.request_key(request)
+        row = self.conn.execute(
+            'SELECT url, status, headers, body, stored FROM responses WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None # not cached
+        url, status, raw_headers, body, stored = row
+        if 0 < self.expiration_secs < time() - stored:
+            return None # expired
+        self.conn.execute('UPDATE responses SET accessed = ? WHERE key = ?', (time(), key))
+        request.meta['cache_timestamp'] = stored
+        headers = Headers(self.decode_headers(raw_headers))
+        body = zlib.decompress(body)
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, status=status, headers=headers, body=body, request=request)
+
+    def store_response(self, spider, request, response):
+        key = self.request_key(request)
+        raw_headers = self.encode_headers(response.headers)
+        body = zlib.compress(response.body)
+        size = len(body) + len(raw_headers)
+        previous = self.conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+        now = time()
+        self.conn.execute(
+            'INSERT OR REPLACE INTO responses (key, url, status, headers, body, size, stored, accessed) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, response.url, response.status, raw_headers, body, size, now, now),
+        )
+        self.total_size += size - (previous[0] if previous else 0)
+        if self.max_size and self.total_size > self.max_size:
+            self.evict()
+        self.conn.commit()
+
+    def evict(self):
+        """Drop least recently used entries until the cache is back under 90% of its size budget."""
+        target = self.max_size * 0.9
+        rows = self.conn.execute('SELECT key, size FROM responses ORDER BY accessed')
+        evicted = []
+        for key, size in rows:
+            if self.total_size <= target:
+                break
+            evicted.append((key,))
+            self.total_size -= size
+        self.conn.executemany('DELETE FROM responses WHERE key = ?', evicted)
+        logger.debug(f"Evicted {len(evicted)} cached responses (cache size limit)")
+
+    @staticmethod
+    def encode_headers(headers):
+        return b'\r\n'.join(
+            name + b': ' + value
+            for name, values in headers.items()
+            for value in values
+        )
+
+    @staticmethod
+    def decode_headers(raw_headers):
+        headers = {}
+        for line in raw_headers.split(b'\r\n'):
+            name, sep, value = line.partition(b': ')
+            if sep:
+                headers.setdefault(name, []).append(value)
+        return headers
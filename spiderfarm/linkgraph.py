@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# spiderfarm/linkgraph.py
+import csv
+import logging
+import os
+import pickle
+from array import array
+from collections import deque
+from pathlib import Path
+
+from spiderfarm.extensions import checkpoint_reached, write_atomic
+
+logger = logging.getLogger(__name__)
+
+
+class LinkGraph:
+    """
+    Internal link graph of a crawl (LINK_GRAPH_DIR, '--link-graph <dir>').
+    URLs are interned to integer IDs once; every link is two unsigned ints in a pair of
+    array-backed edge buffers (8 bytes per link), and each node carries its HTTP status
+    (0 until the page is crawled).
+    When the crawl closes the graph is written to the directory:
+    - edges.csv: every followed-scope link as source,target
+    - nodes.csv: url, status, click depth (shortest path from the seeds), inlinks, outlinks
+    - orphans.csv: crawled pages no other page links to
+    - deep_pages.csv: pages more than LINK_GRAPH_DEEP_PAGE_DEPTH clicks from the seeds
+    With JOBDIR the graph is saved on every checkpoint and reloaded on resume.
+    """
+    def __init__(self, out_dir, deep_page_depth=4, state_path=None):
+        self.out_dir = Path(out_dir)
+        self.deep_page_depth = deep_page_depth
+        self.state_path = Path(state_path) if state_path else None
+        self.ids = {}
+        self.urls = []
+        self.status = array('H')
+        self.seeds = set()
+        self.sources = array('I')
+        self.targets = array('I')
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """The spider's link graph, or None when LINK_GRAPH_DIR is not set."""
+        settings = crawler.settings
+        out_dir = settings.get('LINK_GRAPH_DIR')
+        if not out_dir:
+            return None
+        jobdir = settings.get('JOBDIR')
+        graph = cls(
+            out_dir,
+            deep_page_depth=settings.getint('LINK_GRAPH_DEEP_PAGE_DEPTH', 4),
+            state_path=os.path.join(jobdir, 'linkgraph.pickle') if jobdir else None,
+        )
+        graph.load()
+        crawler.signals.connect(graph.save, signal=checkpoint_reached, weak=False)
+        return graph
+
+    def __len__(self):
+        return len(self.urls)
+
+    def intern(self, url):
+        node = self.ids.get(url)
+        if node is None:
+            node = self.ids[url] = len(self.urls)
+            self.urls.append(url)
+            self.status.append(0)
+        return node
+
+    def add_seed(self, url):
+        self.seeds.add(self.intern(url))
+
+    def add_page(self, url, status):
+        self.status[self.intern(url)] = status
+
+    def add_links(self, url, targets):
+        source = self.intern(url)
+        target_ids = [self.intern(target) for target in targets]
+        self.sources.extend(array('I', [source]) * len(target_ids))
+        self.targets.extend(target_ids)
+
+    # state for resumable crawls
+    def save(self, spider=None):
+        if self.state_path is None:
+            return
+        state = (self.urls, self.status, self.seeds, self.sources, self.targets)
+        write_atomic(self.state_path, pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def load(self):
+        if self.state_path is None or not self.state_path.exists():
+            return
+        with open(self.state_path, 'rb') as f:
+            self.urls, self.status, self.seeds, self.sources, self.targets = pickle.load(f)
+        self.ids = {url: node for node, url in enumerate(self.urls)}
+        logger.info(f"RESUMING LINK GRAPH: {len(self.urls)} URLs, {len(self.sources)} links")
+
+    # analysis
+    def degrees(self):
+        count = len(self.urls)
+        inlinks = array('I', bytes(4 * count))
+        outlinks = array('I', bytes(4 * count))
+        for source in self.sources:
+            outlinks[source] += 1
+        for target in self.targets:
+            inlinks[target] += 1
+        return inlinks, outlinks
+
+    def click_depths(self, outlinks):
+        """Shortest click depth from the seeds (-1 when unreachable), by BFS over a CSR adjacency."""
+        count = len(self.urls)
+        offsets = array('I', bytes(4 * (count + 1)))
+        for node in range(count):
+            offsets[node + 1] = offsets[node] + outlinks[node]
+        fill = array('I', offsets[:-1])
+        adjacency = array('I', bytes(4 * len(self.targets)))
+        for source, target in zip(self.sources, self.targets):
+            adjacency[fill[source]] = target
+            fill[source] += 1
+        depths = array('i', [-1]) * count
+        queue = deque()
+        for seed in self.seeds:
+            depths[seed] = 0
+            queue.append(seed)
+        while queue:
+            node = queue.popleft()
+            next_depth = depths[node] + 1
+            for target in adjacency[offsets[node]:offsets[node + 1]]:
+                if depths[target] < 0:
+                    depths[target] = next_depth
+                    queue.append(target)
+        return depths
+
+    def export(self):
+        """Write the edge list and node/orphan/deep-page reports; returns a summary dict."""
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        inlinks, outlinks = self.degrees()
+        depths = self.click_depths(outlinks)
+        urls = self.urls
+        with open(self.out_dir / 'edges.csv', 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['source', 'target'])
+            writer.writerows((urls[s], urls[t]) for s, t in zip(self.sources, self.targets))
+        orphans = deep_pages = 0
+        with open(self.out_dir / 'nodes.csv', 'w', newline='', encoding='utf-8') as nodes_file, \
+             open(self.out_dir / 'orphans.csv', 'w', newline='', encoding='utf-8') as orphans_file, \
+             open(self.out_dir / 'deep_pages.csv', 'w', newline='', encoding='utf-8') as deep_file:
+            nodes = csv.writer(nodes_file)
+            orphan_rows = csv.writer(orphans_file)
+            deep_rows = csv.writer(deep_file)
+            nodes.writerow(['url', 'status', 'depth', 'inlinks', 'outlinks'])
+            orphan_rows.writerow(['url', 'status', 'outlinks'])
+            deep_rows.writerow(['url', 'status', 'depth', 'inlinks'])
+            for node, url in enumerate(urls):
+                depth = depths[node] if depths[node] >= 0 else ''
+                nodes.writerow([url, self.status[node] or '', depth, inlinks[node], outlinks[node]])
+                if self.status[node] and not inlinks[node] and node not in self.seeds:
+                    orphan_rows.writerow([url, self.status[node], outlinks[node]])
+                    orphans += 1
+                if depths[node] > self.deep_page_depth:
+                    deep_rows.writerow([url, self.status[node] or '', depths[node], inlinks[node]])
+                    deep_pages += 1
+        return {
+            'nodes': len(urls),
+            'edges': len(self.sources),
+            'orphans': orphans,
+            'deep_pages': deep_pages,
+        }
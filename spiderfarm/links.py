@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# spiderfarm/links.py
+from functools import lru_cache
+from urllib.parse import urljoin
+
+from lxml import etree
+
+import helpers
+from spiderfarm.canonical import DEFAULT_CANONICALIZER, UrlCanonicalizer
+
+
+class BulkLinkExtractor:
+    """
+    Link extraction without per-element Selector objects.
+    One precompiled XPath pulls every matching attribute value from the response's parsed lxml
+    tree as plain strings; each value is then resolved and canonicalized (UrlCanonicalizer) through
+    a memoized cache shared across pages, since nav/footer links repeat on every page of a site.
+    - absolute links are cached on the link alone, root-relative links per origin,
+      and other relative links per page URL
+    - LINK_CACHE_SIZE bounds the normalization cache (LRU)
+    """
+    def __init__(self, tag='a', attr='href', container_xpath=None, cache_size=100_000, canonicalizer=DEFAULT_CANONICALIZER):
+        self.xpath = etree.XPath(f"{container_xpath or ''}//{tag}/@{attr}")
+        self.canonicalizer = canonicalizer
+        self.resolve = lru_cache(maxsize=cache_size)(self._resolve)
+
+    @classmethod
+    def from_spider(cls, spider, settings=None):
+        settings = settings or spider.settings
+        return cls(
+            tag=spider.tag,
+            attr=spider.attr,
+            container_xpath=helpers.get_container_xpath(spider) if spider.ctag else None,
+            cache_size=settings.getint('LINK_CACHE_SIZE', 100_000),
+            canonicalizer=UrlCanonicalizer.from_crawler(spider.crawler),
+        )
+
+    def _resolve(self, base, link):
+        if not base:
+            # absolute link, nothing to join
+            return self.canonicalizer.canonicalize(link)
+        if link[0] == '/':
+            # plain root-relative path without a query: canonical origin + path
+            path = link.partition('#')[0]
+            if not any(c in path for c in ('?', '/.', ';', '\\', '%2e', '%2E')):
+                return f"{base}{path}"
+        return self.canonicalizer.canonicalize(urljoin(base, link))
+
+    def extract(self, response):
+        """
+        Return (link, normalized_url) pairs for the page in document order, one per distinct link.
+        normalized_url is None when the link cannot be resolved to an http(s) URL.
+        """
+        base = response.url
+        origin = None
+        seen = set()
+        links = []
+        for value in self.xpath(response.selector.root):
+            link = value.strip()
+            if not link or link in seen:
+                continue
+            seen.add(link)
+            if link.startswith(('http://', 'https://')):
+                normalized_url = self.resolve('', link)
+            elif link.startswith('/') and not link.startswith('//'):
+                if origin is None:
+                    origin = self.canonicalizer.origin(base)
+                normalized_url = self.resolve(origin, link)
+            else:
+                normalized_url = self.resolve(base, link)
+            links.append((link, normalized_url))
+        return links
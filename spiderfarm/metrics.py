@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# spiderfarm/metrics.py
+import json
+from bisect import bisect_left
+from contextlib import nullcontext
+from time import perf_counter, time
+
+from scrapy import signals
+
+# histogram bucket upper bounds in seconds (Prometheus style, +Inf implied)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# shared no-op timer, so disabled instrumentation costs one attribute lookup per call site
+NULL_TIMER = nullcontext()
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Bucket upper bound at the q-th quantile (an estimate, as in Prometheus)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS + (self.max,), self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class StageTimer:
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, perf_counter() - self.start)
+        return False
+
+
+class CrawlMetrics:
+    """
+    Per-stage latency histograms and counters for one crawler (METRICS_ENABLED).
+    Stages are timed by the metrics middlewares (download, render, callback) and by
+    spider/pipeline call sites through `with metrics.timer('stage'):`.
+    Every observation is mirrored into the crawl stats as metrics/<stage>/count|sum_ms|max_ms;
+    quantiles are added when the spider closes, and MetricsExporter writes the full
+    histograms to METRICS_FILE while the crawl runs.
+    """
+    def __init__(self, crawler, enabled=False):
+        self.crawler = crawler
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        # one instance per crawler, shared by middlewares, spiders, pipeline and exporter
+        metrics = getattr(crawler, 'spiderfarm_metrics', None)
+        if metrics is None:
+            metrics = cls(crawler, enabled=crawler.settings.getbool('METRICS_ENABLED'))
+            crawler.spiderfarm_metrics = metrics
+            if metrics.enabled:
+                crawler.signals.connect(metrics.finalize, signal=signals.spider_closed)
+        return metrics
+
+    @property
+    def stats(self):
+        # spiders are built before the crawler's stats exist, so resolve them on use
+        return self.crawler.stats
+
+    def timer(self, stage):
+        if not self.enabled:
+            return NULL_TIMER
+        return StageTimer(self, stage)
+
+    def observe(self, stage, seconds):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+        histogram.observe(seconds)
+        self.stats.inc_value(f'metrics/{stage}/count')
+        self.stats.inc_value(f'metrics/{stage}/sum_ms', seconds * 1000)
+        self.stats.max_value(f'metrics/{stage}/max_ms', round(seconds * 1000, 3))
+
+    def inc(self, name, count=1):
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + count
+        self.stats.inc_value(f'metrics/{name}', count)
+
+    def finalize(self):
+        for stage, histogram in self.histograms.items():
+            self.stats.set_value(f'metrics/{stage}/sum_ms', round(histogram.total * 1000, 3))
+            for q in (0.5, 0.95, 0.99):
+                value = histogram.quantile(q)
+                self.stats.set_value(f'metrics/{stage}/p{int(q * 100)}_ms', round(value * 1000, 3))
+
+    def snapshot(self, crawl_stats):
+        return {
+            'time': time(),
+            'stages': {
+                stage: {
+                    'count': h.count,
+                    'sum_s': round(h.total, 6),
+                    'max_s': round(h.max, 6),
+                    'p50_s': h.quantile(0.5),
+                    'p95_s': h.quantile(0.95),
+                    'buckets': dict(zip([str(b) for b in BUCKETS] + ['+Inf'], h.counts)),
+                }
+                for stage, h in self.histograms.items()
+            },
+            'counters': dict(self.counters),
+            'stats': {k: v for k, v in crawl_stats.items() if isinstance(v, (int, float)) and not k.startswith('metrics/')},
+        }
+
+    def to_json(self, crawl_stats):
+        return json.dumps(self.snapshot(crawl_stats), indent=2)
+
+    def to_prometheus(self, crawl_stats):
+        lines = [
+            '# HELP spiderfarm_stage_seconds Time spent per crawl stage.',
+            '# TYPE spiderfarm_stage_seconds histogram',
+        ]
+        for stage, h in self.histograms.items():
+            cumulative = 0
+            for bound, n in zip([str(b) for b in BUCKETS] + ['+Inf'], h.counts):
+                cumulative += n
+                lines.append(f'spiderfarm_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'spiderfarm_stage_seconds_sum{{stage="{stage}"}} {h.total:.6f}')
+            lines.append(f'spiderfarm_stage_seconds_count{{stage="{stage}"}} {h.count}')
+        if self.counters:
+            lines.append('# TYPE spiderfarm_events_total counter')
+            for name, value in self.counters.items():
+                lines.append(f'spiderfarm_events_total{{event="{name}"}} {value}')
+        lines.append('# HELP spiderfarm_stat Numeric Scrapy crawl stats.')
+        lines.append('# TYPE spiderfarm_stat gauge')
+        for name, value in crawl_stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and not name.startswith('metrics/'):
+                name = name.replace('\\', '\\\\').replace('"', '\\"')
+                lines.append(f'spiderfarm_stat{{name="{name}"}} {value}')
+        return '\n'.join(lines) + '\n'
@@ -3,11 +3,24 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import logging
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
 from scrapy import signals
+from scrapy.exceptions import NotConfigured, StopDownload
+from scrapy.http import HtmlResponse
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
 
+from spiderfarm.metrics import CrawlMetrics
+from spiderfarm.pagepool import PlaywrightPagePool
+import helpers
+
+logger = logging.getLogger(__name__)
+
 
 class SpiderfarmSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
@@ -53,48 +66,423 @@ class SpiderfarmSpiderMiddleware:
         spider.logger.info("Spider opened: %s" % spider.name)
 
 
+class DomainThrottle:
+    """AIMD state for one downloader slot (domain)."""
+    def __init__(self, concurrency, delay):
+        self.concurrency = float(max(1, concurrency))
+        self.delay = delay
+        self.latency = None # EWMA of download latency
+        self.baseline = None # fastest EWMA seen, the healthy reference
+        self.blocked_until = 0.0
+
+
 class SpiderfarmDownloaderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the downloader middleware does not modify the
-    # passed objects.
+    """
+    Adaptive per-domain concurrency controller (ADAPTIVE_CONCURRENCY_ENABLED).
+    Each downloader slot starts at CONCURRENT_REQUESTS_PER_DOMAIN / DOWNLOAD_DELAY and is tuned AIMD-style:
+    - healthy responses shrink the delay towards ADAPTIVE_MIN_DELAY, then add about one request of
+      concurrency per round trip, up to ADAPTIVE_MAX_CONCURRENCY
+    - 429/503 (and other 5xx or timeouts) halve concurrency, or double the delay once concurrency is 1,
+      and Retry-After holds the slot for the requested time (capped at ADAPTIVE_MAX_DELAY)
+    - latency rising past ADAPTIVE_LATENCY_FACTOR times the domain's baseline backs off gently
+    Decisions are recorded in the crawl stats under adaptive/<domain>/.
+    Replaces AutoThrottle, which would fight over the same slot delay.
+    """
+    BACKOFF_CODES = (429, 503)
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        settings = crawler.settings
+        self.min_delay = settings.getfloat('ADAPTIVE_MIN_DELAY', 0.25)
+        self.max_delay = settings.getfloat('ADAPTIVE_MAX_DELAY', 60)
+        self.max_concurrency = settings.getint('ADAPTIVE_MAX_CONCURRENCY', 8)
+        self.latency_factor = settings.getfloat('ADAPTIVE_LATENCY_FACTOR', 3.0)
+        self.domains = {}
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
-        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        if not crawler.settings.getbool('ADAPTIVE_CONCURRENCY_ENABLED'):
+            raise NotConfigured
+        if crawler.settings.getbool('AUTOTHROTTLE_ENABLED'):
+            logger.warning("AUTOTHROTTLE_ENABLED and ADAPTIVE_CONCURRENCY_ENABLED both adjust download delays; disable one of them")
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def process_response(self, request, response, spider=None):
+        if 'cached' in response.flags:
+            return response
+        slot_key, slot = self.get_slot(request)
+        if slot is None:
+            return response
+        throttle = self.throttle_for(slot_key, slot)
+        if response.status in self.BACKOFF_CODES:
+            retry_after = self.retry_after(response)
+            self.backoff(slot_key, throttle, f"HTTP {response.status}", hold=retry_after)
+        elif response.status >= 500:
+            self.backoff(slot_key, throttle, f"HTTP {response.status}")
+        else:
+            self.observe_latency(slot_key, throttle, request.meta.get('download_latency'))
+        self.apply(slot_key, throttle, slot)
+        return response
+
+    def process_exception(self, request, exception, spider=None):
+        slot_key, slot = self.get_slot(request)
+        if slot is None:
+            return None
+        throttle = self.throttle_for(slot_key, slot)
+        self.backoff(slot_key, throttle, type(exception).__name__)
+        self.apply(slot_key, throttle, slot)
+        return None
+
+    def get_slot(self, request):
+        downloader = self.crawler.engine.downloader
+        slot_key = downloader.get_slot_key(request)
+        return slot_key, downloader.slots.get(slot_key)
+
+    def throttle_for(self, slot_key, slot):
+        throttle = self.domains.get(slot_key)
+        if throttle is None:
+            # start from the slot's configured values (spiders may override them, e.g. the status lane)
+            throttle = self.domains[slot_key] = DomainThrottle(slot.concurrency, slot.delay)
+        return throttle
+
+    def observe_latency(self, slot_key, throttle, latency):
+        if latency is None:
+            return
+        throttle.latency = latency if throttle.latency is None else 0.7 * throttle.latency + 0.3 * latency
+        throttle.baseline = throttle.latency if throttle.baseline is None else min(throttle.baseline, throttle.latency)
+        # ignore sub-second jitter on fast hosts
+        if throttle.latency > throttle.baseline * self.latency_factor and throttle.latency - throttle.baseline > 0.5:
+            self.backoff(slot_key, throttle, 'latency', factor=0.75)
+            # re-anchor so one slow stretch doesn't keep backing off
+            throttle.latency = (throttle.latency + throttle.baseline) / 2
+            return
+        if time.time() < throttle.blocked_until:
+            return
+        if throttle.delay > self.min_delay:
+            throttle.delay = max(self.min_delay, throttle.delay * 0.8)
+        elif throttle.concurrency < self.max_concurrency:
+            # additive increase: roughly +1 concurrent request per round of responses
+            throttle.concurrency = min(self.max_concurrency, throttle.concurrency + 1 / throttle.concurrency)
+        else:
+            return
+        self.stats.inc_value(f'adaptive/{slot_key}/increase')
+
+    def backoff(self, slot_key, throttle, reason, hold=None, factor=0.5):
+        if throttle.concurrency > 1:
+            throttle.concurrency = max(1.0, throttle.concurrency * factor)
+        else:
+            throttle.delay = min(self.max_delay, max(throttle.delay / factor, self.min_delay, 0.5))
+        if hold:
+            hold = min(hold, self.max_delay)
+            throttle.delay = max(throttle.delay, hold)
+            throttle.blocked_until = time.time() + hold
+            self.stats.inc_value(f'adaptive/{slot_key}/retry_after')
+        self.stats.inc_value(f'adaptive/{slot_key}/backoff')
+        logger.info(f"BACKOFF: {slot_key} ({reason}) -> concurrency {int(throttle.concurrency)}, delay {throttle.delay:.2f}s")
+
+    def apply(self, slot_key, throttle, slot):
+        slot.concurrency = int(throttle.concurrency)
+        slot.delay = throttle.delay
+        self.stats.set_value(f'adaptive/{slot_key}/concurrency', slot.concurrency)
+        self.stats.set_value(f'adaptive/{slot_key}/delay', round(slot.delay, 2))
+        self.stats.max_value(f'adaptive/{slot_key}/max_concurrency', slot.concurrency)
+
+    @staticmethod
+    def retry_after(response):
+        """Seconds requested by a Retry-After header (delta-seconds or HTTP date), or None."""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        value = value.decode('latin-1').strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    def spider_closed(self, spider):
+        for slot_key, throttle in self.domains.items():
+            spider.logger.info(f"ADAPTIVE: {slot_key} settled at concurrency {int(throttle.concurrency)}, delay {throttle.delay:.2f}s")
+
+
+class HybridFetchMiddleware:
+    """
+    Hybrid fetch mode (FETCH_MODE = 'hybrid').
+    Pages are fetched with Scrapy's plain HTTP handler first and only re-queued through
+    scrapy-playwright when one of the escalation rules fires:
+    - no_jsonld: the raw HTML has no structured data (ld+json blocks, Microdata or RDFa items)
+    - empty_container: the --ctag container holds no target links
+    - js_shell: the page has almost no visible text (client-side rendered shell)
+    Rules come from HYBRID_ESCALATE_ON, or the spider's `hybrid_rules` when unset.
+    Spiders without `hybrid_rules` are never escalated.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.enabled = crawler.settings.get('FETCH_MODE', 'playwright') == 'hybrid'
+        self.rules = crawler.settings.getlist('HYBRID_ESCALATE_ON')
+        self.min_text_length = crawler.settings.getint('HYBRID_MIN_TEXT_LENGTH', 250)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def process_response(self, request, response, spider=None):
+        spider = spider or self.crawler.spider
+        if not self.enabled or request.meta.get('playwright'):
+            return response
+        rules = self.rules or getattr(spider, 'hybrid_rules', None)
+        if not rules or response.status != 200 or not isinstance(response, HtmlResponse):
+            return response
+        reason = self.escalation_reason(spider, response, rules)
+        if not reason:
+            self.stats.inc_value('hybrid/http_only')
+            return response
+        self.stats.inc_value('hybrid/escalated')
+        self.stats.inc_value(f'hybrid/escalated/{reason}')
+        spider.logger.debug(f"ESCALATED: {response.url} - {reason}, re-queued through playwright")
+        return request.replace(
+            meta={**request.meta, **helpers.playwright_meta()},
+            dont_filter=True,
+        )
+
+    def escalation_reason(self, spider, response, rules):
+        """Return the first rule that fires for the raw response, or None."""
+        for rule in rules:
+            if rule == 'no_jsonld':
+                if not response.xpath('//script[@type="application/ld+json"] | //*[@itemscope or @typeof]'):
+                    return rule
+            elif rule == 'empty_container':
+                if getattr(spider, 'ctag', None):
+                    container_xpath = helpers.get_container_xpath(spider)
+                    if not response.xpath(f'{container_xpath}//{spider.tag}[@{spider.attr}]'):
+                        return rule
+            elif rule == 'js_shell':
+                texts = response.xpath('//body//text()[not(ancestor::script or ancestor::style or ancestor::noscript)]').getall()
+                if sum(len(t.strip()) for t in texts) < self.min_text_length:
+                    return rule
+        return None
+
+    def spider_closed(self, spider):
+        if not self.enabled:
+            return
+        spider.logger.info(
+            "HYBRID FETCH: %d pages escalated to playwright, %d served by plain HTTP",
+            self.stats.get_value('hybrid/escalated', 0),
+            self.stats.get_value('hybrid/http_only', 0),
+        )
+
+
+class PageLifecycleSpiderMiddleware:
+    """
+    Closes (or returns to the pool) the playwright page attached to a response
+    once its callback output has been fully consumed, including when the callback raises.
+    Download errors are handled by the spiders' errbacks, which release the page the same way.
+    """
+
+    def __init__(self, crawler):
+        self.pool = PlaywrightPagePool.from_crawler(crawler)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    async def process_spider_output(self, response, result, spider=None):
+        try:
+            async for item_or_request in result:
+                yield item_or_request
+        finally:
+            await self.pool.release(response.meta)
+
+
+class PagePoolDownloaderMiddleware:
+    """
+    Hands an idle pooled page to playwright requests so scrapy-playwright reuses it
+    instead of opening a new one (see PlaywrightPagePool).
+    A retried copy of a request still carries the page handed to the failed attempt; that page
+    goes back through the pool (or is closed) instead of being reused as is.
+    """
+
+    def __init__(self, crawler):
+        self.pool = PlaywrightPagePool.from_crawler(crawler)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    async def process_request(self, request, spider=None):
+        meta = request.meta
+        if meta.get('playwright_pooled_page') and meta.get('playwright_page') is not None:
+            self.pool.stats.inc_value('playwright_pool/retried')
+            await self.pool.release(meta)
+        if not self.pool.size or not meta.get('playwright') or meta.get('playwright_page'):
+            return None
+        page = self.pool.acquire(meta.get('playwright_context', 'default'))
+        if page is not None:
+            meta['playwright_page'] = page
+            meta['playwright_pooled_page'] = True
+        return None
+
+
+class StatusCheckMiddleware:
+    """
+    Status-check lane for requests flagged with meta['status_check'] (XMLSpider).
+    - the download is cut off as soon as the response headers arrive, so no body is transferred
+    - HEAD requests answered with 405/501 are retried once as a GET (also cut off after headers)
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler)
+        crawler.signals.connect(s.headers_received, signal=signals.headers_received)
         return s
 
-    def process_request(self, request, spider):
-        # Called for each request that goes through the downloader
-        # middleware.
+    def headers_received(self, headers, body_length, request, spider):
+        if request.meta.get('status_check'):
+            raise StopDownload(fail=False)
+
+    def process_response(self, request, response, spider=None):
+        if not request.meta.get('status_check'):
+            return response
+        if request.method == 'HEAD' and response.status in (405, 501):
+            self.stats.inc_value('status_check/get_fallback')
+            return request.replace(method='GET', dont_filter=True)
+        self.stats.inc_value(f'status_check/{request.method.lower()}')
+        return response
+
+
+class CacheRevalidationMiddleware:
+    """
+    Revalidates cached playwright pages over plain HTTP (runs after HttpCacheMiddleware).
+    When HttpCacheMiddleware has a stale cached response for a playwright request, the
+    conditional request (If-None-Match / If-Modified-Since) is sent without the browser:
+    - 304: HttpCacheMiddleware serves the cached rendered DOM into the normal callback
+    - anything else: the page changed, so the request is re-queued for a full playwright render
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
 
-        # Must either:
-        # - return None: continue processing this request
-        # - or return a Response object
-        # - or return a Request object
-        # - or raise IgnoreRequest: process_exception() methods of
-        #   installed downloader middleware will be called
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('HTTPCACHE_ENABLED'):
+            raise NotConfigured
+        return cls(crawler)
+
+    def process_request(self, request, spider=None):
+        if 'cached_response' not in request.meta or not request.meta.get('playwright'):
+            return None
+        if request.meta.get('httpcache_render'):
+            # full render of a changed page; the browser must not see the validators
+            request.headers.pop(b'If-None-Match', None)
+            request.headers.pop(b'If-Modified-Since', None)
+            return None
+        request.meta['playwright'] = False
+        request.meta['httpcache_validating'] = True
         return None
 
-    def process_response(self, request, response, spider):
-        # Called with the response returned from the downloader.
+    def process_response(self, request, response, spider=None):
+        if not request.meta.pop('httpcache_validating', False):
+            return response
+        # back to a rendered request so the cache entry is refreshed under the rendered key
+        request.meta['playwright'] = True
+        if response.status == 304 or response.status >= 500:
+            # unchanged (or origin error): HttpCacheMiddleware answers from the cached render
+            self.stats.inc_value('httpcache/render_skipped')
+            return response
+        self.stats.inc_value('httpcache/rerender')
+        meta = {k: v for k, v in request.meta.items() if k != 'cached_response'}
+        meta.update(playwright=True, httpcache_render=True)
+        return request.replace(meta=meta, dont_filter=True)
+
+    def process_exception(self, request, exception, spider=None):
+        # restore the render flag so retries of a failed validation don't skip the browser
+        if request.meta.pop('httpcache_validating', False):
+            request.meta['playwright'] = True
+        return None
+
+
+class MetricsDownloaderMiddleware:
+    """
+    Records download time per response (METRICS_ENABLED): 'render' for playwright requests,
+    'download' for plain HTTP, using the latency Scrapy measures for each request.
+    """
 
-        # Must either;
-        # - return a Response object
-        # - return a Request object
-        # - or raise IgnoreRequest
+    def __init__(self, crawler):
+        self.metrics = CrawlMetrics.from_crawler(crawler)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        return cls(crawler)
+
+    def process_response(self, request, response, spider=None):
+        if 'cached' in response.flags:
+            self.metrics.inc('cache_hits')
+            return response
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            self.metrics.observe('render' if request.meta.get('playwright') else 'download', latency)
         return response
 
-    def process_exception(self, request, exception, spider):
-        # Called when a download handler or a process_request()
-        # (from other downloader middleware) raises an exception.
+    def process_exception(self, request, exception, spider=None):
+        self.metrics.inc(f'download_errors/{type(exception).__name__}')
+        return None
+
 
-        # Must either:
-        # - return None: continue processing this exception
-        # - return a Response object: stops process_exception() chain
-        # - return a Request object: stops process_exception() chain
-        pass
+class MetricsSpiderMiddleware:
+    """
+    Times spider callbacks (METRICS_ENABLED): the time spent inside the callback while it produces
+    items and requests is recorded as 'callback/<spider name>.<callback name>'.
+    Sits closest to the spider so downstream middleware and pipeline time isn't counted.
+    """
 
-    def spider_opened(self, spider):
-        spider.logger.info("Spider opened: %s" % spider.name)
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.metrics = CrawlMetrics.from_crawler(crawler)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        return cls(crawler)
+
+    def stage(self, response, spider):
+        callback = response.request.callback if response.request is not None else None
+        name = getattr(callback, '__name__', 'parse')
+        return f"callback/{spider.name}.{name}"
+
+    def process_spider_output(self, response, result, spider=None):
+        spider = spider or self.crawler.spider
+        elapsed = 0.0
+        start = time.perf_counter()
+        for item in result:
+            elapsed += time.perf_counter() - start
+            yield item
+            start = time.perf_counter()
+        elapsed += time.perf_counter() - start
+        self.metrics.observe(self.stage(response, spider), elapsed)
+
+    async def process_spider_output_async(self, response, result, spider=None):
+        spider = spider or self.crawler.spider
+        elapsed = 0.0
+        start = time.perf_counter()
+        async for item in result:
+            elapsed += time.perf_counter() - start
+            yield item
+            start = time.perf_counter()
+        elapsed += time.perf_counter() - start
+        self.metrics.observe(self.stage(response, spider), elapsed)
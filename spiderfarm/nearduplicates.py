@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+# spiderfarm/nearduplicates.py
+import re
+from array import array
+from collections import Counter
+from hashlib import blake2b
+from urllib.parse import urlsplit
+
+from lxml import etree
+
+import helpers
+
+# actions for links of patterns that keep producing near-duplicates
+MARK = 'mark'
+DEPRIORITIZE = 'deprioritize'
+SKIP = 'skip'
+ACTIONS = (MARK, DEPRIORITIZE, SKIP)
+
+# visible text without scripts and site-wide boilerplate (navigation, header, footer, sidebars)
+TEXT_FILTER = 'text()[not(ancestor::script or ancestor::style or ancestor::noscript or ancestor::nav or ancestor::header or ancestor::footer or ancestor::aside)]'
+PAGE_TEXT = etree.XPath(f'//body//{TEXT_FILTER}')
+
+TOKENS = re.compile(r'\w+')
+NUMERIC_SEGMENT = re.compile(r'^\d+$|^[0-9a-f]{8,}$|.*\d{4,}.*')
+# hyphen/underscore-joined words: product, article and facet slugs (color-red, nike-air-max)
+SLUG_SEGMENT = re.compile(r'^[^\W_]+(?:[-_][^\W_]+)+(?:\.\w+)?$')
+
+# byte values with each bit set, to turn per-byte weight tables into the 64 SimHash bit sums
+BIT_VALUES = [[value for value in range(256) if value & (1 << bit)] for bit in range(8)]
+
+
+def simhash(features):
+    """64-bit SimHash of weighted features (feature -> weight)."""
+    tables = [[0] * 256 for _ in range(8)]
+    total = 0
+    for feature, weight in features.items():
+        for table, byte in zip(tables, blake2b(feature.encode('utf-8'), digest_size=8).digest()):
+            table[byte] += weight
+        total += weight
+    fp = 0
+    for i, table in enumerate(tables):
+        for bit, values in enumerate(BIT_VALUES):
+            if 2 * sum(table[v] for v in values) > total:
+                fp |= 1 << (i * 8 + bit)
+    return fp
+
+
+def url_pattern(url):
+    """
+    URL template shared by facet, sort and tracking variants of a page: numeric or id-like path
+    segments become {n}, slugs {s} and any query string ?*
+    (/shoes/123/color-red?sort=price -> host/shoes/{n}/{s}?*).
+    """
+    parts = urlsplit(url)
+    segments = [
+        '{n}' if NUMERIC_SEGMENT.match(segment) else '{s}' if SLUG_SEGMENT.match(segment) else segment
+        for segment in parts.path.rstrip('/').split('/')
+    ]
+    pattern = f"{parts.hostname or ''}{'/'.join(segments)}"
+    return f"{pattern}?*" if parts.query else pattern
+
+
+class NearDuplicateDetector:
+    """
+    Content fingerprinting to stop spending renders on facet, sort and tracking variants
+    (NEAR_DUPLICATE_ACTION, '--near-duplicates').
+    Each page's main text (the --ctag container when set, otherwise the body without nav,
+    header, footer and sidebars) is reduced to a 64-bit SimHash over word 3-grams.
+    - index: fingerprints in an array, split into NEAR_DUPLICATE_DISTANCE + 1 bands so any page within
+      that Hamming distance shares at least one exact band with it (one dict lookup per band)
+    - clusters: a near-duplicate points at the first page of its cluster (duplicate_of in the output)
+    - patterns: pages and near-duplicates are counted per URL pattern; once a pattern has at least
+      NEAR_DUPLICATE_MIN_PAGES pages and NEAR_DUPLICATE_RATIO of them are near-duplicates, links to it
+      are deprioritized or skipped (mark only fills the columns); other outlinks of near-duplicate pages
+      are only ever deprioritized, so unique pages they link to are still crawled
+    The index lives in memory; a resumed crawl starts a fresh one.
+    """
+    def __init__(self, action=MARK, max_distance=3, min_pages=5, ratio=0.8, priority=-100, container_xpath=None):
+        self.action = action
+        self.max_distance = max_distance
+        self.min_pages = min_pages
+        self.ratio = ratio
+        self.priority = priority
+        self.text_xpath = etree.XPath(f'{container_xpath}//{TEXT_FILTER}') if container_xpath else PAGE_TEXT
+        bands = max_distance + 1
+        width = 64 // bands
+        self.bands = [(i * width, 64 - i * width if i == bands - 1 else width) for i in range(bands)]
+        self.band_index = [{} for _ in self.bands]
+        self.fingerprints = array('Q')
+        self.clusters = array('I')  # entry of the cluster's first page, per entry
+        self.cluster_urls = {}  # entry -> url, for cluster heads only
+        self.patterns = {}  # pattern -> [pages, near-duplicates]
+        self.flagged = set()
+
+    @classmethod
+    def from_spider(cls, spider, settings=None):
+        """The spider's detector, or None when NEAR_DUPLICATE_ACTION is off."""
+        settings = settings or spider.settings
+        action = (settings.get('NEAR_DUPLICATE_ACTION') or 'off').lower()
+        if action == 'off':
+            return None
+        if action not in ACTIONS:
+            raise ValueError(f"Invalid near-duplicate action: {action}. Use off or one of: {', '.join(ACTIONS)}")
+        return cls(
+            action=action,
+            max_distance=settings.getint('NEAR_DUPLICATE_DISTANCE', 3),
+            min_pages=settings.getint('NEAR_DUPLICATE_MIN_PAGES', 5),
+            ratio=settings.getfloat('NEAR_DUPLICATE_RATIO', 0.8),
+            priority=settings.getint('NEAR_DUPLICATE_PRIORITY', -100),
+            container_xpath=helpers.get_container_xpath(spider) if spider.ctag else None,
+        )
+
+    def fingerprint(self, response):
+        """SimHash of the page's main text, or None when there is too little text to compare."""
+        tokens = TOKENS.findall(' '.join(self.text_xpath(response.selector.root)).lower())
+        if len(tokens) < 3:
+            return None
+        return simhash(Counter(' '.join(shingle) for shingle in zip(tokens, tokens[1:], tokens[2:])))
+
+    def band_keys(self, fp):
+        return [(fp >> start) & ((1 << width) - 1) for start, width in self.bands]
+
+    def find(self, fp, keys):
+        for index, key in zip(self.band_index, keys):
+            for entry in index.get(key, ()):
+                if (self.fingerprints[entry] ^ fp).bit_count() <= self.max_distance:
+                    return entry
+        return None
+
+    def observe(self, url, response):
+        """
+        Fingerprint a page and add it to the index.
+        Returns (fingerprint, duplicate_of): fingerprint is None for pages without enough text,
+        duplicate_of is the URL of the cluster's first page when the page is a near-duplicate.
+        """
+        fp = self.fingerprint(response)
+        if fp is None:
+            return None, None
+        keys = self.band_keys(fp)
+        match = self.find(fp, keys)
+        entry = len(self.fingerprints)
+        self.fingerprints.append(fp)
+        for index, key in zip(self.band_index, keys):
+            index.setdefault(key, []).append(entry)
+        pattern = url_pattern(url)
+        counts = self.patterns.setdefault(pattern, [0, 0])
+        counts[0] += 1
+        if match is None:
+            self.clusters.append(entry)
+            self.cluster_urls[entry] = url
+            duplicate_of = None
+        else:
+            head = self.clusters[match]
+            self.clusters.append(head)
+            duplicate_of = self.cluster_urls[head]
+            counts[1] += 1
+        if counts[0] >= self.min_pages and counts[1] >= self.ratio * counts[0]:
+            self.flagged.add(pattern)
+        return fp, duplicate_of
+
+    def link_action(self, url, from_duplicate=False):
+        """
+        The configured action for a link to a flagged pattern; DEPRIORITIZE for other links
+        found on a near-duplicate page; else None.
+        """
+        if self.action == MARK:
+            return None
+        if self.flagged and url_pattern(url) in self.flagged:
+            return self.action
+        if from_duplicate:
+            return DEPRIORITIZE
+        return None
+
+    def summary(self):
+        clusters = len(self.cluster_urls)
+        return {
+            'pages': len(self.fingerprints),
+            'clusters': clusters,
+            'duplicates': len(self.fingerprints) - clusters,
+            'flagged_patterns': len(self.flagged),
+        }
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# spiderfarm/pagepool.py
+from collections import defaultdict, deque
+from scrapy import signals
+
+# request meta keys holding a live page for one download; they can't be serialized or carried to another download
+PAGE_META = ('playwright_page', 'playwright_pooled_page')
+
+
+class PlaywrightPagePool:
+    """
+    Bounded per-context pool of warm playwright pages, shared by one crawler.
+    Released pages are parked on about:blank and handed to the next playwright
+    request for the same context instead of opening a new page. Pages beyond
+    PLAYWRIGHT_PAGE_POOL_SIZE, or used PLAYWRIGHT_PAGE_MAX_USES times, are closed.
+    A pool size of 0 disables reuse and every page is closed after its callback.
+    """
+    def __init__(self, stats, size=0, max_uses=50):
+        self.stats = stats
+        self.size = size
+        self.max_uses = max_uses
+        self.idle = defaultdict(deque) # context name -> idle pages
+        self.uses = {} # page -> number of requests served
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        # one pool per crawler, shared by the downloader middleware, spider middleware and errbacks
+        pool = getattr(crawler, 'playwright_page_pool', None)
+        if pool is None:
+            pool = cls(
+                crawler.stats,
+                size=crawler.settings.getint('PLAYWRIGHT_PAGE_POOL_SIZE', 0),
+                max_uses=crawler.settings.getint('PLAYWRIGHT_PAGE_MAX_USES', 50),
+            )
+            crawler.playwright_page_pool = pool
+            crawler.signals.connect(pool.close, signal=signals.spider_closed)
+        return pool
+
+    def acquire(self, context):
+        """Pop an idle page for the context, or None if a new page should be created."""
+        idle = self.idle[context]
+        while idle:
+            page = idle.popleft()
+            if not page.is_closed():
+                self.stats.inc_value('playwright_pool/reused')
+                return page
+            self.uses.pop(page, None)
+        return None
+
+    async def release(self, meta):
+        """Return the page attached to a request/response meta to the pool, or close it."""
+        page = meta.pop('playwright_page', None)
+        meta.pop('playwright_pooled_page', None)
+        if page is None or page.is_closed():
+            self.uses.pop(page, None)
+            return
+        context = meta.get('playwright_context', 'default')
+        uses = self.uses.get(page, 0) + 1
+        if self.size and uses < self.max_uses and len(self.idle[context]) < self.size:
+            try:
+                # drop the previous DOM so parked pages stay light
+                await page.goto('about:blank')
+            except Exception:
+                await self.close_page(page)
+                return
+            self.uses[page] = uses
+            self.idle[context].append(page)
+            self.stats.inc_value('playwright_pool/returned')
+            return
+        await self.close_page(page)
+
+    async def close_page(self, page):
+        self.uses.pop(page, None)
+        if not page.is_closed():
+            try:
+                await page.close()
+            except Exception:
+                pass
+        self.stats.inc_value('playwright_pool/closed')
+
+    async def close(self, spider):
+        for idle in self.idle.values():
+            while idle:
+                await self.close_page(idle.popleft())
@@ -3,11 +3,158 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
+import json
+import os
+import tempfile
+from pathlib import Path
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+from scrapy import signals
+
+from spiderfarm import sinks
+from spiderfarm.extensions import checkpoint_reached
+from spiderfarm.metrics import CrawlMetrics
+import helpers
 
 
 class SpiderfarmPipeline:
-    def process_item(self, item, spider):
+    """
+    Streaming item sink.
+    Items are written to disk in buffered batches as they are scraped instead of
+    being held in memory until the spider closes.
+    - AUTO_SAVE: rows go straight into the final output file (OUTPUT_FORMAT)
+    - otherwise: rows are spooled to a temporary CSV and handed to the view/save menu on close
+    - JOBDIR (--resume): the output path is recorded in the job directory and appended to on resume;
+      a paused crawl keeps its partial output and skips the view/save step until it finishes
+    """
+    def __init__(self, crawler):
+        self.crawler = crawler
+        settings = crawler.settings
+        self.auto_save = settings.getbool('AUTO_SAVE', False)
+        self.auto_view = settings.getbool('AUTO_VIEW', False)
+        self.output_filename = settings.get('OUTPUT_FILENAME')
+        self.output_format = settings.get('OUTPUT_FORMAT', 'csv').lower()
+        self.output_dir = settings.get('OUTPUT_DIR') or Path.home()
+        self.batch_size = settings.getint('OUTPUT_BATCH_SIZE', 500)
+        self.jobdir = settings.get('JOBDIR')
+        self.metrics = CrawlMetrics.from_crawler(crawler)
+        self.sink = None
+        self.sink_closed = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        o = cls(crawler)
+        crawler.signals.connect(o.checkpoint, signal=checkpoint_reached)
+        crawler.signals.connect(o.spider_closed, signal=signals.spider_closed)
+        return o
+
+    @property
+    def output_state_path(self):
+        return Path(self.jobdir) / 'output.json'
+
+    def load_output_state(self):
+        if not self.jobdir or not self.output_state_path.exists():
+            return None
+        with open(self.output_state_path, encoding='utf-8') as f:
+            state = json.load(f)
+        if not Path(state['file_path']).exists():
+            return None
+        return state
+
+    def save_output_state(self):
+        # the final state is saved by close_spider, just before the sink is closed
+        if not self.jobdir or self.sink is None or self.sink_closed:
+            return
+        state = {'file_path': str(self.sink.file_path), 'row_count': self.sink.row_count, 'position': self.sink.position()}
+        tmp_path = self.output_state_path.with_name('output.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.output_state_path)
+
+    # the spider argument is optional on newer Scrapy versions; fall back to the crawler's spider
+    def open_spider(self, spider=None):
+        spider = spider or self.crawler.spider
+        if self.jobdir and self.auto_save and self.output_format == 'parquet':
+            # a killed crawl leaves a parquet file without its footer, which can't be read back on resume
+            raise ValueError("The parquet output format can't be used with resumable crawls (JOBDIR) - use csv, jsonl or sqlite")
+        seed_url = spider.start_urls[0] if spider.start_urls else None
+        resumed = self.load_output_state()
+        if resumed:
+            sink_class = sinks.SINKS.get(self.output_format) if self.auto_save else sinks.CsvSink
+            file_path = Path(resumed['file_path'])
+            # rows flushed after the checkpoint belong to requests that are fetched again on resume
+            if resumed.get('position') is not None:
+                sink_class.truncate(file_path, resumed['position'])
+        elif self.auto_save:
+            sink_class = sinks.SINKS.get(self.output_format)
+            if sink_class is None:
+                raise ValueError(f"Invalid output format: {self.output_format}. Use one of: {', '.join(sinks.SINKS)}")
+            file_name = helpers.resolve_output_filename(
+                self.output_filename,
+                seed_url=seed_url,
+                spider_name=spider.name,
+                extension=sink_class.extension,
+            )
+            file_path = Path(self.output_dir) / file_name
+        else:
+            sink_class = sinks.CsvSink
+            # resumable crawls spool into the job directory so the partial results outlive the process
+            fd, spool_path = tempfile.mkstemp(prefix=f"{spider.name}_", suffix=sink_class.extension, dir=self.jobdir)
+            os.close(fd)
+            file_path = Path(spool_path)
+        self.sink = sink_class(
+            file_path,
+            fields=getattr(spider, 'output_fields', None),
+            headers=getattr(spider, 'output_headers', None),
+            batch_size=self.batch_size,
+            append=bool(resumed),
+        )
+        if resumed:
+            self.sink.row_count = resumed.get('row_count', 0)
+            spider.logger.info(f"RESUMING OUTPUT: {file_path} ({self.sink.row_count} rows)")
+        else:
+            spider.logger.info(f"STREAMING OUTPUT: {file_path}")
+        self.save_output_state()
+
+    def process_item(self, item, spider=None):
+        with self.metrics.timer('output'):
+            self.sink.write(ItemAdapter(item).asdict())
         return item
+
+    def checkpoint(self, spider):
+        # the extension's final checkpoint arrives after close_spider
+        if self.sink is not None and not self.sink_closed:
+            self.sink.flush()
+            self.save_output_state()
+
+    def close_spider(self, spider=None):
+        if self.sink is not None:
+            self.sink.flush()
+            self.save_output_state()
+            self.sink.close()
+            self.sink_closed = True
+
+    def spider_closed(self, spider, reason):
+        # runs after close_spider, once the close reason is known
+        if self.sink is None:
+            return
+        if self.jobdir:
+            if reason != 'finished':
+                spider.logger.info(f"Crawl paused ({reason}), {self.sink.row_count} rows kept in {self.sink.file_path}. Run again with --resume {self.jobdir} to continue.")
+                return
+            self.output_state_path.unlink(missing_ok=True)
+        if not self.sink.row_count:
+            spider.logger.info("No data scraped.")
+            os.remove(self.sink.file_path)
+            return
+        helpers.data_handling_options(
+            self.sink.file_path,
+            self.sink.headers,
+            self.sink.row_count,
+            auto_view=self.auto_view,
+            auto_save=self.auto_save,
+            output_filename=self.output_filename,
+            seed_url=spider.start_urls[0] if spider.start_urls else None,
+            spider_name=spider.name,
+        )
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+# spiderfarm/seenstore.py
+import hashlib
+import logging
+import math
+import os
+import shutil
+import sqlite3
+import tempfile
+from pathlib import Path
+from scrapy.dupefilters import BaseDupeFilter
+from spiderfarm import distributed
+from spiderfarm.canonical import UrlCanonicalizer
+from spiderfarm.extensions import checkpoint_reached
+
+
+def fingerprint(key):
+    """Fixed-width 64-bit fingerprint of a URL (or any string key)."""
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+
+class SeenStore:
+    """
+    Shared dedup interface used by the spiders for visited/seen URLs.
+    - add(key): record a key, returns True if it was not seen before
+    - key in store: membership check
+    """
+    def add(self, key):
+        raise NotImplementedError
+
+    def __contains__(self, key):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FingerprintSeenStore(SeenStore):
+    """In-memory set of 64-bit fingerprints instead of full URL strings."""
+    def __init__(self, name=None, settings=None):
+        self.seen = set()
+
+    def add(self, key):
+        fp = fingerprint(key)
+        if fp in self.seen:
+            return False
+        self.seen.add(fp)
+        return True
+
+    def __contains__(self, key):
+        return fingerprint(key) in self.seen
+
+    def __len__(self):
+        return len(self.seen)
+
+
+class BloomSeenStore(SeenStore):
+    """
+    Fixed-size Bloom filter sized from SEEN_STORE_BLOOM_CAPACITY and SEEN_STORE_BLOOM_ERROR_RATE.
+    Memory does not grow with the crawl; a false positive skips a URL that was never seen.
+    """
+    def __init__(self, name=None, settings=None):
+        capacity = settings.getint('SEEN_STORE_BLOOM_CAPACITY', 10_000_000) if settings else 10_000_000
+        error_rate = settings.getfloat('SEEN_STORE_BLOOM_ERROR_RATE', 0.001) if settings else 0.001
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def positions(self, key):
+        # double hashing over one 128-bit digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        new = False
+        for pos in self.positions(key):
+            byte, bit = divmod(pos, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def __contains__(self, key):
+        return all(self.bits[pos // 8] & (1 << (pos % 8)) for pos in self.positions(key))
+
+    def __len__(self):
+        return self.count
+
+
+class SqliteSeenStore(SeenStore):
+    """
+    On-disk fingerprint store for crawls that exceed RAM.
+    Files go to SEEN_STORE_DIR and are kept; without it a temporary directory is used and removed on close.
+    """
+    def __init__(self, name='seen', settings=None):
+        store_dir = settings.get('SEEN_STORE_DIR') if settings else None
+        self.temp_dir = None
+        if not store_dir:
+            store_dir = self.temp_dir = tempfile.mkdtemp(prefix='spiderfarm_seen_')
+        os.makedirs(store_dir, exist_ok=True)
+        self.path = Path(store_dir) / f"{name}.sqlite"
+        self.commit_every = settings.getint('SEEN_STORE_COMMIT_EVERY', 1000) if settings else 1000
+        self.pending = 0
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS seen (fp INTEGER PRIMARY KEY) WITHOUT ROWID')
+
+    def add(self, key):
+        cursor = self.conn.execute('INSERT OR IGNORE INTO seen (fp) VALUES (?)', (fingerprint(key),))
+        if cursor.rowcount:
+            self.pending += 1
+            if self.pending >= self.commit_every:
+                self.conn.commit()
+                self.pending = 0
+            return True
+        return False
+
+    def __contains__(self, key):
+        return self.conn.execute('SELECT 1 FROM seen WHERE fp = ?', (fingerprint(key),)).fetchone() is not None
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM seen').fetchone()[0]
+
+    def flush(self):
+        # the final checkpoint can arrive after the store was closed with its spider
+        if self.conn is None:
+            return
+        self.conn.commit()
+        self.pending = 0
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+        self.conn = None
+        if self.temp_dir:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+class DistributedSeenStore(SeenStore):
+    """
+    Seen-set shared by every node of a distributed crawl, kept in its DISTRIBUTED_BACKEND
+    (see spiderfarm.distributed); a key added by one node is seen by all of them.
+    """
+    def __init__(self, name='seen', settings=None):
+        self.name = name
+        self.backend = distributed.backend_from_settings(settings)
+
+    def add(self, key):
+        return self.backend.seen_add(self.name, fingerprint(key).to_bytes(8, 'big', signed=True))
+
+    def __contains__(self, key):
+        return self.backend.seen_contains(self.name, fingerprint(key).to_bytes(8, 'big', signed=True))
+
+    def __len__(self):
+        return self.backend.seen_size(self.name)
+
+    def close(self):
+        self.backend.close()
+
+
+SEEN_STORES = {
+    'fingerprint': FingerprintSeenStore,
+    'bloom': BloomSeenStore,
+    'sqlite': SqliteSeenStore,
+    'distributed': DistributedSeenStore,
+}
+
+def open_seen_store(crawler, name):
+    """
+    Create the seen-store selected by the SEEN_STORE setting.
+    The store is flushed on every checkpoint of a resumable crawl.
+    """
+    settings = crawler.settings
+    store_type = settings.get('SEEN_STORE', 'fingerprint').lower()
+    store_class = SEEN_STORES.get(store_type)
+    if store_class is None:
+        raise ValueError(f"Invalid seen store: {store_type}. Use one of: {', '.join(SEEN_STORES)}")
+    store = store_class(name=name, settings=settings)
+    crawler.signals.connect(store.flush, signal=checkpoint_reached, weak=False)
+    return store
+
+
+class SeenStoreDupeFilter(BaseDupeFilter):
+    """
+    Scrapy request dupefilter (DUPEFILTER_CLASS) backed by the configured seen-store,
+    so the scheduler's request fingerprints follow SEEN_STORE as well.
+    Plain GET requests are deduplicated on their canonical key (see UrlCanonicalizer.key), so www,
+    trailing-slash, parameter-order and rel=canonical variants of a page are only fetched once;
+    redirects (a site moving /a to /a/ or onto www), sitemap and status-check requests (meta 'sitemap' /
+    'status_check'), spiders with canonical_dedup = False (XMLSpider) and other requests keep Scrapy's fingerprint.
+    """
+    def __init__(self, store, fingerprinter, stats=None, debug=False, canonicalizer=None):
+        self.store = store
+        self.fingerprinter = fingerprinter
+        self.canonicalizer = canonicalizer
+        self.stats = stats
+        self.debug = debug
+        self.logdupes = True
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            open_seen_store(crawler, 'requests_seen'),
+            crawler.request_fingerprinter,
+            stats=crawler.stats,
+            debug=crawler.settings.getbool('DUPEFILTER_DEBUG'),
+            canonicalizer=UrlCanonicalizer.from_crawler(crawler) if getattr(crawler.spidercls, 'canonical_dedup', True) else None,
+        )
+
+    def request_seen(self, request):
+        return not self.store.add(self.request_key(request))
+
+    def request_key(self, request):
+        meta = request.meta
+        if self.canonicalizer is not None and request.method == 'GET' and not request.body \
+                and 'redirect_times' not in meta and not meta.get('status_check') and not meta.get('sitemap'):
+            key = self.canonicalizer.key(request.url)
+            if key:
+                return f"GET {key}"
+        return self.fingerprinter.fingerprint(request).hex()
+
+    def close(self, reason):
+        self.store.close()
+
+    def log(self, request, spider):
+        if self.debug:
+            self.logger.debug(f"Filtered duplicate request: {request}")
+        elif self.logdupes:
+            self.logger.debug(f"Filtered duplicate request: {request} - no more duplicates will be shown (see DUPEFILTER_DEBUG to show all duplicates)")
+            self.logdupes = False
+        if self.stats:
+            self.stats.inc_value('dupefilter/filtered')
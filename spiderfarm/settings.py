@@ -37,6 +37,15 @@ PLAYWRIGHT_CONTEXTS = {
 PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT = 10000  # in millisecs
 # optional: limit concurrency to avoid bans
 PLAYWRIGHT_MAX_CONTEXTS = 4
+# fetch mode: 'playwright' renders every page, 'hybrid' fetches plain HTTP first and
+# escalates to playwright only when an escalation rule fires (see HybridFetchMiddleware)
+FETCH_MODE = "playwright"
+HYBRID_ESCALATE_ON = [] # empty uses each spider's defaults; options: no_jsonld, empty_container, js_shell
+HYBRID_MIN_TEXT_LENGTH = 250 # visible body text below this is treated as a JS shell
+# page lifecycle: pages are closed after each callback unless a pool size is set,
+# in which case up to N warm pages per context are reused (see PlaywrightPagePool)
+PLAYWRIGHT_PAGE_POOL_SIZE = 0
+PLAYWRIGHT_PAGE_MAX_USES = 50 # recycle pooled pages after this many requests
 
 
 """
@@ -54,6 +63,57 @@ ROBOTSTXT_OBEY = False
 #CONCURRENT_REQUESTS = 16
 CONCURRENT_REQUESTS_PER_DOMAIN = 1
 DOWNLOAD_DELAY = 2.5
+# adaptive per-domain controller (SpiderfarmDownloaderMiddleware), opt-in; the two values above are the starting
+# point for every domain, which then ramps up while healthy and backs off on 429/503, Retry-After or rising latency
+# (set AUTOTHROTTLE_ENABLED = False when enabling it)
+ADAPTIVE_CONCURRENCY_ENABLED = False
+ADAPTIVE_MIN_DELAY = 0.25
+ADAPTIVE_MAX_DELAY = 60
+ADAPTIVE_MAX_CONCURRENCY = 8
+ADAPTIVE_LATENCY_FACTOR = 3.0
+
+# optional regex rules added to the --include/--exclude link filters (see spiderfarm/urlfilter.py)
+URL_FILTER_INCLUDE_PATTERNS = []
+URL_FILTER_EXCLUDE_PATTERNS = []
+# memoized link normalization shared across pages (nav/footer links repeat on every page)
+LINK_CACHE_SIZE = 100_000
+# URL canonicalization (see spiderfarm/canonical.py); the request dupefilter dedups on canonical keys
+URL_CANONICAL_DENY_PARAMS = ['utm_*', 'gclid', 'gbraid', 'wbraid', 'dclid', 'fbclid', 'msclkid', 'yclid', 'mc_cid', 'mc_eid',
+                             '_ga', '_gl', 'igshid', 'srsltid', 'ref', 'ref_src', 'sessionid', 'jsessionid', 'phpsessid', 'sid'] # dropped from requested URLs
+URL_CANONICAL_IGNORE_PARAMS = ['sort', 'sort_by', 'sortby', 'order', 'orderby', 'order_by', 'dir', 'direction',
+                               'view', 'display', 'layout', 'list_mode'] # presentation-only, ignored in dedup keys only
+URL_CANONICAL_STRIP_WWW = True # www.example.com and example.com share dedup keys
+URL_CANONICAL_TRAILING_SLASH = True # /a/ and /a share dedup keys
+URL_CANONICAL_LOWERCASE_PATH = False # for case-insensitive servers
+URL_CANONICAL_TAG_ALIASES = False # a page's rel=canonical target is deduplicated against the page
+URL_CANONICAL_DOMAIN_RULES = {} # per-domain overrides, e.g. {'shop.com': {'ignore': ['sort', 'per_page']}}
+URL_CANONICAL_CACHE_SIZE = 100_000
+# JSON-LD blocks without target types (sitewide Organization, WebSite, BreadcrumbList...) remembered by hash and skipped
+JSONLD_CACHE_SIZE = 10_000
+
+# URL dedup store shared by the spiders and the request dupefilter (see spiderfarm/seenstore.py)
+# 'fingerprint' = in-memory 64-bit hashes, 'bloom' = fixed-size Bloom filter, 'sqlite' = on-disk
+DUPEFILTER_CLASS = "spiderfarm.seenstore.SeenStoreDupeFilter"
+SEEN_STORE = "fingerprint"
+SEEN_STORE_BLOOM_CAPACITY = 10_000_000
+SEEN_STORE_BLOOM_ERROR_RATE = 0.001
+SEEN_STORE_DIR = None # sqlite store directory; a temporary directory is used when unset
+
+# distributed crawls ('--distributed <backend>'): nodes share the request queue and seen-sets (see spiderfarm/distributed.py)
+DISTRIBUTED_BACKEND = None # redis://host:port/db (needs redis) or sqlite:///path/to/frontier.db (one machine)
+DISTRIBUTED_CRAWL_ID = None # namespace in the backend, defaults to the spider name
+DISTRIBUTED_IDLE_TIMEOUT = 60 # seconds a node waits on an empty shared queue before closing
+DISTRIBUTED_NODE_TIMEOUT = 300 # seconds without a heartbeat before a node counts as dead (killed without leaving)
+DISTRIBUTED_OUTPUT_DIR = None # node outputs, merged at the end; must be shared between machines (default: temp directory)
+
+# XMLSpider status-check lane: plain HTTP, body cut off after headers, own concurrency budget
+STATUS_CHECK_METHOD = "HEAD" # falls back to GET when HEAD is answered with 405/501
+STATUS_CHECK_CONCURRENCY = 16 # concurrent status checks per domain
+STATUS_CHECK_DELAY = 0
+
+# FeedSpider download cap: the downloaded feed body (compressed size) is held in memory before it is parsed
+FEED_DOWNLOAD_MAXSIZE = 2 * 1024 ** 3 # bytes; larger feeds are cancelled (raise it if the machine has the RAM)
+FEED_DOWNLOAD_WARNSIZE = 512 * 1024 ** 2
 
 # Disable cookies (enabled by default)
 # COOKIES_ENABLED = False
@@ -80,30 +140,74 @@ DEFAULT_REQUEST_HEADERS = {
 
 # Enable or disable spider middlewares
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
-#SPIDER_MIDDLEWARES = {
+SPIDER_MIDDLEWARES = {
 #    "spiderfarm.middlewares.SpiderfarmSpiderMiddleware": 543,
-#}
+    "spiderfarm.middlewares.PageLifecycleSpiderMiddleware": 100,
+    "spiderfarm.middlewares.MetricsSpiderMiddleware": 990, # closest to the spider, times callbacks only
+}
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
-#    "spiderfarm.middlewares.SpiderfarmDownloaderMiddleware": 543,
-#}
+DOWNLOADER_MIDDLEWARES = {
+    "spiderfarm.middlewares.SpiderfarmDownloaderMiddleware": 580, # sees raw 429/503 before RetryMiddleware
+    "spiderfarm.middlewares.HybridFetchMiddleware": 545,
+    "spiderfarm.middlewares.PagePoolDownloaderMiddleware": 950,
+    "spiderfarm.middlewares.StatusCheckMiddleware": 560,
+    "spiderfarm.middlewares.CacheRevalidationMiddleware": 905,
+    "spiderfarm.middlewares.MetricsDownloaderMiddleware": 590,
+}
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
+EXTENSIONS = {
 #    "scrapy.extensions.telnet.TelnetConsole": None,
-#}
+    "spiderfarm.extensions.CheckpointExtension": 500,
+    "spiderfarm.extensions.MetricsExporter": 510,
+}
+# resumable crawls ('--resume <dir>' sets JOBDIR); seen-stores, output and spider state are checkpointed every N seconds
+CHECKPOINT_INTERVAL = 60
+# hot-path timing ('--metrics <file>'): per-stage histograms in the crawl stats (metrics/<stage>/...),
+# written to METRICS_FILE every METRICS_INTERVAL seconds (.prom = Prometheus text, otherwise JSON)
+METRICS_ENABLED = False
+METRICS_FILE = None
+METRICS_INTERVAL = 15
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-#ITEM_PIPELINES = {
-#    "spiderfarm.pipelines.SpiderfarmPipeline": 300,
-#}
+ITEM_PIPELINES = {
+    "spiderfarm.pipelines.SpiderfarmPipeline": 300,
+}
+# streaming output; rows are flushed to disk every OUTPUT_BATCH_SIZE items
+OUTPUT_FORMAT = "csv" # csv, jsonl, sqlite or parquet (needs pyarrow), applies to '--auto save'
+OUTPUT_BATCH_SIZE = 500
+OUTPUT_DIR = None # '--auto save' target directory, defaults to the home directory
+
+# LinkSpider internal link graph ('--link-graph <dir>'): edge list, degrees, orphan and deep-page reports
+LINK_GRAPH_DIR = None
+LINK_GRAPH_DEEP_PAGE_DEPTH = 4 # pages more clicks than this from the seeds are reported as deep
+
+# sitemap-seeded frontier for LinkSpider/SchemaSpider ('--seed-sitemaps'): robots.txt sitemaps, else SITEMAP_SEED_PATHS
+SITEMAP_SEEDS_ENABLED = False
+SITEMAP_SEED_PATHS = ['/sitemap.xml', '/sitemap_index.xml', '/sitemap-index.xml', '/sitemap.xml.gz', '/wp-sitemap.xml']
+SITEMAP_LASTMOD_SINCE = None # YYYY-MM-DD; sitemap entries last modified before this are skipped ('--lastmod-since')
+
+# SchemaSpider best-first frontier: links are prioritized by how often their URL pattern yielded target types
+FRONTIER_ENABLED = True
+FRONTIER_PRIORITY_LEVELS = 10 # request priorities 0..levels (few levels keep the scheduler's per-priority queues few)
+FRONTIER_MIN_SAMPLES = 5 # pages of a pattern before its own rate is trusted (otherwise its parent pattern's)
+FRONTIER_EXPLORATION = 0.1 # share of links queued at the top priority regardless of their score
+FRONTIER_MAX_DEPTH = 3 # path segments in the most specific pattern
+
+# near-duplicate detection ('--near-duplicates'): SimHash of the page text, clustered by Hamming distance
+NEAR_DUPLICATE_ACTION = "off" # off, mark (columns only), deprioritize or skip links to near-duplicate URL patterns
+NEAR_DUPLICATE_DISTANCE = 3 # max differing bits out of 64 for two pages to be near-duplicates
+NEAR_DUPLICATE_MIN_PAGES = 5 # pages of a URL pattern seen before it can be flagged
+NEAR_DUPLICATE_RATIO = 0.8 # share of a pattern's pages that must be near-duplicates to flag it
+NEAR_DUPLICATE_PRIORITY = -100 # request priority for deprioritized links
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
+# the default throttle; turn it off when using the adaptive per-domain controller (ADAPTIVE_CONCURRENCY_ENABLED)
 AUTOTHROTTLE_ENABLED = True
 # The initial download delay
 AUTOTHROTTLE_START_DELAY = 2
@@ -120,13 +224,17 @@ RETRY_ENABLED = True
 RETRY_TIMES = 3
 RETRY_HTTP_CODES = [429, 403, 500, 502, 503, 504, 522, 524, 408]
 
-# Enable and configure HTTP caching (disabled by default)
+# Enable and configure HTTP caching (disabled by default, enable with '--cache')
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
-#HTTPCACHE_ENABLED = True
-#HTTPCACHE_EXPIRATION_SECS = 0
-#HTTPCACHE_DIR = "httpcache"
-#HTTPCACHE_IGNORE_HTTP_CODES = []
-#HTTPCACHE_STORAGE = "scrapy.extensions.httpcache.FilesystemCacheStorage"
+# RFC2616Policy sends If-None-Match/If-Modified-Since on recrawl and serves 304s from the cache;
+# playwright pages are cached as rendered DOM and revalidated over plain HTTP (CacheRevalidationMiddleware)
+HTTPCACHE_ENABLED = False
+HTTPCACHE_POLICY = "scrapy.extensions.httpcache.RFC2616Policy"
+HTTPCACHE_STORAGE = "spiderfarm.httpcache.SqliteCacheStorage"
+HTTPCACHE_DIR = "httpcache"
+HTTPCACHE_EXPIRATION_SECS = 604800 # TTL, entries older than a week are refetched from scratch (0 = never expire)
+HTTPCACHE_MAX_SIZE_MB = 1024 # least recently used entries are evicted past this size (0 = unbounded)
+HTTPCACHE_IGNORE_HTTP_CODES = [403, 429, 500, 502, 503, 504]
 
 # Set settings whose default value is deprecated to a future-proof value
 FEED_EXPORT_ENCODING = "utf-8"
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+# spiderfarm/sharding.py
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from urllib.parse import urlparse
+
+from scrapy.crawler import CrawlerProcess
+
+from spiderfarm import sinks
+import helpers
+
+
+def parse_sites(value):
+    """
+    Read seed sites from a file (one per line, '#' comments allowed) or a comma-separated list.
+    Bare domains get an https:// scheme. Seeds are grouped by domain, so every domain is crawled once.
+    """
+    if os.path.isfile(value):
+        with open(value, encoding='utf-8') as f:
+            entries = [line.split('#', 1)[0].strip() for line in f]
+    else:
+        entries = [entry.strip() for entry in value.split(',')]
+    sites = {}
+    for entry in entries:
+        if not entry:
+            continue
+        if '://' not in entry:
+            entry = f"https://{entry}"
+        url = helpers.validate_and_normalize_url(entry)
+        if not url:
+            print(f"SKIPPED: invalid site {entry}")
+            continue
+        domain = urlparse(url).netloc.lower().replace('www.', '')
+        sites.setdefault(domain, []).append(url)
+    return sites
+
+
+def site_slug(domain):
+    return helpers.sanitize_filename(domain.replace('.', '_').replace(':', '_'))
+
+
+def crawl_site(task):
+    """
+    Worker entry point: crawl one site in this process, with its own reactor, browser and allowed-domain scope.
+    Rows are auto-saved to <work_dir>/<site>.<ext>; the crawl summary is returned to the parent.
+    """
+    spider_class, domain, seeds, crawl_kwargs, settings, work_dir = task
+    slug = site_slug(domain)
+    fmt = output_format(settings)
+    settings = worker_settings(settings, slug, work_dir)
+    jobdir = settings.get('JOBDIR')
+    if jobdir:
+        site_jobdir = os.path.join(jobdir, slug)
+        os.makedirs(site_jobdir, exist_ok=True)
+        settings.set('JOBDIR', site_jobdir)
+        settings.set('SEEN_STORE_DIR', site_jobdir)
+    summary = {'domain': domain, 'output': None, 'items': 0, 'reason': None}
+    try:
+        process = CrawlerProcess(settings)
+        crawler = process.create_crawler(spider_class)
+        process.crawl(crawler, start_urls=seeds, **crawl_kwargs)
+        process.start()
+        summary['items'] = crawler.stats.get_value('item_scraped_count', 0)
+        summary['reason'] = crawler.stats.get_value('finish_reason')
+    except Exception as e:
+        summary['reason'] = f"error: {e}"
+    output = Path(work_dir) / helpers.resolve_output_filename(slug, extension=sinks.SINKS[fmt].extension)
+    if output.exists():
+        summary['output'] = str(output)
+    return summary
+
+
+def worker_settings(settings, slug, work_dir):
+    """
+    Settings for one worker process: rows auto-saved to <work_dir>/<slug>.<ext>, and the
+    metrics file and link graph directory made per-worker so workers don't overwrite each other.
+    """
+    settings = settings.copy()
+    # workers always auto-save; without '--auto save' they write CSV for the merged view/save menu
+    settings.set('OUTPUT_FORMAT', output_format(settings))
+    settings.set('AUTO_SAVE', True)
+    settings.set('AUTO_VIEW', False)
+    settings.set('OUTPUT_DIR', work_dir)
+    settings.set('OUTPUT_FILENAME', slug)
+    metrics_file = settings.get('METRICS_FILE')
+    if metrics_file:
+        metrics_path = Path(metrics_file)
+        settings.set('METRICS_FILE', str(metrics_path.with_name(f"{metrics_path.stem}_{slug}{metrics_path.suffix}")))
+    link_graph_dir = settings.get('LINK_GRAPH_DIR')
+    if link_graph_dir:
+        settings.set('LINK_GRAPH_DIR', os.path.join(link_graph_dir, slug))
+    return settings
+
+
+def output_format(settings):
+    return settings.get('OUTPUT_FORMAT', 'csv').lower() if settings.getbool('AUTO_SAVE') else 'csv'
+
+
+def merge_outputs(paths, dest_path, sink_class=sinks.CsvSink, fields=None):
+    """
+    Concatenate per-site outputs into one file of the same format (header written once).
+    Returns (headers, row_count); nothing is written when no site produced a file.
+    """
+    sink = None
+    for path in paths:
+        rows = sink_class.read(path)
+        file_headers = next(rows, None)
+        if file_headers is None:
+            continue
+        if sink is None:
+            sink = sink_class(dest_path, fields=fields or file_headers, headers=file_headers)
+        for row in rows:
+            sink.write_values(list(row))
+    if sink is None:
+        return None, 0
+    sink.close()
+    return sink.headers, sink.row_count
+
+
+def crawl_sites(settings, spider_class, sites, crawl_kwargs, workers=None):
+    """
+    Shard seed sites across a pool of worker processes, one crawl per domain, then merge the outputs.
+    - workers: number of concurrent crawls (default: CPU count)
+    - JOBDIR (--resume): each site gets its own job directory, finished sites are skipped on resume
+      and the merge waits until every site has finished
+    """
+    workers = max(1, min(workers or os.cpu_count() or 1, len(sites)))
+    jobdir = settings.get('JOBDIR')
+    if jobdir:
+        work_dir = os.path.join(jobdir, 'output')
+        os.makedirs(work_dir, exist_ok=True)
+        progress_path = Path(jobdir) / 'sites.json'
+        done = json.loads(progress_path.read_text(encoding='utf-8')) if progress_path.exists() else {}
+    else:
+        work_dir = tempfile.mkdtemp(prefix=f"{spider_class.name}_sites_")
+        progress_path = None
+        done = {}
+    tasks = [
+        (spider_class, domain, seeds, crawl_kwargs, settings, work_dir)
+        for domain, seeds in sites.items()
+        if domain not in done
+    ]
+    print(f"Crawling {len(sites)} sites with {workers} workers ({len(sites) - len(tasks)} already done)...")
+    # spawned workers start from a clean interpreter, so each gets a fresh twisted reactor
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes=workers, maxtasksperchild=1) as pool:
+        for summary in pool.imap_unordered(crawl_site, tasks):
+            print(f"SITE DONE [{len(done) + 1}/{len(sites)}]: {summary['domain']} - {summary['items']} rows ({summary['reason']})")
+            if jobdir and summary['reason'] != 'finished':
+                continue
+            done[summary['domain']] = summary
+            if progress_path:
+                progress_path.write_text(json.dumps(done), encoding='utf-8')
+    if len(done) < len(sites):
+        print(f"\n{len(sites) - len(done)} sites did not finish. Run again with --resume {jobdir} to continue.\n")
+        return
+    # merge in seed order so the output is stable across runs
+    paths = [done[domain]['output'] for domain in sites if done[domain].get('output')]
+    deliver_merged(settings, spider_class, paths, f"{spider_class.name}_sites",
+                   cleanup=None if jobdir else work_dir)
+
+
+def deliver_merged(settings, spider_class, paths, spider_name, cleanup=None):
+    """
+    Merge worker outputs into the final output (auto-saved, or spooled for the view/save menu).
+    cleanup: work directory removed once the outputs are merged.
+    """
+    auto_save = settings.getbool('AUTO_SAVE')
+    output_filename = settings.get('OUTPUT_FILENAME')
+    sink_class = sinks.SINKS[output_format(settings)]
+    if auto_save:
+        dest_path = Path(settings.get('OUTPUT_DIR') or Path.home()) / helpers.resolve_output_filename(
+            output_filename, spider_name=spider_name, extension=sink_class.extension)
+    else:
+        fd, spool_path = tempfile.mkstemp(prefix=f"{spider_name}_", suffix='.csv')
+        os.close(fd)
+        dest_path = Path(spool_path)
+    headers, row_count = merge_outputs(paths, dest_path, sink_class, fields=getattr(spider_class, 'output_fields', None))
+    if cleanup:
+        shutil.rmtree(cleanup, ignore_errors=True)
+    if not row_count:
+        print("No data scraped.")
+        dest_path.unlink(missing_ok=True)
+        return
+    helpers.data_handling_options(
+        dest_path,
+        headers,
+        row_count,
+        auto_view=settings.getbool('AUTO_VIEW'),
+        auto_save=auto_save,
+        output_filename=output_filename,
+        spider_name=spider_name,
+    )
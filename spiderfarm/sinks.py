@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+# spiderfarm/sinks.py
+import csv
+import json
+import os
+import sqlite3
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional, only needed for OUTPUT_FORMAT = 'parquet'
+    pa = pq = None
+
+
+class BaseSink:
+    """
+    Buffered row writer used by the streaming pipeline.
+    Rows are held in a small buffer and written to disk every `batch_size` items,
+    so memory stays flat and partial results survive a crash.
+    With append=True an existing file is extended (resumed crawls) and its header is kept.
+    """
+    extension = ''
+    # formats that write in large blocks raise the batch size to this many rows
+    min_batch_size = 1
+
+    def __init__(self, file_path, fields=None, headers=None, batch_size=500, append=False):
+        self.file_path = file_path
+        self.append = append
+        self.header_written = append and os.path.exists(file_path) and os.path.getsize(file_path) > 0
+        self.fields = list(fields) if fields else None
+        self.headers = list(headers) if headers else None
+        self.batch_size = max(self.min_batch_size, batch_size)
+        self.buffer = []
+        self.row_count = 0
+        self.open()
+
+    def open(self):
+        raise NotImplementedError
+
+    def write_header(self):
+        pass
+
+    def write_batch(self, rows):
+        raise NotImplementedError
+
+    @classmethod
+    def read(cls, file_path):
+        """Yield the header row, then each data row, of a file written by this sink."""
+        raise NotImplementedError
+
+    def position(self):
+        """Checkpointable position of the flushed output, or None when the format can't be truncated."""
+        return None
+
+    @classmethod
+    def truncate(cls, file_path, position):
+        """Cut a file back to a position saved by position(), dropping rows written after it."""
+        with open(file_path, 'r+b') as f:
+            f.truncate(position)
+
+    def write(self, row):
+        # columns are fixed by the spider, or by the first row when it doesn't declare any
+        if self.fields is None:
+            self.fields = list(row.keys())
+        self.write_values([row.get(f, '') for f in self.fields])
+
+    def write_values(self, values):
+        """Write one row given as a list of values in field order."""
+        if self.headers is None:
+            self.headers = list(self.fields)
+        if not self.header_written:
+            self.write_header()
+            self.header_written = True
+        self.buffer.append(values)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.write_batch(self.buffer)
+            self.row_count += len(self.buffer)
+            self.buffer = []
+
+    def close(self):
+        self.flush()
+
+
+class CsvSink(BaseSink):
+    extension = '.csv'
+
+    def open(self):
+        self.file = open(self.file_path, mode='a' if self.append else 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+
+    def write_header(self):
+        self.writer.writerow(self.headers)
+
+    def write_batch(self, rows):
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def position(self):
+        # after close, the position the file was closed at
+        if self.file.closed:
+            return self.closed_position
+        self.file.flush()
+        return self.file.tell()
+
+    @classmethod
+    def read(cls, file_path):
+        with open(file_path, newline='', encoding='utf-8') as f:
+            yield from csv.reader(f)
+
+    def close(self):
+        super().close()
+        self.closed_position = self.position()
+        self.file.close()
+
+
+class JsonlSink(BaseSink):
+    extension = '.jsonl'
+
+    def open(self):
+        self.file = open(self.file_path, mode='a' if self.append else 'w', encoding='utf-8')
+
+    def write_batch(self, rows):
+        self.file.write(''.join(
+            json.dumps(dict(zip(self.headers, row)), ensure_ascii=False, default=str) + '\n'
+            for row in rows
+        ))
+        self.file.flush()
+
+    def position(self):
+        if self.file.closed:
+            return self.closed_position
+        self.file.flush()
+        return self.file.tell()
+
+    @classmethod
+    def read(cls, file_path):
+        headers = None
+        with open(file_path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                obj = json.loads(line)
+                if headers is None:
+                    headers = list(obj)
+                    yield headers
+                yield [obj.get(h, '') for h in headers]
+
+    def close(self):
+        super().close()
+        self.closed_position = self.position()
+        self.file.close()
+
+
+class SqliteSink(BaseSink):
+    """
+    Rows go into the `rows` table of an SQLite database, one transaction per batch.
+    Columns take the output headers; url, source and gtin columns are indexed when the
+    crawl closes (building the indexes once is faster than maintaining them per insert).
+    """
+    extension = '.sqlite'
+    table = 'rows'
+    index_fields = ('url', 'source', 'gtin')
+
+    def open(self):
+        if not self.append and os.path.exists(self.file_path):
+            os.remove(self.file_path)
+        self.conn = sqlite3.connect(self.file_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+
+    @staticmethod
+    def quote(name):
+        return '"' + str(name).replace('"', '""') + '"'
+
+    def write_header(self):
+        # untyped columns keep the values' own types (text, integers, reals)
+        columns = ', '.join(self.quote(h) for h in self.headers)
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} ({columns})")
+        self.conn.commit()
+
+    def write_batch(self, rows):
+        placeholders = ', '.join('?' * len(self.headers))
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT INTO {self.table} VALUES ({placeholders})",
+                ([v if v is None or isinstance(v, (str, int, float)) else json.dumps(v, default=str) for v in row] for row in rows),
+            )
+
+    def position(self):
+        # batches are committed whole, so the rows table holds exactly the flushed rows
+        return self.row_count
+
+    @classmethod
+    def truncate(cls, file_path, position):
+        conn = sqlite3.connect(file_path)
+        try:
+            with conn:
+                conn.execute(f"DELETE FROM {cls.table} WHERE rowid > ?", (position,))
+        except sqlite3.OperationalError:
+            # no rows table yet
+            pass
+        finally:
+            conn.close()
+
+    def create_indexes(self):
+        for field, header in zip(self.fields or (), self.headers or ()):
+            if field in self.index_fields:
+                self.conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {self.quote(f'idx_{self.table}_{header}')} ON {self.table} ({self.quote(header)})"
+                )
+        self.conn.commit()
+
+    @classmethod
+    def read(cls, file_path):
+        conn = sqlite3.connect(file_path)
+        try:
+            cursor = conn.execute(f"SELECT * FROM {cls.table} ORDER BY rowid")
+            yield [d[0] for d in cursor.description]
+            yield from cursor
+        except sqlite3.OperationalError:
+            # no rows table: nothing was written
+            return
+        finally:
+            conn.close()
+
+    def close(self):
+        super().close()
+        if self.header_written:
+            self.create_indexes()
+        self.conn.close()
+
+
+class ParquetSink(BaseSink):
+    """
+    Columnar output through pyarrow; every batch becomes one row group, so batches are at least
+    `min_batch_size` rows. All columns are written as strings.
+    The Parquet footer is only written on close, so a crawl that is killed leaves an unreadable
+    file; parquet output can't be appended to and is refused for resumable crawls (JOBDIR).
+    """
+    extension = '.parquet'
+    min_batch_size = 10_000
+
+    def open(self):
+        if pq is None:
+            raise RuntimeError("The parquet output format needs pyarrow: pip install pyarrow")
+        if self.append:
+            raise RuntimeError("The parquet output format can't be appended to - use csv, jsonl or sqlite for resumable crawls")
+        self.writer = None
+
+    def open_writer(self):
+        self.schema = pa.schema([(str(h), pa.string()) for h in self.headers])
+        self.writer = pq.ParquetWriter(self.file_path, self.schema)
+
+    @staticmethod
+    def to_text(value):
+        if value is None or isinstance(value, str):
+            return value
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, default=str)
+        return str(value)
+
+    def write_batch(self, rows):
+        if self.writer is None:
+            self.open_writer()
+        columns = [
+            pa.array([self.to_text(v) for v in column], type=pa.string())
+            for column in zip(*rows)
+        ]
+        self.writer.write_table(pa.Table.from_arrays(columns, schema=self.schema))
+
+    @classmethod
+    def read(cls, file_path):
+        if pq is None:
+            raise RuntimeError("The parquet output format needs pyarrow: pip install pyarrow")
+        parquet_file = pq.ParquetFile(file_path)
+        headers = parquet_file.schema_arrow.names
+        yield headers
+        for batch in parquet_file.iter_batches():
+            columns = batch.to_pydict()
+            yield from zip(*(columns[h] for h in headers))
+
+    def close(self):
+        super().close()
+        if self.writer is not None:
+            self.writer.close()
+
+
+SINKS = {
+    'csv': CsvSink,
+    'jsonl': JsonlSink,
+    'sqlite': SqliteSink,
+    'parquet': ParquetSink,
+}
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# spiderfarm/sitemaps.py
+import zlib
+from lxml import etree
+
+GZIP_MAGIC = b'\x1f\x8b'
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_chunks(body, chunk_size=CHUNK_SIZE):
+    """
+    Yield the sitemap body in chunks, decompressing gzipped (.xml.gz) bodies incrementally.
+    """
+    if body[:2] == GZIP_MAGIC:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for start in range(0, len(body), chunk_size):
+            chunk = decompressor.decompress(body[start:start + chunk_size])
+            if chunk:
+                yield chunk
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+    else:
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+
+
+def iter_sitemap(body, chunk_size=CHUNK_SIZE):
+    """
+    Incrementally parse a sitemap or sitemap index, namespace-agnostic.
+    Yields (kind, loc, lastmod) as each entry closes, where kind is 'url' for <urlset><url>
+    entries and 'sitemap' for <sitemapindex><sitemap> children. Parsed entries are cleared
+    so memory stays flat regardless of the number of entries.
+    """
+    parser = etree.XMLPullParser(events=('end',), recover=True, huge_tree=True, resolve_entities=False)
+    for chunk in iter_chunks(body, chunk_size):
+        parser.feed(chunk)
+        yield from read_entries(parser)
+    try:
+        parser.close()
+    except etree.XMLSyntaxError:
+        pass
+    yield from read_entries(parser)
+
+
+def read_entries(parser):
+    for _, elem in parser.read_events():
+        if not isinstance(elem.tag, str):
+            continue
+        kind = etree.QName(elem).localname
+        if kind not in ('url', 'sitemap'):
+            continue
+        loc = lastmod = None
+        for child in elem:
+            if not isinstance(child.tag, str):
+                continue
+            name = etree.QName(child).localname
+            if name == 'loc':
+                loc = (child.text or '').strip()
+            elif name == 'lastmod':
+                lastmod = (child.text or '').strip()
+        # free the parsed entry and any siblings already handled
+        elem.clear()
+        parent = elem.getparent()
+        if parent is not None:
+            while elem.getprevious() is not None:
+                del parent[0]
+        if loc:
+            yield kind, loc, lastmod
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# spiderfarm/sitemapseeds.py
+import logging
+from collections import deque
+from datetime import date
+
+import scrapy
+from scrapy.http import TextResponse
+
+from spiderfarm import sitemaps
+from spiderfarm.canonical import UrlCanonicalizer
+from spiderfarm.urlfilter import UrlFilter
+
+logger = logging.getLogger(__name__)
+
+# tried when robots.txt lists no sitemaps
+SEED_PATHS = ('/sitemap.xml', '/sitemap_index.xml', '/sitemap-index.xml', '/sitemap.xml.gz', '/wp-sitemap.xml')
+
+
+def parse_since(value):
+    """SITEMAP_LASTMOD_SINCE as an ISO date string (YYYY-MM-DD), or None; raises ValueError for other values."""
+    if not value:
+        return None
+    return date.fromisoformat(str(value)[:10]).isoformat()
+
+
+class SitemapSeeder:
+    """
+    Sitemap-seeded frontier for LinkSpider and SchemaSpider (SITEMAP_SEEDS_ENABLED, '--seed-sitemaps').
+    For each seed origin the sitemaps listed in robots.txt are read (SITEMAP_SEED_PATHS are tried
+    when it lists none); sitemap indexes are followed and <loc> entries are streamed out as they are
+    parsed (see sitemaps.iter_sitemap), so deep pages are queued without rendering the pages that link to them.
+    - page URLs are canonicalized and go through the spider's include/exclude, non-HTML and scope filter
+    - entries (and child sitemaps) with a <lastmod> before SITEMAP_LASTMOD_SINCE are skipped;
+      entries without one are kept
+    Sitemaps and robots.txt are fetched directly through the engine, so seeded pages enter the
+    frontier at depth 0 like start URLs; link following stays governed by --crawl and --depth.
+    """
+    def __init__(self, crawler, url_filter, canonicalizer, since=None, paths=SEED_PATHS):
+        self.crawler = crawler
+        self.url_filter = url_filter
+        self.canonicalizer = canonicalizer
+        self.since = since
+        self.paths = paths
+        self.sitemaps = 0
+        self.urls = 0
+        self.filtered = 0
+        self.stale = 0
+
+    @classmethod
+    def from_spider(cls, spider, settings=None):
+        """The spider's sitemap seeder, or None when SITEMAP_SEEDS_ENABLED is off."""
+        settings = settings or spider.settings
+        if not settings.getbool('SITEMAP_SEEDS_ENABLED'):
+            return None
+        return cls(
+            spider.crawler,
+            url_filter=getattr(spider, 'url_filter', None) or UrlFilter.from_spider(spider),
+            canonicalizer=UrlCanonicalizer.from_crawler(spider.crawler),
+            since=parse_since(settings.get('SITEMAP_LASTMOD_SINCE')),
+            paths=settings.getlist('SITEMAP_SEED_PATHS') or SEED_PATHS,
+        )
+
+    @property
+    def stats(self):
+        return self.crawler.stats
+
+    async def fetch(self, url):
+        try:
+            return await self.crawler.engine.download_async(scrapy.Request(url, dont_filter=True))
+        except Exception as e:
+            logger.warning(f"SITEMAP SEEDS: could not fetch {url} - {e!r}")
+            return None
+
+    async def robots_sitemaps(self, origin):
+        response = await self.fetch(f"{origin}/robots.txt")
+        if response is None or response.status != 200 or not isinstance(response, TextResponse):
+            return []
+        listed = []
+        for line in response.text.splitlines():
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'sitemap' and value.strip():
+                listed.append(value.strip())
+        return listed
+
+    def is_stale(self, lastmod):
+        # W3C datetimes start with the date, so ISO date strings compare in order
+        return self.since is not None and bool(lastmod) and lastmod[:10] < self.since
+
+    async def seeds(self, start_urls):
+        """Yield (url, sitemap_url) for every in-scope page listed in the seed origins' sitemaps."""
+        queue = deque()
+        seen = set()
+
+        def enqueue(sitemap_url):
+            sitemap_url = self.canonicalizer.canonicalize(sitemap_url, keep_query=True)
+            if sitemap_url and sitemap_url not in seen:
+                seen.add(sitemap_url)
+                queue.append(sitemap_url)
+
+        origins = dict.fromkeys(filter(None, (self.canonicalizer.origin(url) for url in start_urls)))
+        for origin in origins:
+            listed = await self.robots_sitemaps(origin)
+            for sitemap_url in listed or [f"{origin}{path}" for path in self.paths]:
+                enqueue(sitemap_url)
+        while queue:
+            sitemap_url = queue.popleft()
+            response = await self.fetch(sitemap_url)
+            if response is None or response.status != 200:
+                logger.debug(f"SITEMAP SEEDS: no sitemap at {sitemap_url}")
+                continue
+            self.sitemaps += 1
+            self.stats.inc_value('sitemap_seeds/sitemaps')
+            for kind, loc, lastmod in sitemaps.iter_sitemap(response.body):
+                if self.is_stale(lastmod):
+                    self.stale += 1
+                    self.stats.inc_value('sitemap_seeds/stale')
+                    continue
+                if kind == 'sitemap':
+                    enqueue(loc)
+                    continue
+                url = self.canonicalizer.canonicalize(loc)
+                if not url or self.url_filter.check(url):
+                    self.filtered += 1
+                    self.stats.inc_value('sitemap_seeds/filtered')
+                    continue
+                self.urls += 1
+                self.stats.inc_value('sitemap_seeds/urls')
+                yield url, sitemap_url
+        skipped = f"{self.filtered} filtered, {self.stale} not modified since {self.since}" if self.since else f"{self.filtered} filtered"
+        logger.info(f"SITEMAP SEEDS: {self.urls} URLs from {self.sitemaps} sitemaps ({skipped})")
@@ -1,22 +1,29 @@
 # -*- coding: utf-8 -*-
 # spiderfarm/spiders/feedspider.py
 import scrapy
-import gzip
-import io
-import xml.etree.ElementTree as ET
+import zlib
+from lxml import etree
 from scrapy import signals
+from scrapy.settings.default_settings import DOWNLOAD_HANDLERS_BASE
 from urllib.parse import urlparse
+from spiderfarm import sitemaps
 import helpers
 
 
 class FeedSpider(scrapy.Spider):
     name = "feedspider"
     handle_httpstatus_list = [301, 302, 403, 404, 429]
+    # feeds are fetched with Scrapy's plain HTTP handlers since no rendering is needed
+    custom_settings = {
+        "DOWNLOAD_HANDLERS": {
+            "http": DOWNLOAD_HANDLERS_BASE["http"],
+            "https": DOWNLOAD_HANDLERS_BASE["https"],
+        },
+    }
 
     def __init__(self, start_urls=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.start_urls = [start_urls] if isinstance(start_urls, str) else (start_urls or [])
-        self.scraped_data = []
         self.item_count = 0
         self.allowed_domains = []
         if self.start_urls:
@@ -26,27 +33,47 @@ class FeedSpider(scrapy.Spider):
             if domain.startswith('www.'):
                 self.allowed_domains.append(domain.replace('www.', ''))
 
+    @classmethod
+    def update_settings(cls, settings):
+        super().update_settings(settings)
+        # Scrapy holds the downloaded (still compressed) body in memory before parse runs, so the feed
+        # download keeps a finite cap of its own; only the decompressed document and the parse tree are streamed
+        settings.set('DOWNLOAD_MAXSIZE', settings.getint('FEED_DOWNLOAD_MAXSIZE', 2 * 1024 ** 3), priority='spider')
+        settings.set('DOWNLOAD_WARNSIZE', settings.getint('FEED_DOWNLOAD_WARNSIZE', 512 * 1024 ** 2), priority='spider')
+
     @classmethod
     def from_crawler(cls, crawler, *args, **kwargs):
         spider = super(FeedSpider, cls).from_crawler(crawler, *args, **kwargs)
         crawler.signals.connect(spider.spider_closed, signals.spider_closed)
         return spider
 
-    def parse_feed(self, xml_text):
-        """Parse the XML feed content (string)."""
+    def parse_feed(self, body):
+        """
+        Stream the XML feed (plain or gzipped bytes) one <item> at a time.
+        The body is decompressed and fed to an incremental parser in chunks; each <item>
+        is turned into a row and cleared, so parsing memory is bounded by a single item
+        (the downloaded body itself is buffered by Scrapy, see FEED_DOWNLOAD_MAXSIZE).
+        """
+        parser = etree.XMLPullParser(events=("end",), tag="item", recover=True, huge_tree=True, resolve_entities=False)
         try:
-            root = ET.fromstring(xml_text)
-        except ET.ParseError as e:
-            self.logger.error(f"XML parsing error: {e}")
+            for chunk in sitemaps.iter_chunks(body):
+                parser.feed(chunk)
+                yield from self.read_items(parser)
+            parser.close()
+        except zlib.error as e:
+            self.logger.error(f"Failed to decompress feed: {e}")
             return
-        # namespace handling (Google feeds use g:)
-        nsmap = {"g": "http://base.google.com/ns/1.0"}
-        # locate all <item> nodes under <rss><channel>
-        items = root.findall(".//item", nsmap)
-        for item in items:
+        except etree.XMLSyntaxError as e:
+            self.logger.error(f"XML parsing error: {e}")
+        yield from self.read_items(parser)
+
+    def read_items(self, parser):
+        for _, item in parser.read_events():
             row = {}
             for child in item:
                 tag_name = child.tag
+                if not isinstance(tag_name, str):
+                    continue
                 # strip namespace prefixes ({http://base.google.com/ns/1.0}mpn -> mpn)
                 if "}" in tag_name:
                     tag_name = tag_name.split("}", 1)[1]
@@ -54,45 +81,23 @@ class FeedSpider(scrapy.Spider):
                     continue
                 text = helpers.clean_value(self, value=child.text if child.text is not None else "")
                 row[tag_name] = text
+            # free the processed item and any earlier siblings
+            item.clear()
+            parent = item.getparent()
+            if parent is not None:
+                while item.getprevious() is not None:
+                    del parent[0]
 
             if row:
-                self.scraped_data.append(row)
                 self.item_count += 1
                 if self.item_count % 250 == 0:
                     self.logger.info("Processed %d <item> entries so far", self.item_count)
+                yield row
 
     def parse(self, response):
-        """Handles feed retrieval, decompression (if needed), and XML parsing."""
+        """Handles feed retrieval and streaming parse (gzip is detected and decompressed on the fly)."""
         self.logger.info("Fetching feed from %s", response.url)
-        content = response.body
-        if response.url.endswith(".gz") or response.headers.get("Content-Encoding") == b"gzip":
-            self.logger.info("Detected gzip-compressed feed, decompressing...")
-            try:
-                with gzip.GzipFile(fileobj=io.BytesIO(content)) as gz:
-                    content = gz.read()
-            except Exception as e:
-                self.logger.error(f"Failed to decompress feed: {e}")
-                return
-        xml_text = content.decode("utf-8", errors="ignore")
-        self.parse_feed(xml_text)
+        yield from self.parse_feed(response.body)
 
     def spider_closed(self, spider):
-        if not self.scraped_data:
-            self.logger.info("No items extracted from feed.")
-            return
-        # build headers from first item keys
-        headers = list(self.scraped_data[0].keys())
-        table_data = [[row.get(h, "") for h in headers] for row in self.scraped_data]
-        auto_view = self.settings.getbool("AUTO_VIEW", False)
-        auto_save = self.settings.getbool("AUTO_SAVE", False)
-        output_filename = self.settings.get("OUTPUT_FILENAME")
-        helpers.data_handling_options(
-            table_data,
-            headers,
-            auto_view=auto_view,
-            auto_save=auto_save,
-            output_filename=output_filename,
-            seed_url=self.start_urls[0] if self.start_urls else None,
-            spider_name=self.name,
-        )
         self.logger.info("FeedSpider finished: %d items extracted.\n", self.item_count)
@@ -1,15 +1,35 @@
 # -*- coding: utf-8 -*-
 # spiderfarm/spiderfarm/spiders/linkspider.py
 import scrapy
-from scrapy import signals
-from collections import defaultdict
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urlparse
+from spiderfarm.pagepool import PlaywrightPagePool
+from spiderfarm.seenstore import FingerprintSeenStore, open_seen_store
+from spiderfarm import urlfilter
+from spiderfarm.links import BulkLinkExtractor
+from spiderfarm.canonical import UrlCanonicalizer
+from spiderfarm.sitemapseeds import SitemapSeeder
+from spiderfarm.metrics import CrawlMetrics
+from spiderfarm.linkgraph import LinkGraph
+from spiderfarm.nearduplicates import NearDuplicateDetector, SKIP
 import helpers
 
+SKIP_MESSAGES = {
+    urlfilter.INVALID: "Invalid or non-HTTPS URL",
+    urlfilter.NOT_INCLUDED: "Not included in filter",
+    urlfilter.EXCLUDED: "Excluded by filter",
+    urlfilter.NON_HTML: "Non-HTML resource",
+    urlfilter.OUT_OF_SCOPE: "Not within domain scope",
+}
+
 class LinkSpider(scrapy.Spider):
     name = 'linkspider'
     custom_settings = {}
     handle_httpstatus_list = [403,404,429]
+    # output columns for the streaming pipeline (item field -> header)
+    output_fields = ['url','status','title','meta_description','canonical','source']
+    output_headers = ['url','status','title','meta_description','canonical_link','source_page']
+    # hybrid fetch escalation rules (see HybridFetchMiddleware)
+    hybrid_rules = ['empty_container','js_shell']
     
     def __init__(self, start_urls=None, tag='a', attr='href', 
                  ctag=None, include=None, exclude=None, crawl_enabled=True,
@@ -19,8 +39,7 @@ class LinkSpider(scrapy.Spider):
         self.tag = tag
         self.attr = attr
         self.ctag = ctag
-        self.url_seen = defaultdict(set)  # url -> set of sources
-        self.scraped_data = [] # list to store scraped data
+        self.url_seen = FingerprintSeenStore() # (url, source) pairs; replaced by the configured SEEN_STORE in from_crawler
         self.include = include or []
         self.exclude = exclude or []
         self.crawl_enabled = crawl_enabled
@@ -36,7 +55,21 @@ class LinkSpider(scrapy.Spider):
     @classmethod
     def from_crawler(cls, crawler, *args, **kwargs):
         spider = super(LinkSpider, cls).from_crawler(crawler, *args, **kwargs)
-        crawler.signals.connect(spider.spider_closed, signals.spider_closed)
+        spider.url_seen = open_seen_store(crawler, f'{spider.name}_url_seen')
+        spider.url_filter = urlfilter.UrlFilter.from_spider(spider)
+        spider.canonicalizer = UrlCanonicalizer.from_crawler(crawler)
+        spider.link_extractor = BulkLinkExtractor.from_spider(spider)
+        spider.sitemap_seeds = SitemapSeeder.from_spider(spider)
+        spider.metrics = CrawlMetrics.from_crawler(crawler)
+        spider.near_duplicates = NearDuplicateDetector.from_spider(spider)
+        if spider.near_duplicates is not None:
+            # fingerprint and cluster columns
+            spider.output_fields = cls.output_fields + ['simhash', 'duplicate_of']
+            spider.output_headers = cls.output_headers + ['simhash', 'duplicate_of']
+        spider.link_graph = LinkGraph.from_crawler(crawler)
+        if spider.link_graph is not None:
+            for url in spider.start_urls:
+                spider.link_graph.add_seed(url)
         return spider
 
     async def start(self):
@@ -44,114 +77,142 @@ class LinkSpider(scrapy.Spider):
             yield scrapy.Request(
                 url,
                 callback=self.parse,
-                meta=helpers.playwright_meta(url),
+                errback=self.errback,
+                meta=helpers.fetch_meta(self),
                 headers={
                     "Referer":"https://www.google.com/",
                 },
                 )
+        if self.sitemap_seeds is not None:
+            # sitemap URLs are queued as seeds (the sitemap is their source)
+            async for url, sitemap_url in self.sitemap_seeds.seeds(self.start_urls):
+                yield scrapy.Request(
+                    url,
+                    callback=self.parse,
+                    errback=self.errback,
+                    meta=helpers.fetch_meta(self),
+                    headers={'Referer': sitemap_url},
+                    )
 
     def parse(self, response):
         url = response.url
+        if self.link_graph is not None:
+            self.record_page(response)
         if response.status == 403:
             self.logger.warning(f"BLOCKED: 403 at {url}")
             self.logger.debug(f"RESPONSE HEADERS: \n{response.headers}")
             self.logger.debug(f"RESPONSE BODY: \n{response.text[:5000]}")
             return
         source = response.request.headers.get('Referer', b'[seed]').decode()
-        if source in self.url_seen[url]:
+        if not self.url_seen.add(f"{url} {source}"):
             self.logger.debug(f"SKIPPED: Duplicate {url} from same source {source}")
             return
-        self.url_seen[url].add(source)
         self.logger.info(f"DISCOVERED: {url} / source: {source}")
         # page info extraction
-        page_info = {
-            'url': url,
-            'status': response.status,
-            'title': response.xpath('//title/text()').get(default='').strip(),
-            'meta_description': response.xpath("//meta[@name='description']/@content").get(default='').strip(),
-            'canonical': response.xpath("//link[@rel='canonical']/@href").get(default='').strip(),
-            'source': source,
-        }
-        self.scraped_data.append(page_info)
+        with self.metrics.timer('extract'):
+            page_info = {
+                'url': url,
+                'status': response.status,
+                'title': response.xpath('//title/text()').get(default='').strip(),
+                'meta_description': response.xpath("//meta[@name='description']/@content").get(default='').strip(),
+                'canonical': response.xpath("//link[@rel='canonical']/@href").get(default='').strip(),
+                'source': source,
+            }
+        if self.canonicalizer.tag_aliases and page_info['canonical']:
+            self.record_canonical(url, page_info['canonical'])
+        duplicate_of = None
+        if self.near_duplicates is not None:
+            with self.metrics.timer('simhash'):
+                fp, duplicate_of = self.near_duplicates.observe(url, response)
+            page_info['simhash'] = f"{fp:016x}" if fp is not None else ''
+            page_info['duplicate_of'] = duplicate_of or ''
+            if duplicate_of:
+                self.crawler.stats.inc_value('near_duplicates/pages')
+                self.logger.debug(f"NEAR-DUPLICATE: {url} of {duplicate_of}")
         yield page_info
         # crawl if enabled (True by default)
         if self.crawl_enabled:
-            # scoped container tag handling
-            if self.ctag:
-                container_xpath = helpers.get_container_xpath(self)
-                elements = response.xpath(f'{container_xpath}//{self.tag}[@{self.attr}]')
-            else:
-                elements = response.xpath(f'//{self.tag}[@{self.attr}]')
-            # targeted links extraction
-            for element in elements:
-                link = element.attrib.get(self.attr)
-                if not link:
-                    continue
-                link_lower = link.lower()
-                # include filter
-                if self.include and not any(s in link_lower for s in self.include):
-                    self.logger.debug(f"SKIPPED: {link} from {url} - Not included in filter '{self.include}'")
-                    continue
-                #exclude filter
-                if self.exclude and any(s in link_lower for s in self.exclude):
-                    self.logger.debug(f"SKIPPED: {link} from {url} - Excluded by filter '{self.exclude}'")
-                    continue
-                # resolve and normalize url
-                absolute_url = urljoin(response.url, link)
-                normalized_url = helpers.validate_and_normalize_url(absolute_url)
-                # skip invalid or non-https urls
-                if not normalized_url:
-                    self.logger.debug(f"SKIPPED: {link} from {url} - Invalid or non-HTTPS URL")
-                    continue
-                # skip non-HTML resources
-                if any(normalized_url.lower().endswith(ext) for ext in helpers.NON_HTML_EXTENSIONS):
-                    self.logger.debug(f"SKIPPED: {normalized_url} - Non-HTML resource")
-                    continue
-                # check domain scope
-                parsed_url = urlparse(normalized_url)
-                if self.allowed_domains:
-                    if parsed_url.netloc not in self.allowed_domains:
-                        self.logger.debug(f"SKIPPED: {normalized_url} - Not within domain scope")
+            # targeted links extraction (scoped to the container tag when set)
+            with self.metrics.timer('links'):
+                links = self.link_extractor.extract(response)
+            follow = []
+            in_scope = []
+            with self.metrics.timer('filter'):
+                for link, normalized_url in links:
+                    # skip invalid or non-https urls
+                    if not normalized_url:
+                        self.logger.debug(f"SKIPPED: {link} from {url} - Invalid or non-HTTPS URL")
+                        continue
+                    # include/exclude filters, non-HTML resources and domain scope
+                    reason = self.url_filter.check(normalized_url)
+                    if reason:
+                        self.logger.debug(f"SKIPPED: {normalized_url} from {url} - {SKIP_MESSAGES[reason]}")
                         continue
-                # skip duplicates
-                if source in self.url_seen[normalized_url]:
-                    continue
+                    in_scope.append(normalized_url)
+                    # skip duplicates (this page is the source of the followed link)
+                    if f"{normalized_url} {url}" in self.url_seen:
+                        continue
+                    priority = 0
+                    if self.near_duplicates is not None:
+                        action = self.near_duplicates.link_action(normalized_url, from_duplicate=bool(duplicate_of))
+                        if action == SKIP:
+                            self.crawler.stats.inc_value('near_duplicates/skipped_links')
+                            self.logger.debug(f"SKIPPED: {normalized_url} from {url} - Near-duplicate pattern")
+                            continue
+                        if action:
+                            self.crawler.stats.inc_value('near_duplicates/deprioritized_links')
+                            priority = self.near_duplicates.priority
+                    follow.append((normalized_url, priority))
+            if self.link_graph is not None:
+                self.link_graph.add_links(url, in_scope)
+            for normalized_url, priority in follow:
                 try:
                     yield response.follow(
                         normalized_url, 
                         callback=self.parse, 
+                        errback=self.errback,
+                        priority=priority,
                         headers={'Referer': url},
-                        meta=helpers.playwright_meta(url), # include pw in recursive crawls
+                        meta=helpers.fetch_meta(self), # include pw in recursive crawls
                         )
                 except Exception as e:
                     self.logger.error(f"SKIPPED: {normalized_url} - Malformed URL or error: {str(e)}")
 
-    def spider_closed(self, spider):
-        """
-        Called when the spider is closed and crawl is complete.
-        Converts scraped data to table format for processing.
-        """
-        if not self.scraped_data:
-            self.logger.info("No data scraped.")
-            return
-        headers = ['url','status','title','meta_description','canonical_link','source_page']
-        table_data = [[
-            page_data.get("url",""),
-            page_data.get("status",""),
-            page_data.get("title",""),
-            page_data.get("meta_description",""),
-            page_data.get("canonical",""),
-            page_data.get("source",""),
-        ] for page_data in self.scraped_data]
-        auto_view = self.settings.getbool('AUTO_VIEW',False)
-        auto_save = self.settings.getbool('AUTO_SAVE',False)
-        output_filename = self.settings.get('OUTPUT_FILENAME')
-        helpers.data_handling_options(
-            table_data, 
-            headers, 
-            auto_view=auto_view, 
-            auto_save=auto_save,
-            output_filename=output_filename,
-            seed_url=self.start_urls[0] if self.start_urls else None,
-            spider_name=self.name,
-        )
\ No newline at end of file
+    def record_canonical(self, url, href):
+        # later links to the declared canonical URL are deduplicated against this page
+        target = self.canonicalizer.alias(url, href)
+        if target:
+            self.crawler.stats.inc_value('canonical/aliases')
+            self.logger.debug(f"CANONICAL: {target} aliased to {url}")
+
+    def record_page(self, response):
+        # redirect chains become links from each redirecting URL to the next
+        redirect_urls = response.meta.get('redirect_urls', [])
+        redirect_reasons = response.meta.get('redirect_reasons', [])
+        chain = redirect_urls + [response.url]
+        for i, redirect_url in enumerate(redirect_urls):
+            reason = redirect_reasons[i] if i < len(redirect_reasons) else None
+            self.link_graph.add_page(redirect_url, reason if isinstance(reason, int) else 0)
+            self.link_graph.add_links(redirect_url, [chain[i + 1]])
+        self.link_graph.add_page(response.url, response.status)
+
+    async def errback(self, failure):
+        """Log failed requests and release any playwright page left open by the download."""
+        self.logger.error(f"FAILED: {failure.request.url} - {failure.value!r}")
+        await PlaywrightPagePool.from_crawler(self.crawler).release(failure.request.meta)
+
+    def closed(self, reason):
+        self.url_seen.close()
+        if self.near_duplicates is not None:
+            summary = self.near_duplicates.summary()
+            for key, value in summary.items():
+                self.crawler.stats.set_value(f'near_duplicates/{key}', value)
+            self.logger.info(f"NEAR-DUPLICATES: {summary['duplicates']} of {summary['pages']} pages in {summary['clusters']} clusters, {summary['flagged_patterns']} URL patterns flagged")
+        if self.link_graph is not None:
+            summary = self.link_graph.export()
+            for key, value in summary.items():
+                self.crawler.stats.set_value(f'linkgraph/{key}', value)
+            self.logger.info(
+                f"LINK GRAPH: {summary['nodes']} URLs, {summary['edges']} links, {summary['orphans']} orphans, "
+                f"{summary['deep_pages']} deep pages written to {self.link_graph.out_dir}"
+            )
@@ -1,9 +1,18 @@
 # -*- coding: utf-8 -*-
 # spiderfarm/spiderfarm/spiders/schemaspider.py
 import scrapy
-from scrapy import signals
 import json
-from urllib.parse import urlparse, urljoin
+from urllib.parse import urlparse
+from spiderfarm.pagepool import PlaywrightPagePool
+from spiderfarm.seenstore import FingerprintSeenStore, open_seen_store
+from spiderfarm.urlfilter import UrlFilter
+from spiderfarm.links import BulkLinkExtractor
+from spiderfarm.canonical import UrlCanonicalizer
+from spiderfarm.sitemapseeds import SitemapSeeder
+from spiderfarm.metrics import CrawlMetrics
+from spiderfarm.structured import StructuredDataExtractor, first_value, loads
+from spiderfarm.nearduplicates import NearDuplicateDetector, SKIP
+from spiderfarm.frontier import YieldFrontier
 import helpers
 
 TARGET_TYPES = {'Offer','Product','ProductGroup','SomeProducts','IndividualProduct','ProductCollection','ItemList','ListItem'}
@@ -13,6 +22,9 @@ class SchemaSpider(scrapy.Spider):
     name = 'schemaspider'
     custom_settings = {}
     handle_httpstatus_list = [403,404,429]
+    output_fields = ['name','url','price','gtin','source','type']
+    # hybrid fetch escalation rules (see HybridFetchMiddleware)
+    hybrid_rules = ['no_jsonld','empty_container','js_shell']
 
     def __init__(self, start_urls=None, tag='a', attr='href', 
                  ctag=None, include=None, exclude=None, crawl_enabled=False, 
@@ -26,9 +38,9 @@ class SchemaSpider(scrapy.Spider):
         self.ctag = ctag
         self.include = include or []
         self.exclude = exclude or []
-        self.visited_urls = set()
-        self.processed_json_ids = set()
-        self.results = []
+        # replaced by the configured SEEN_STORE in from_crawler
+        self.visited_urls = FingerprintSeenStore()
+        self.processed_json_ids = FingerprintSeenStore()
         self.crawl_enabled = crawl_enabled
         if self.start_urls:
             parsed_domain = urlparse(self.start_urls[0])
@@ -39,7 +51,19 @@ class SchemaSpider(scrapy.Spider):
     @classmethod
     def from_crawler(cls, crawler, *args, **kwargs):
         spider = super(SchemaSpider, cls).from_crawler(crawler, *args, **kwargs)
-        crawler.signals.connect(spider.spider_closed, signals.spider_closed)
+        spider.visited_urls = open_seen_store(crawler, f'{spider.name}_visited_urls')
+        spider.processed_json_ids = open_seen_store(crawler, f'{spider.name}_json_ids')
+        spider.url_filter = UrlFilter.from_spider(spider)
+        spider.canonicalizer = UrlCanonicalizer.from_crawler(crawler)
+        spider.link_extractor = BulkLinkExtractor.from_spider(spider)
+        spider.sitemap_seeds = SitemapSeeder.from_spider(spider)
+        spider.metrics = CrawlMetrics.from_crawler(crawler)
+        spider.structured_data = StructuredDataExtractor.from_spider(spider, TARGET_TYPES)
+        spider.frontier = YieldFrontier.from_crawler(crawler)
+        spider.near_duplicates = NearDuplicateDetector.from_spider(spider)
+        if spider.near_duplicates is not None:
+            # fingerprint and cluster columns, on every row from the page
+            spider.output_fields = cls.output_fields + ['simhash', 'duplicate_of']
         return spider
 
     async def start(self):
@@ -47,11 +71,23 @@ class SchemaSpider(scrapy.Spider):
             yield scrapy.Request(
                 url,
                 callback=self.parse,
-                meta=helpers.playwright_meta(url),
+                errback=self.errback,
+                meta=helpers.fetch_meta(self),
                 headers={
                     "Referer":"https://www.google.com/",
                 },
                 )
+        if self.sitemap_seeds is not None:
+            # sitemap URLs are queued as seeds, ordered by the frontier like followed links
+            async for url, sitemap_url in self.sitemap_seeds.seeds(self.start_urls):
+                yield scrapy.Request(
+                    url,
+                    callback=self.parse,
+                    errback=self.errback,
+                    priority=self.frontier.priority(url) if self.frontier is not None else 0,
+                    meta=helpers.fetch_meta(self),
+                    headers={'Referer': sitemap_url},
+                    )
     
     def parse(self, response):
         current_url = response.url
@@ -60,47 +96,75 @@ class SchemaSpider(scrapy.Spider):
             self.logger.debug(f"RESPONSE HEADERS: \n{response.headers}")
             self.logger.debug(f"RESPONSE BODY: \n{response.text[:5000]}")
             return
-        if current_url in self.visited_urls:
+        # visited pages are tracked by canonical key (www, trailing slash, parameter order folded)
+        if not self.visited_urls.add(self.canonicalizer.key(current_url) or current_url):
             return
-        self.visited_urls.add(current_url)
         self.logger.info(f"PROCESSING: {current_url}")
-        # extract
-        scripts = response.xpath('//script[@type="application/ld+json"]/text()').getall()
-        self.logger.info(f"EXTRACTING: {len(scripts)} valid JSON blocks")
-        for block in scripts:
-            try:
-                data = json.loads(block)
-                if isinstance(data, list):
-                    for entry in data:
-                        self.extract_target_data(entry, current_url)
-                else:
-                    self.extract_target_data(data, current_url)
-            except json.JSONDecodeError:
-                self.logger.warning("Invalid JSON block skipped.")
-                continue
+        if self.canonicalizer.tag_aliases:
+            self.record_canonical(current_url, self.canonicalizer.canonical_link(response))
+        duplicate_of = None
+        if self.near_duplicates is not None:
+            with self.metrics.timer('simhash'):
+                fp, duplicate_of = self.near_duplicates.observe(current_url, response)
+            page_columns = {'simhash': f"{fp:016x}" if fp is not None else '', 'duplicate_of': duplicate_of or ''}
+            if duplicate_of:
+                self.crawler.stats.inc_value('near_duplicates/pages')
+                self.logger.debug(f"NEAR-DUPLICATE: {current_url} of {duplicate_of}")
+        # extract json-ld, microdata and rdfa in one pass
+        with self.metrics.timer('extract'):
+            nodes = self.structured_data.extract(response)
+        self.logger.info(f"EXTRACTING: {len(nodes)} structured data nodes")
+        rows = 0
+        for syntax, node in nodes:
+            self.crawler.stats.inc_value(f'schema/{syntax}')
+            for item in self.extract_target_data(node, current_url):
+                if self.near_duplicates is not None:
+                    item.update(page_columns)
+                rows += 1
+                yield item
+        # learn which URL patterns yield target types before scoring this page's links
+        if self.frontier is not None:
+            self.frontier.observe(current_url, rows)
         # crawl if enabled
         if self.crawl_enabled:
-            if self.ctag:
-                container_xpath = helpers.get_container_xpath(self)
-                elements = response.xpath(f'{container_xpath}//{self.tag}[@{self.attr}]')
-            else:
-                elements = response.xpath(f'//{self.tag}[@{self.attr}]')
-            for el in elements:
-                href = el.attrib.get(self.attr)
-                if not href:
-                    continue
-                absolute_url = urljoin(current_url, href)
-                normalized_url = helpers.validate_and_normalize_url(absolute_url)
-                if not normalized_url:
-                    continue
-                if not self.is_valid_link(normalized_url):
-                    continue
+            with self.metrics.timer('links'):
+                links = self.link_extractor.extract(response)
+            with self.metrics.timer('filter'):
+                follow = [url for _, url in links if url and self.is_valid_link(url)]
+            for normalized_url in follow:
+                priority = self.frontier.priority(normalized_url) if self.frontier is not None else 0
+                if self.near_duplicates is not None:
+                    action = self.near_duplicates.link_action(normalized_url, from_duplicate=bool(duplicate_of))
+                    if action == SKIP:
+                        self.crawler.stats.inc_value('near_duplicates/skipped_links')
+                        self.logger.debug(f"SKIPPED: {normalized_url} from {current_url} - Near-duplicate pattern")
+                        continue
+                    if action:
+                        self.crawler.stats.inc_value('near_duplicates/deprioritized_links')
+                        priority = self.near_duplicates.priority
                 yield scrapy.Request(
                     url=normalized_url,
                     callback=self.parse,
-                    meta=helpers.playwright_meta(normalized_url), # include pw in recursive crawls
+                    errback=self.errback,
+                    priority=priority,
+                    meta=helpers.fetch_meta(self), # include pw in recursive crawls
                 )
 
+    def record_canonical(self, url, href):
+        # the declared canonical URL resolves to this page's key, so it isn't fetched again
+        target = self.canonicalizer.alias(url, href)
+        if target:
+            self.crawler.stats.inc_value('canonical/aliases')
+            self.logger.debug(f"CANONICAL: {target} aliased to {url}")
+
+    def decode_jsonld(self, block):
+        try:
+            with self.metrics.timer('jsonld'):
+                return loads(block)
+        except json.JSONDecodeError:
+            self.logger.warning("Invalid JSON block skipped.")
+            return None
+
     def extract_target_data(self, obj, source_url):
         if '@type' not in obj:
             return
@@ -113,81 +177,80 @@ class SchemaSpider(scrapy.Spider):
         # extract ItemList and ListItems
         if "ItemList" in types and "itemListElement" in obj:
             self.logger.debug(f"PROCESSING ItemList with nested ListItems from {source_url}")
-            self.results.append({
-                'name': obj.get('name',''),
-                'url': obj.get('url',source_url),
+            yield {
+                'name': first_value(obj.get('name')),
+                'url': first_value(obj.get('url'), source_url),
                 'price': '',
                 'gtin': '',
                 'source': source_url,
                 'type': 'ItemList',
-            })
+            }
             for item in obj['itemListElement']:
                 if isinstance(item,dict):
                     item_type=item.get('@type','')
                     if item_type == 'ListItem':
-                        self.results.append({
-                            'name': item.get('name',''),
-                            'url': item.get('url',source_url),
+                        yield {
+                            'name': first_value(item.get('name')),
+                            'url': first_value(item.get('url'), source_url),
                             'price': '',
                             'gtin': '',
                             'source': source_url,
                             'type': 'ListItem',
-                        })
+                        }
             return
         # extract ProductGroup
         if "ProductGroup" in types:
             self.logger.debug(f"PROCESSING ProductGroup from {source_url}")
-            name = obj.get("name","")
-            url = obj.get("url",source_url)
+            name = first_value(obj.get("name"))
+            url = first_value(obj.get("url"), source_url)
             gtin = self.extract_gtin(obj)
             offer = obj.get("offers",{})
             if isinstance(offer,dict) and offer.get("itemCondition") == "https://schema.org/NewCondition":
-                self.results.append({
+                yield {
                     "name": name,
-                    "url": offer.get("url",url),
+                    "url": first_value(offer.get("url"), url),
                     "price": offer.get("price",''),
                     "gtin": gtin,
                     "source": source_url,
                     "type": "ProductGroup",
-                })
+                }
             # evaluate and process variants/Products
             for variant in obj.get("hasVariant", []):
                 if not isinstance(variant,dict):
                     continue
                 if variant.get("@type") != "Product":
                     continue
-                variant_name = variant.get("name", "")
+                variant_name = first_value(variant.get("name"))
                 variant_gtin = self.extract_gtin(variant)
                 variant_offer = variant.get("offers",{})
                 if isinstance(variant_offer,dict) and variant_offer.get("itemCondition") == "https://schema.org/NewCondition":
-                    self.results.append({
+                    yield {
                         "name": variant_name,
-                        "url": variant_offer.get("url",url),
+                        "url": first_value(variant_offer.get("url"), url),
                         "price": variant_offer.get("price",''),
                         "gtin": variant_gtin,
                         "source": source_url,
                         "type": "Product",
-                    })
+                    }
             return
         # prevent re-processing
         json_id = self.get_unique_id(obj)
-        if json_id in self.processed_json_ids:
+        if not self.processed_json_ids.add(json_id):
             return
-        self.processed_json_ids.add(json_id)
         # product/offer fallback handling
-        name = obj.get('name','')
-        url = obj.get('url', source_url)
+        name = first_value(obj.get('name'))
+        url = first_value(obj.get('url'), source_url)
         price = self.extract_price(obj)
         gtin = self.extract_gtin(obj)
         if name or gtin:
-            self.results.append({
+            yield {
                 'name': name,
                 'url': url,
                 'price': price,
                 'gtin': gtin,
                 'source': source_url,
                 'type': ','.join(types),
-            })
+            }
 
     def extract_price(self, obj):
         if 'offers' in obj:
@@ -203,59 +266,42 @@ class SchemaSpider(scrapy.Spider):
     def extract_gtin(self, obj):
         for field in GTIN_FIELDS:
             if field in obj:
-                return obj[field]
+                return first_value(obj[field])
         return ''
 
     def get_unique_id(self, obj):
         # uid gen for dup catalog
         parts = [
-            obj.get('name','').strip().lower(),
-            self.extract_gtin(obj) or '',
-            obj.get('url','').strip().lower(),
+            str(first_value(obj.get('name'))).strip().lower(),
+            str(self.extract_gtin(obj) or ''),
+            str(first_value(obj.get('url'))).strip().lower(),
         ]
         return '|'.join(parts)
 
     def is_valid_link(self, url):
-        parsed = urlparse(url)
-        if parsed.scheme not in ('http','https'):
+        if self.url_filter.check(url):
             return False
-        base_domain = parsed.netloc.replace('www.','')
-        if not any(base_domain.endswith(allowed) for allowed in self.allowed_domains):
-            return False
-        path = parsed.path.lower()
-        if any(path.endswith(ext) for ext in helpers.NON_HTML_EXTENSIONS):
-            return False
-        url_lower = url.lower()
-        if self.include and not any(s in url_lower for s in self.include):
-            return False
-        if self.exclude and any(s in url_lower for s in self.exclude):
-            return False
-        if url in self.visited_urls:
+        if self.canonicalizer.key(url) in self.visited_urls:
             return False
         return True
 
-    def spider_closed(self, reason):
-        if not self.results:
-            self.logger.info("No schema data extracted.")
-            return
-        headers = ['name','url','price','gtin','source','type']
-        table_data = [[
-            r.get('name',''),
-            r.get('url',''),
-            r.get('price',''),
-            r.get('gtin',''),
-            r.get('source',''),
-            r.get('type',''),
-        ] for r in self.results]
-        auto_view = self.settings.getbool('AUTO_VIEW',False)
-        auto_save = self.settings.getbool('AUTO_SAVE',False)
-        output_filename = self.settings.get('OUTPUT_FILENAME')
-        helpers.data_handling_options(
-            table_data,
-            headers,
-            auto_view=auto_view,
-            auto_save=auto_save,
-            output_filename=output_filename,
-            seed_url=self.start_urls[0] if self.start_urls else None,
-            spider_name=self.name,
-        )
+    async def errback(self, failure):
+        """Log failed requests and release any playwright page left open by the download."""
+        self.logger.error(f"FAILED: {failure.request.url} - {failure.value!r}")
+        await PlaywrightPagePool.from_crawler(self.crawler).release(failure.request.meta)
+
+    def closed(self, reason):
+        self.crawler.stats.set_value('schema/jsonld_cache_hits', self.structured_data.cache_hits)
+        if self.frontier is not None:
+            summary = self.frontier.summary()
+            for key, value in summary.items():
+                self.crawler.stats.set_value(f'frontier/{key}', value)
+            top = ', '.join(f"{pattern} {hits}/{pages}" for pattern, pages, hits in self.frontier.top_patterns())
+            self.logger.info(f"FRONTIER: {summary['hit_pages']} of {summary['pages']} pages yielded target types; top patterns: {top or 'none'}")
+        if self.near_duplicates is not None:
+            summary = self.near_duplicates.summary()
+            for key, value in summary.items():
+                self.crawler.stats.set_value(f'near_duplicates/{key}', value)
+            self.logger.info(f"NEAR-DUPLICATES: {summary['duplicates']} of {summary['pages']} pages in {summary['clusters']} clusters, {summary['flagged_patterns']} URL patterns flagged")
+        self.visited_urls.close()
+        self.processed_json_ids.close()
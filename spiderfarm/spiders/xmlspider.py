@@ -1,51 +1,83 @@
 # -*- coding: utf-8 -*-
 # spiderfarm/spiderfarm/spiders/xmlspider.py
 import scrapy
-from scrapy import signals
-import helpers
+from scrapy.settings.default_settings import DOWNLOAD_HANDLERS_BASE
+from spiderfarm import sitemaps
+from spiderfarm.seenstore import FingerprintSeenStore, open_seen_store
+from spiderfarm.canonical import UrlCanonicalizer
 
 class XMLSpider(scrapy.Spider):
     name = 'xmlspider'
-    handle_httpstatus_list = [301, 302, 403, 404, 429]
+    handle_httpstatus_list = [301, 302, 403, 404, 405, 429, 501]
+    output_fields = ['url', 'status']
+    # sitemap shards and listed URLs are requested as listed; the dupefilter keeps Scrapy's fingerprints
+    canonical_dedup = False
+    # status checks never need a browser; use Scrapy's plain HTTP handlers instead of scrapy-playwright
+    custom_settings = {
+        'DOWNLOAD_HANDLERS': {
+            'http': DOWNLOAD_HANDLERS_BASE['http'],
+            'https': DOWNLOAD_HANDLERS_BASE['https'],
+        },
+    }
 
     def __init__(self, start_urls=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.start_urls = [start_urls] if isinstance(start_urls, str) else (start_urls or [])
-        self.scraped_data = []
-        self.url_seen = set()
+        self.url_seen = FingerprintSeenStore() # replaced by the configured SEEN_STORE in from_crawler
+        self.status_method = 'HEAD'
+
+    @classmethod
+    def update_settings(cls, settings):
+        super().update_settings(settings)
+        # the status lane gets its own concurrency budget instead of the project-wide crawl limits
+        concurrency = settings.getint('STATUS_CHECK_CONCURRENCY', 16)
+        delay = settings.getfloat('STATUS_CHECK_DELAY', 0)
+        settings.set('CONCURRENT_REQUESTS', max(concurrency, settings.getint('CONCURRENT_REQUESTS')), priority='spider')
+        settings.set('CONCURRENT_REQUESTS_PER_DOMAIN', concurrency, priority='spider')
+        settings.set('DOWNLOAD_DELAY', delay, priority='spider')
+        settings.set('AUTOTHROTTLE_START_DELAY', delay, priority='spider')
+        settings.set('AUTOTHROTTLE_TARGET_CONCURRENCY', float(concurrency), priority='spider')
 
     @classmethod
     def from_crawler(cls, crawler, *args, **kwargs):
         spider = super().from_crawler(crawler, *args, **kwargs)
-        crawler.signals.connect(spider.spider_closed, signals.spider_closed)
+        spider.url_seen = open_seen_store(crawler, f'{spider.name}_url_seen')
+        spider.canonicalizer = UrlCanonicalizer.from_crawler(crawler)
+        spider.status_method = crawler.settings.get('STATUS_CHECK_METHOD', 'HEAD').upper()
         return spider
 
     def parse(self, response):
-        urls = response.xpath('//*[local-name()="url"]/*[local-name()="loc"]/text()').getall()
+        """
+        Stream <loc> entries out of a sitemap (plain or .xml.gz) as they are parsed.
+        Sitemap indexes are followed recursively; page URLs are queued for status checks immediately.
+        """
         count = 0
-        for loc in urls:
-            loc = helpers.validate_and_normalize_url(loc)
-            if loc and loc not in self.url_seen:
-                self.url_seen.add(loc)
-                yield scrapy.Request(loc, callback=self.parse_status, headers={'Referer': response.url})
+        sitemap_count = 0
+        for kind, loc, _ in sitemaps.iter_sitemap(response.body):
+            # listed URLs are checked as listed: query strings kept, only scheme/host case and fragments normalized
+            loc = self.canonicalizer.canonicalize(loc, keep_query=True)
+            if not loc:
+                continue
+            if kind == 'sitemap':
+                sitemap_count += 1
+                yield scrapy.Request(loc, callback=self.parse, headers={'Referer': response.url}, meta={'sitemap': True})
+            elif self.url_seen.add(loc):
+                yield scrapy.Request(
+                    loc,
+                    method=self.status_method,
+                    callback=self.parse_status,
+                    headers={'Referer': response.url},
+                    meta={'status_check': True, 'dont_cache': True}, # see StatusCheckMiddleware
+                    )
                 count+=1
+                if count % 250 == 0:
+                    self.logger.info("DISCOVERED %d <url> nodes so far in %s", count, response.url)
+        if sitemap_count:
+            self.logger.info("DISCOVERED %d <sitemap> nodes in %s", sitemap_count, response.url)
         self.logger.info("DISCOVERED %d <url> nodes...",count)
 
     def parse_status(self, response):
-        self.scraped_data.append({'url': response.url, 'status': response.status})
+        yield {'url': response.url, 'status': response.status}
 
-    def spider_closed(self, spider):
-        if not self.scraped_data:
-            self.logger.info("No data scraped.")
-            return
-        headers = ['url', 'status']
-        table_data = [[r['url'], r['status']] for r in self.scraped_data]
-        helpers.data_handling_options(
-            table_data,
-            headers,
-            auto_view=self.settings.getbool('AUTO_VIEW', False),
-            auto_save=self.settings.getbool('AUTO_SAVE', False),
-            output_filename=self.settings.get('OUTPUT_FILENAME'),
-            seed_url=self.start_urls[0] if self.start_urls else None,
-            spider_name=self.name,
-        )
\ No newline at end of file
+    def closed(self, reason):
+        self.url_seen.close()
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+# spiderfarm/structured.py
+import json
+import re
+from collections import OrderedDict
+from hashlib import blake2b
+
+from lxml import etree
+
+try:
+    import orjson
+except ImportError:  # optional, stdlib json is used without it
+    orjson = None
+
+# syntaxes reported with each extracted node
+JSONLD = 'json-ld'
+MICRODATA = 'microdata'
+RDFA = 'rdfa'
+
+# every structured data carrier on the page, in document order, from one pass over the tree
+NODES_XPATH = etree.XPath(
+    '//script[@type="application/ld+json"] | //*[@itemscope or @itemprop or @typeof or @property]'
+)
+
+# (scope attribute, type attribute, property attribute) per DOM syntax
+SCOPE_ATTRS = {
+    MICRODATA: ('itemscope', 'itemtype', 'itemprop'),
+    RDFA: ('typeof', 'typeof', 'property'),
+}
+
+# attribute holding a property's value, by tag (otherwise the element's text)
+VALUE_ATTRS = {
+    'a': 'href', 'area': 'href', 'link': 'href',
+    'audio': 'src', 'embed': 'src', 'iframe': 'src', 'img': 'src', 'source': 'src', 'track': 'src', 'video': 'src',
+    'object': 'data', 'data': 'value', 'meter': 'value', 'time': 'datetime',
+}
+
+SEPARATORS = re.compile(r'[/#:]')
+
+# extracted only at the top level (or in @graph); nested, they belong to their parent (breadcrumb items, event offers)
+TOP_LEVEL_TYPES = frozenset({'Offer', 'ListItem'})
+
+
+def loads(block):
+    """Decode a JSON-LD block with orjson when installed, else the stdlib; raises json.JSONDecodeError."""
+    if orjson is None:
+        return json.loads(block)
+    try:
+        return orjson.loads(block)
+    except orjson.JSONDecodeError:
+        # orjson is stricter (NaN, big integers); let the stdlib decide
+        return json.loads(block)
+
+
+def local_names(value):
+    """Space-separated types or properties without their vocabulary (https://schema.org/Product, schema:Product -> Product)."""
+    return [name for name in (SEPARATORS.split(token)[-1] for token in (value or '').split()) if name]
+
+
+def add_property(node, names, value):
+    # repeated properties become lists, as they would be written in JSON-LD
+    for name in names:
+        current = node.get(name)
+        if current is None:
+            node[name] = value
+        elif isinstance(current, list):
+            current.append(value)
+        else:
+            node[name] = [current, value]
+
+
+def first_value(value, default=''):
+    """A property value as one scalar: the first string or number of a repeated (list) value, else default."""
+    if isinstance(value, list):
+        value = next((v for v in value if isinstance(v, (str, int, float))), default)
+    return value if isinstance(value, (str, int, float)) else default
+
+
+def element_value(el, syntax):
+    attrib = el.attrib
+    if 'content' in attrib:
+        return attrib['content'].strip()
+    if syntax == RDFA:
+        for attr in ('resource', 'href', 'src'):
+            if attr in attrib:
+                return attrib[attr].strip()
+    attr = VALUE_ATTRS.get(el.tag)
+    if attr and attr in attrib:
+        return attrib[attr].strip()
+    return ' '.join(''.join(el.itertext()).split())
+
+
+class StructuredDataExtractor:
+    """
+    Single-pass Schema.org extraction covering JSON-LD, Microdata and RDFa.
+    One precompiled XPath returns the ld+json scripts and every itemscope/itemprop and
+    typeof/property element in document order; each DOM node is attached to its nearest
+    enclosing scope, so the document is only walked once whatever the mix of syntaxes.
+    - Microdata and RDFa items are normalized into JSON-LD shaped dicts ('@type' plus properties,
+      nested items as dicts, repeated properties as lists)
+    - @graph containers and nested nodes are searched for nodes of a target type; target nodes are
+      emitted whole, so their offers and variants stay attached to them
+    - JSON-LD blocks are decoded through `decode`, which returns None for blocks to skip
+    - sitewide blocks (Organization, WebSite, BreadcrumbList...) repeat on every page: blocks that
+      held no target node are remembered by a hash of their raw text in a bounded LRU
+      (JSONLD_CACHE_SIZE) and skipped without decoding on later pages
+    """
+    def __init__(self, target_types, decode=loads, cache_size=10_000):
+        self.target_types = frozenset(target_types)
+        self.nested_types = self.target_types - TOP_LEVEL_TYPES
+        self.decode = decode
+        self.cache_size = cache_size
+        self.skipped_blocks = OrderedDict()
+        self.cache_hits = 0
+
+    @classmethod
+    def from_spider(cls, spider, target_types, settings=None):
+        settings = settings or spider.settings
+        return cls(
+            target_types,
+            decode=spider.decode_jsonld,
+            cache_size=settings.getint('JSONLD_CACHE_SIZE', 10_000),
+        )
+
+    def extract(self, response):
+        """Return (syntax, node) pairs for every target-typed node on the page."""
+        blocks = []
+        roots = {MICRODATA: [], RDFA: []}
+        scopes = {MICRODATA: {}, RDFA: {}}
+        for el in NODES_XPATH(response.selector.root):
+            if el.tag == 'script':
+                blocks.append(el.text or '')
+                continue
+            for syntax, (scope_attr, type_attr, prop_attr) in SCOPE_ATTRS.items():
+                if scope_attr in el.attrib or prop_attr in el.attrib:
+                    self.add_node(el, syntax, scope_attr, type_attr, prop_attr, scopes[syntax], roots[syntax])
+        nodes = []
+        for block in blocks:
+            nodes.extend((JSONLD, node) for node in self.jsonld_nodes(block))
+        for syntax, items in roots.items():
+            for item in items:
+                nodes.extend((syntax, node) for node in self.target_nodes(item))
+        return nodes
+
+    def jsonld_nodes(self, block):
+        if not self.cache_size:
+            data = self.decode(block)
+            return list(self.target_nodes(data)) if data is not None else []
+        key = blake2b(block.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        if key in self.skipped_blocks:
+            self.skipped_blocks.move_to_end(key)
+            self.cache_hits += 1
+            return []
+        data = self.decode(block)
+        nodes = list(self.target_nodes(data)) if data is not None else []
+        if not nodes:
+            # nothing to extract (or undecodable): skip this exact block from now on
+            self.skipped_blocks[key] = None
+            if len(self.skipped_blocks) > self.cache_size:
+                self.skipped_blocks.popitem(last=False)
+        return nodes
+
+    def add_node(self, el, syntax, scope_attr, type_attr, prop_attr, scopes, roots):
+        parent = self.nearest_scope(el, scopes) if scopes else None
+        names = local_names(el.attrib.get(prop_attr))
+        if scope_attr in el.attrib:
+            value = {}
+            types = local_names(el.attrib.get(type_attr))
+            if types:
+                value['@type'] = types[0] if len(types) == 1 else types
+            scopes[el] = value
+            if parent is None or not names:
+                roots.append(value)
+                return
+        elif parent is None or not names:
+            # a property outside any item (e.g. og: meta tags)
+            return
+        else:
+            value = element_value(el, syntax)
+        add_property(parent, names, value)
+
+    @staticmethod
+    def nearest_scope(el, scopes):
+        parent = el.getparent()
+        while parent is not None:
+            node = scopes.get(parent)
+            if node is not None:
+                return node
+            parent = parent.getparent()
+        return None
+
+    @staticmethod
+    def is_target(types, target_types):
+        if isinstance(types, str):
+            return types in target_types
+        if isinstance(types, list):
+            return any(isinstance(t, str) and t in target_types for t in types)
+        return False
+
+    def target_nodes(self, data, nested=False):
+        """Yield target-typed nodes from decoded JSON-LD or a normalized item, including @graph and nested nodes."""
+        if isinstance(data, list):
+            for entry in data:
+                yield from self.target_nodes(entry, nested)
+        elif isinstance(data, dict):
+            if self.is_target(data.get('@type'), self.nested_types if nested else self.target_types):
+                yield data
+                return
+            for key, value in data.items():
+                if isinstance(value, (dict, list)):
+                    yield from self.target_nodes(value, nested or key != '@graph')
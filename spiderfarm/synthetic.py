@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+# spiderfarm/synthetic.py
+import gzip
+import json
+import threading
+import zlib
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILLER = (
+    "Synthetic catalogue copy used to give every page a realistic amount of visible text. "
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt. "
+)
+
+
+class SyntheticSite:
+    """
+    Deterministic synthetic site for offline benchmarks.
+    - /p/<n>: product pages with `fanout` links into the site, `nav` repeated nav/footer links
+      and a JSON-LD payload rotating between Product, ProductGroup (with variants) and ItemList
+    - /sitemap.xml: sitemap index over shards of `shard_size` URLs (/sitemaps/<k>.xml, or .xml.gz with gzip_sitemaps)
+    - /feed.xml, /feed.xml.gz: Merchant (g: namespace) feed with `feed_items` items, generated while
+      streaming so multi-GB feeds need no disk or memory on the server side
+    """
+    def __init__(self, pages=1000, fanout=20, nav=40, page_kb=20, shard_size=1000, gzip_sitemaps=True, feed_items=50_000):
+        self.pages = max(1, pages)
+        self.fanout = fanout
+        self.nav = min(nav, self.pages)
+        self.page_kb = page_kb
+        self.shard_size = max(1, shard_size)
+        self.gzip_sitemaps = gzip_sitemaps
+        self.feed_items = feed_items
+        self.base_url = None
+
+    def config(self):
+        return {
+            'pages': self.pages,
+            'fanout': self.fanout,
+            'nav': self.nav,
+            'page_kb': self.page_kb,
+            'shard_size': self.shard_size,
+            'gzip_sitemaps': self.gzip_sitemaps,
+            'feed_items': self.feed_items,
+        }
+
+    # pages
+    def links(self, n):
+        # deterministic pseudo-random fan-out plus the next page, so every page is reachable
+        targets = [(n + 1) % self.pages]
+        targets.extend((n * 7919 + k * 104729 + 1) % self.pages for k in range(self.fanout - 1))
+        return targets
+
+    def jsonld(self, n):
+        url = f"{self.base_url}/p/{n}"
+        kind = n % 3
+        if kind == 0:
+            return {
+                "@context": "https://schema.org", "@type": "Product", "name": f"Product {n}", "url": url,
+                "gtin13": f"{n:013d}", "offers": {"@type": "Offer", "price": f"{n % 500}.99", "priceCurrency": "USD"},
+            }
+        if kind == 1:
+            return {
+                "@context": "https://schema.org", "@type": "ProductGroup", "name": f"Group {n}", "url": url,
+                "hasVariant": [
+                    {"@type": "Product", "name": f"Variant {n}-{v}", "url": f"{url}?v={v}", "gtin13": f"{n * 10 + v:013d}",
+                     "offers": {"@type": "Offer", "price": f"{v}9.99"}}
+                    for v in range(3)
+                ],
+            }
+        return {
+            "@context": "https://schema.org", "@type": "ItemList", "name": f"List {n}", "url": url,
+            "itemListElement": [
+                {"@type": "ListItem", "position": i + 1, "url": f"{self.base_url}/p/{t}", "name": f"Product {t}"}
+                for i, t in enumerate(self.links(n)[:10])
+            ],
+        }
+
+    @lru_cache(maxsize=1)
+    def filler(self):
+        return (FILLER * (self.page_kb * 1024 // len(FILLER) + 1))[:self.page_kb * 1024]
+
+    def page(self, n):
+        nav = ''.join(f'<a href="/p/{t}">Nav {t}</a>' for t in range(self.nav))
+        links = ''.join(f'<li><a href="/p/{t}">Product {t}</a></li>' for t in self.links(n))
+        return (
+            f'<!DOCTYPE html><html><head><title>Product {n}</title>'
+            f'<meta name="description" content="Synthetic product page {n}">'
+            f'<link rel="canonical" href="{self.base_url}/p/{n}">'
+            f'<script type="application/ld+json">{json.dumps(self.jsonld(n))}</script></head>'
+            f'<body><nav>{nav}</nav><div class="content"><h1>Product {n}</h1><p>{self.filler()}</p>'
+            f'<ul>{links}</ul></div><footer>{nav}</footer></body></html>'
+        ).encode('utf-8')
+
+    # sitemaps
+    def shard_count(self):
+        return (self.pages + self.shard_size - 1) // self.shard_size
+
+    def sitemap_index(self):
+        ext = '.xml.gz' if self.gzip_sitemaps else '.xml'
+        entries = ''.join(
+            f'<sitemap><loc>{self.base_url}/sitemaps/{k}{ext}</loc></sitemap>' for k in range(self.shard_count())
+        )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</sitemapindex>'
+        ).encode('utf-8')
+
+    @lru_cache(maxsize=64)
+    def sitemap_shard(self, k, gzipped):
+        start = k * self.shard_size
+        entries = ''.join(
+            f'<url><loc>{self.base_url}/p/{n}</loc><lastmod>2024-01-01</lastmod></url>'
+            for n in range(start, min(start + self.shard_size, self.pages))
+        )
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>'
+        ).encode('utf-8')
+        return gzip.compress(body, compresslevel=5) if gzipped else body
+
+    # feeds
+    def feed_parts(self):
+        head = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0"><channel><title>Synthetic feed</title>'
+        ).encode('utf-8')
+        tail = b'</channel></rss>'
+        return head, tail
+
+    def feed_item(self, n):
+        # fixed-width fields keep every item the same size, so the plain feed has an exact Content-Length
+        return (
+            f'<item><g:id>{n:010d}</g:id><title>Synthetic product {n:010d}</title>'
+            f'<link>{self.base_url}/p/{n % self.pages:010d}</link>'
+            f'<g:price>{n % 100000:08d} USD</g:price><g:availability>in_stock</g:availability>'
+            f'<g:gtin>{n:013d}</g:gtin><g:brand>Spiderfarm</g:brand><g:mpn>SF-{n:010d}</g:mpn>'
+            f'<g:image_link>{self.base_url}/img/{n:010d}.jpg</g:image_link>'
+            f'<g:additional_image_link>{self.base_url}/img/{n:010d}-2.jpg</g:additional_image_link>'
+            f'<description>{FILLER}</description></item>'
+        ).encode('utf-8')
+
+    def feed_length(self):
+        head, tail = self.feed_parts()
+        return len(head) + len(tail) + self.feed_items * len(self.feed_item(0))
+
+    def iter_feed(self, batch=1000):
+        head, tail = self.feed_parts()
+        yield head
+        for start in range(0, self.feed_items, batch):
+            yield b''.join(self.feed_item(n) for n in range(start, min(start + batch, self.feed_items)))
+        yield tail
+
+    def iter_feed_gz(self):
+        compressor = zlib.compressobj(5, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in self.iter_feed():
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class SyntheticHandler(BaseHTTPRequestHandler):
+    site = None
+
+    def do_HEAD(self):
+        self.handle_request(head=True)
+
+    def do_GET(self):
+        self.handle_request(head=False)
+
+    def handle_request(self, head):
+        site = self.site
+        path = self.path.split('?', 1)[0]
+        if path.startswith('/p/'):
+            try:
+                n = int(path[3:])
+            except ValueError:
+                n = -1
+            if not 0 <= n < site.pages:
+                return self.send_body(404, b'not found', 'text/plain', head)
+            return self.send_body(200, site.page(n), 'text/html; charset=utf-8', head)
+        if path == '/sitemap.xml':
+            return self.send_body(200, site.sitemap_index(), 'application/xml', head)
+        if path.startswith('/sitemaps/'):
+            name = path[len('/sitemaps/'):]
+            gzipped = name.endswith('.gz')
+            try:
+                k = int(name.split('.', 1)[0])
+            except ValueError:
+                k = -1
+            if not 0 <= k < site.shard_count():
+                return self.send_body(404, b'not found', 'text/plain', head)
+            content_type = 'application/gzip' if gzipped else 'application/xml'
+            return self.send_body(200, site.sitemap_shard(k, gzipped), content_type, head)
+        if path == '/feed.xml':
+            return self.send_stream(site.iter_feed(), 'application/xml', head, length=site.feed_length())
+        if path == '/feed.xml.gz':
+            return self.send_stream(site.iter_feed_gz(), 'application/gzip', head)
+        return self.send_body(404, b'not found', 'text/plain', head)
+
+    def send_body(self, status, body, content_type, head):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def send_stream(self, chunks, content_type, head, length=None):
+        # without a length the body runs until the connection closes (HTTP/1.0)
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        if length is not None:
+            self.send_header('Content-Length', str(length))
+        self.end_headers()
+        if head:
+            return
+        try:
+            for chunk in chunks:
+                self.wfile.write(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(site, host='127.0.0.1', port=0):
+    """Start the synthetic site on a background thread; returns the server (base URL in site.base_url)."""
+    handler = type('Handler', (SyntheticHandler,), {'site': site})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    site.base_url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
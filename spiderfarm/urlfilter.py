@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# spiderfarm/urlfilter.py
+import re
+from urllib.parse import urlsplit
+
+import helpers
+
+# skip reasons returned by UrlFilter.check
+INVALID = 'invalid'
+NOT_INCLUDED = 'not_included'
+EXCLUDED = 'excluded'
+NON_HTML = 'non_html'
+OUT_OF_SCOPE = 'out_of_scope'
+
+
+def compile_patterns(substrings=(), patterns=()):
+    """
+    One case-insensitive regex matching any of the literal substrings or regex patterns,
+    so a link is tested in a single scan instead of one `in` check per filter value.
+    """
+    parts = [re.escape(s) for s in sorted(set(filter(None, substrings)), key=len, reverse=True)]
+    parts.extend(f"(?:{p})" for p in patterns if p)
+    if not parts:
+        return None
+    return re.compile('|'.join(parts), re.IGNORECASE)
+
+
+class UrlFilter:
+    """
+    Compiled link filter, built once per spider and shared by LinkSpider and SchemaSpider.
+    - include/exclude: comma-separated CLI substrings plus optional regex rules
+      (URL_FILTER_INCLUDE_PATTERNS / URL_FILTER_EXCLUDE_PATTERNS), compiled into one matcher each
+    - non-HTML resources: extension of the last path segment looked up in a set
+    - scope: the host and its parent domains looked up in a set of allowed domains (subdomains are in scope)
+    check(url) parses the URL once and returns a skip reason, or None when the link should be followed.
+    """
+    def __init__(self, allowed_domains=(), include=(), exclude=(), include_patterns=(), exclude_patterns=(),
+                 extensions=helpers.NON_HTML_EXTENSIONS):
+        # allowed domains may carry a port (seed netloc); scope is checked on the bare host
+        self.domains = frozenset(self.strip_www(urlsplit(f"//{d}").hostname or '') for d in allowed_domains if d)
+        self.include = compile_patterns(include, include_patterns)
+        self.exclude = compile_patterns(exclude, exclude_patterns)
+        self.extensions = frozenset(ext.lower() for ext in extensions)
+
+    @classmethod
+    def from_spider(cls, spider, settings=None):
+        settings = settings or spider.settings
+        return cls(
+            allowed_domains=getattr(spider, 'allowed_domains', None) or (),
+            include=spider.include,
+            exclude=spider.exclude,
+            include_patterns=settings.getlist('URL_FILTER_INCLUDE_PATTERNS'),
+            exclude_patterns=settings.getlist('URL_FILTER_EXCLUDE_PATTERNS'),
+        )
+
+    @staticmethod
+    def strip_www(host):
+        return host[4:] if host.startswith('www.') else host
+
+    def check(self, url):
+        if self.include is not None and not self.include.search(url):
+            return NOT_INCLUDED
+        if self.exclude is not None and self.exclude.search(url):
+            return EXCLUDED
+        try:
+            parts = urlsplit(url)
+        except ValueError:
+            return INVALID
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            return INVALID
+        if self.is_non_html(parts.path):
+            return NON_HTML
+        if not self.in_scope(parts.hostname or ''):
+            return OUT_OF_SCOPE
+        return None
+
+    def is_non_html(self, path):
+        dot = path.rfind('.')
+        if dot == -1 or dot < path.rfind('/'):
+            return False
+        return path[dot:].lower() in self.extensions
+
+    def in_scope(self, host):
+        if not self.domains:
+            return True
+        host = self.strip_www(host)
+        # walk the parent domains: shop.example.com -> example.com -> com
+        while host:
+            if host in self.domains:
+                return True
+            dot = host.find('.')
+            if dot == -1:
+                return False
+            host = host[dot + 1:]
+        return False
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+# spiderfarm/viewer.py
+import csv
+import io
+import shutil
+import sys
+from array import array
+from itertools import islice
+
+# rows sampled to size the columns, and the widest a column may get before cells are truncated
+SAMPLE_ROWS = 200
+MAX_COLUMN_WIDTH = 60
+
+HELP = "[Enter] next  [p] previous  [g N] go to row  [/text] filter  [/] clear filter  [q] quit"
+
+
+class CsvRowSource:
+    """
+    Lazy random access to the rows of a CSV file.
+    The file is only read as far as the requested page; the byte offset of every `stride`-th row
+    is kept as it is scanned, so going back or jumping to a scanned row costs a seek plus at most
+    `stride` row reads, and memory stays at one integer per `stride` rows.
+    """
+    def __init__(self, file_path, stride=1000):
+        self.file = open(file_path, 'rb')
+        self.headers = self.read_record() or []
+        self.stride = stride
+        self.checkpoints = array('q', [self.file.tell()])
+        self.total = None  # known once the whole file has been scanned
+
+    def read_record(self, parse=True):
+        # a record ends at a line break outside quotes; quoted fields may span lines
+        line = self.file.readline()
+        if not line:
+            return None
+        while line.count(b'"') % 2:
+            more = self.file.readline()
+            if not more:
+                break
+            line += more
+        if not parse:
+            return line
+        return next(csv.reader(io.StringIO(line.decode('utf-8'))), [])
+
+    def scan(self, start=0):
+        """Yield (index, offset, row) for every row from `start` on."""
+        k = min(start // self.stride, len(self.checkpoints) - 1)
+        self.file.seek(self.checkpoints[k])
+        index = k * self.stride
+        while True:
+            offset = self.file.tell()
+            if index % self.stride == 0 and index // self.stride == len(self.checkpoints):
+                self.checkpoints.append(offset)
+            # rows before `start` are only skipped over, not parsed
+            row = self.read_record(parse=index >= start)
+            if row is None:
+                self.total = index
+                return
+            if index >= start:
+                yield index, offset, row
+            index += 1
+
+    def row_at(self, offset):
+        self.file.seek(offset)
+        return self.read_record()
+
+    def page(self, start, count):
+        return [(index, row) for index, _, row in islice(self.scan(start), count)]
+
+    def close(self):
+        self.file.close()
+
+
+class FilteredRows:
+    """
+    Rows of a CsvRowSource containing `text` (case-insensitive, any column).
+    Matches are found incrementally, only as far as the requested page, and kept as byte offsets.
+    """
+    def __init__(self, source, text):
+        self.source = source
+        self.text = text.lower()
+        self.indexes = array('q')
+        self.offsets = array('q')
+        self.next_index = 0
+        self.done = False
+
+    @property
+    def total(self):
+        return len(self.offsets) if self.done else None
+
+    def fill(self, count):
+        if self.done or len(self.offsets) >= count:
+            return
+        for index, offset, row in self.source.scan(self.next_index):
+            self.next_index = index + 1
+            if self.text in '\x1f'.join(row).lower():
+                self.indexes.append(index)
+                self.offsets.append(offset)
+                if len(self.offsets) >= count:
+                    return
+        self.done = True
+
+    def page(self, start, count):
+        self.fill(start + count)
+        return [
+            (self.indexes[i], self.source.row_at(self.offsets[i]))
+            for i in range(start, min(start + count, len(self.offsets)))
+        ]
+
+
+class TableViewer:
+    """
+    Paginated terminal view of a CSV result file, rendered a page at a time.
+    Column widths come from the headers and a sample of the first rows (capped at MAX_COLUMN_WIDTH,
+    longer cells are truncated), so no page depends on the size of the whole table.
+    - stream(): print every row once, page by page (--auto view)
+    - interact(): browse with next/previous, jump to a row and filter (report menu)
+    """
+    def __init__(self, source, row_count=None, page_size=None, sample_size=SAMPLE_ROWS, max_width=MAX_COLUMN_WIDTH):
+        self.source = source
+        self.row_count = row_count
+        self.page_size = page_size or max(5, shutil.get_terminal_size().lines - 8)
+        sample = [row for _, row in source.page(0, sample_size)]
+        self.widths = [
+            min(max_width, max([len(h)] + [len(self.cell(row, i)) for row in sample]))
+            for i, h in enumerate(source.headers)
+        ]
+        self.index_width = len(str(row_count or source.total or len(sample) or 1))
+
+    @staticmethod
+    def cell(row, i):
+        return ' '.join(row[i].split()) if i < len(row) else ''
+
+    def border(self, left, middle, right):
+        return left + middle.join('─' * (w + 2) for w in [self.index_width] + self.widths) + right
+
+    def line(self, values):
+        cells = []
+        for value, width in zip(values, [self.index_width] + self.widths):
+            if len(value) > width:
+                value = value[:width - 1] + '…'
+            cells.append(f" {value.ljust(width)} ")
+        return '│' + '│'.join(cells) + '│'
+
+    def row_line(self, index, row):
+        return self.line([str(index + 1)] + [self.cell(row, i) for i in range(len(self.widths))])
+
+    def head(self):
+        return [self.border('┌', '┬', '┐'), self.line(['#'] + self.source.headers), self.border('├', '┼', '┤')]
+
+    def render(self, rows):
+        lines = self.head()
+        lines.extend(self.row_line(index, row) for index, row in rows)
+        lines.append(self.border('└', '┴', '┘'))
+        return '\n'.join(lines)
+
+    def stream(self, out=None):
+        out = out or sys.stdout
+        out.write('\n'.join(self.head()) + '\n')
+        # one forward scan, written a page at a time
+        rows = self.source.scan(0)
+        while True:
+            lines = [self.row_line(index, row) for index, _, row in islice(rows, self.page_size)]
+            if not lines:
+                break
+            out.write('\n'.join(lines) + '\n')
+        out.write(self.border('└', '┴', '┘') + '\n')
+
+    def interact(self):
+        view = self.source
+        position = 0
+        while True:
+            rows = view.page(position, self.page_size)
+            if sys.stdout.isatty():
+                print('\033[2J\033[H', end='')
+            print(self.render(rows))
+            print(self.status(view, position, len(rows)))
+            command = input(f"{HELP}\n> ").strip()
+            if command.lower() == 'q':
+                return
+            if command.lower() == 'p':
+                position = max(0, position - self.page_size)
+            elif command.lower().startswith('g'):
+                try:
+                    position = max(0, int(command[1:].strip()) - 1)
+                except ValueError:
+                    print("Invalid row number.")
+                    continue
+                if view is not self.source:
+                    # jumping is by row number in the full table
+                    view = self.source
+            elif command.startswith('/'):
+                text = command[1:].strip()
+                view = FilteredRows(self.source, text) if text else self.source
+                position = 0
+            elif len(rows) == self.page_size:
+                position += self.page_size
+
+    def status(self, view, position, shown):
+        if view is self.source:
+            total = self.row_count or self.source.total
+            scope = f"of {total}" if total is not None else "of ?"
+        else:
+            total = view.total
+            scope = f"of {total if total is not None else f'{len(view.offsets)}+'} matching '{view.text}'"
+        if not shown:
+            return f"No rows {scope}"
+        return f"Rows {position + 1}-{position + shown} {scope}"